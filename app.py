@@ -1,506 +1,928 @@
-import streamlit as st
-from datetime import datetime, time, timedelta, date
-from sqlalchemy import func 
-from sqlalchemy.exc import OperationalError, IntegrityError 
-# Importiamo SessionLocal e i modelli dal database
-from database import init_db, Prenotazione, SessionLocal 
-
-
-# --- 1. DATI STATICI DEL PROGETTO (Configurazione) ---
-
-# Definisci i barbieri e gli ID (ID 1 e 2 devono corrispondere a database.py)
-BARBIERI = {
-    1: "Salvatore",
-    2: "Raffaele"
-}
-
-# Definisci i servizi e la loro durata in minuti
-SERVIZI = {
-    "Taglio Uomo": 30,
-    "Barba": 15,
-    "Taglio + Barba": 45 
-}
-
-# Orari di apertura definitivi del barbiere
-ORARI_APERTURA = [
-    (time(8, 30), time(12, 30)),  # Mattina
-    (time(15, 0), time(19, 30))   # Pomeriggio
-]
-SLOT_CADENZA = timedelta(minutes=30)
-# 0=Lunedì, 6=Domenica. Si lavora da Martedì (2) a Sabato (5). Domenica (6) e Lunedì (0) chiusi.
-GIORNI_CHIUSURA = [0, 6] 
-
-# --- 2. LOGICA DI SCHEDULAZIONE (Motore di calcolo disponibilità) ---
-
-def get_orari_disponibili(data_selezionata: date, durata_servizio_min: int, prenotazioni_esistenti: list) -> list:
-    """
-    Calcola gli orari di inizio disponibili per una data e durata specificate.
-    """
-    disponibilita = []
-    durata_servizio = timedelta(minutes=durata_servizio_min)
-    
-    for start_time, end_time in ORARI_APERTURA:
-        current_time = datetime.combine(data_selezionata, start_time)
-        end_boundary = datetime.combine(data_selezionata, end_time)
-
-        while current_time < end_boundary:
-            
-            fine_prenotazione = current_time + durata_servizio
-            
-            if fine_prenotazione > end_boundary:
-                current_time += SLOT_CADENZA
-                continue
-
-            slot_libero = True
-            for p in prenotazioni_esistenti:
-                start_esistente = p['start']
-                end_esistente = p['end']
-
-                if current_time < end_esistente and fine_prenotazione > start_esistente:
-                    slot_libero = False
-                    break 
-
-            if slot_libero:
-                disponibilita.append(current_time)
-
-            current_time += SLOT_CADENZA
-
-    return disponibilita
-
-# --- 3. FUNZIONE DI ACCESSO AL DATABASE (DB) E MESSAGGISTICA ---
-
-def fetch_prenotazioni_per_barbiere(barbiere_id, data_selezionata: date):
-    """
-    Recupera le prenotazioni REALI dal database, filtrando sulla data.
-    """
-    db = SessionLocal()
-    
-    try:
-        # Usa func.date() supportata da SQLite per filtrare correttamente
-        prenotazioni_records = db.query(Prenotazione).filter(
-            Prenotazione.barbiere_id == barbiere_id,
-            func.date(Prenotazione.data_appuntamento) == data_selezionata.isoformat()
-        ).order_by(Prenotazione.ora_inizio).all() 
-    except OperationalError as e:
-        # In caso di errore di lettura all'inizio, restituisce una lista vuota.
-        return []
-
-    db.close()
-    
-    risultati_formattati = []
-    for p in prenotazioni_records:
-        risultati_formattati.append({
-            'id': p.id, 
-            'start': p.ora_inizio,
-            'end': p.ora_fine,
-            'cliente_nome': p.cliente_nome,
-            'servizio': p.servizio
-        })
-        
-    return risultati_formattati
-
-def delete_appointment(prenotazione_id):
-    """Elimina una prenotazione dal database dato l'ID."""
-    db = SessionLocal()
-    appointment = db.query(Prenotazione).filter(Prenotazione.id == prenotazione_id).first()
-    if appointment:
-        db.delete(appointment)
-        db.commit()
-        db.close()
-        return True
-    db.close()
-    return False
-
-def send_confirmation_message(telefono, dati_finali):
-    """
-    Funzione placeholder per l'invio di SMS/WhatsApp.
-    """
-    nome_cliente = dati_finali.get('cliente_nome', 'Cliente') 
-    st.toast(f"Tentativo di invio messaggio di conferma a {telefono}", icon='📱')
-    return True 
-
-# --- 4. INTERFACCIA DI GESTIONE (ADMIN PANEL) ---
-
-def display_calendar_view(barbiere_id, nome_barbiere, data_selezionata):
-    """Visualizza il calendario degli appuntamenti per un singolo barbiere, con opzione Elimina."""
-    st.markdown(f"**{nome_barbiere}**")
-
-    prenotazioni_del_giorno = fetch_prenotazioni_per_barbiere(barbiere_id, data_selezionata)
-    
-    if not prenotazioni_del_giorno:
-        st.info("Nessun appuntamento prenotato.")
-        
-    else:
-        st.markdown("##### Appuntamenti del Giorno:")
-        
-        col_ora, col_durata, col_cliente, col_azione = st.columns([1, 1, 2, 1])
-        col_ora.markdown("**Ora**")
-        col_durata.markdown("**Durata**")
-        col_cliente.markdown("**Cliente/Servizio**")
-        col_azione.markdown("**Elimina**")
-        st.markdown("---")
-
-
-        for p in prenotazioni_del_giorno:
-            prenotazione_id = p['id']
-            durata_min = int((p['end'] - p['start']).total_seconds() / 60) 
-            
-            col_ora, col_durata, col_cliente, col_azione = st.columns([1, 1, 2, 1])
-            
-            col_ora.write(p['start'].strftime("%H:%M"))
-            col_durata.write(f"{durata_min} min")
-            col_cliente.write(f"**{p['cliente_nome']}** - {p['servizio']}")
-            
-            with col_azione:
-                if st.button("❌", help="Elimina appuntamento", key=f"delete_{prenotazione_id}"):
-                    if delete_appointment(prenotazione_id):
-                        st.toast(f"Appuntamento di {p['cliente_nome']} eliminato.", icon='🗑️')
-                        st.rerun() 
-                    else:
-                        st.error("Errore nell'eliminazione dell'appuntamento.")
-    
-    st.markdown(f"**Aggiungi Appuntamento**")
-    with st.expander("Inserimento Manuale"):
-        with st.form(f"form_manuale_{barbiere_id}"):
-            service_names = list(SERVIZI.keys())
-            
-            col_time, col_service = st.columns(2)
-            with col_time:
-                ora_manuale = st.time_input("Ora di Inizio", time(8, 30), key=f"time_{barbiere_id}")
-            with col_service:
-                servizio_manuale = st.selectbox("Servizio", options=service_names, key=f"service_{barbiere_id}")
-            
-            nome_cli = st.text_input("Nome Cliente", key=f"name_{barbiere_id}")
-            tel_cli = st.text_input("Telefono Cliente", key=f"tel_{barbiere_id}")
-            
-            if st.form_submit_button("Salva Appuntamento Manuale"):
-                durata_man_min = SERVIZI[servizio_manuale]
-                
-                data_ora_inizio = datetime.combine(data_selezionata, ora_manuale)
-                data_ora_fine = data_ora_inizio + timedelta(minutes=durata_man_min)
-
-                if data_ora_inizio.date() != data_selezionata:
-                    st.error("Errore di data. Controlla l'ora.")
-                elif not nome_cli or not tel_cli:
-                    st.error("Nome e Telefono sono obbligatori.")
-                else:
-                    try:
-                        db = SessionLocal()
-                        nuova_prenotazione = Prenotazione(
-                            barbiere_id=barbiere_id,
-                            data_appuntamento=data_ora_inizio, 
-                            ora_inizio=data_ora_inizio,
-                            ora_fine=data_ora_fine,
-                            servizio=f"{servizio_manuale}",
-                            cliente_nome=nome_cli,
-                            cliente_telefono=tel_cli
-                        )
-                        db.add(nuova_prenotazione)
-                        db.commit()
-                        db.close()
-                        
-                        send_confirmation_message(tel_cli, {
-                            'cliente_nome': nome_cli, 
-                            'servizio': servizio_manuale, 
-                            'data': data_selezionata.strftime("%d/%m/%Y"), 
-                            'ora_inizio': ora_manuale.strftime("%H:%M"), 
-                            'barbiere_nome': nome_barbiere
-                        })
-                        
-                        st.success(f"Appuntamento salvato per {nome_barbiere} alle {ora_manuale.strftime('%H:%M')}!")
-                        st.rerun() 
-                    except IntegrityError:
-                        st.error("Errore: La chiave primaria del DB in memoria è stata resettata. Riprova.")
-                    except OperationalError:
-                        st.error("Errore DB: Tentativo fallito di scrivere. Riprova subito a salvare l'appuntamento.")
-                    except Exception as e:
-                        st.error(f"Errore DB: Impossibile salvare l'appuntamento. Dettagli: {e}")
-                
-def admin_app():
-    st.title("✂️ Pannello di Gestione Appuntamenti")
-    
-    if st.button("⬅️ Torna alla modalità Prenotazione Clienti"):
-        st.session_state['current_view'] = 'client'
-        st.rerun()
-    
-    st.markdown("---")
-    
-    min_date = date.today()
-    data_scelta_admin = st.date_input(
-        "Seleziona la data da visualizzare:",
-        value=min_date,
-        min_value=min_date,
-        format="DD/MM/YYYY"
-    )
-
-    if data_scelta_admin.weekday() in GIORNI_CHIUSURA:
-        st.warning("Giorno di chiusura. Nessuna prenotazione possibile.")
-        return
-
-    st.markdown("---")
-
-    col_salvatore, col_raffaele = st.columns(2)
-
-    with col_salvatore:
-        display_calendar_view(1, "Salvatore", data_scelta_admin)
-
-    with col_raffaele:
-        display_calendar_view(2, "Raffaele", data_scelta_admin)
-
-
-# --- 5. INTERFACCIA PRINCIPALE STREAMLIT (Lato Cliente) ---
-
-def main_app():
-    st.set_page_config(page_title="Prenotazione Barbiere", layout="centered")
-    
-    # --- GESTIONE MESSAGGI PERSISTENTI (Per visualizzare successo o errore dopo rerun) ---
-    if 'last_action_status' in st.session_state:
-        if st.session_state['last_action_status'] == 'success':
-            st.success(st.session_state['last_action_message'])
-        elif st.session_state['last_action_status'] == 'error':
-            st.error(st.session_state['last_action_message'])
-            
-        # Pulisci lo stato dopo aver mostrato il messaggio una volta
-        st.session_state.pop('last_action_status')
-        st.session_state.pop('last_action_message')
-    # --- FINE GESTIONE MESSAGGI PERSISTENTI ---
-    
-    # --- GRAFICA TESTUALE MIGLIORATA ---
-    st.markdown(
-        """
-        <style>
-        .barber-title {
-            font-family: 'Playfair Display', serif; 
-            font-size: 3.5em; 
-            font-weight: bold;
-            color: #f69a23; 
-            text-align: center;
-            margin-bottom: -15px; 
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.5); 
-        }
-        .barber-subtitle {
-            font-family: 'Open Sans', sans-serif; 
-            font-size: 1.2em;
-            color: #CCCCCC; 
-            text-align: center;
-            margin-bottom: 25px;
-            letter-spacing: 2px; 
-        }
-        </style>
-        <div class="barber-title">SALVATORE NATILLO</div>
-        <div class="barber-subtitle">MODA CAPELLI UOMO</div>
-        """, 
-        unsafe_allow_html=True
-    )
-    # --- FINE GRAFICA TESTUALE ---
-    
-    st.subheader("1. Scegli il tuo servizio")
-    
-    service_options = ["Seleziona un servizio..."] + [f"{s} ({d} min)" for s, d in SERVIZI.items()]
-    service_selection = st.selectbox(
-        "Seleziona il trattamento desiderato:",
-        options=service_options
-    )
-    
-    if service_selection == "Seleziona un servizio...":
-        return 
-        
-    service_name = service_selection.split(" (")[0]
-    durata_servizio_min = SERVIZI[service_name]
-    st.info(f"Durata stimata: **{durata_servizio_min} minuti**.")
-
-
-    st.subheader("2. Scegli Barbiere e Data")
-
-    barbiere_id_map = {name: id for id, name in BARBIERI.items()}
-    
-    # Rimosso "Indifferente"
-    barbiere_selection_options = ["Seleziona un barbiere..."] + list(BARBIERI.values())
-    
-    barbiere_scelto_nome = st.selectbox(
-        "Preferisci prenotare con:",
-        options=barbiere_selection_options
-    )
-    
-    if barbiere_scelto_nome == "Seleziona un barbiere...":
-        return 
-    
-    barbiere_id_scelto = barbiere_id_map[barbiere_scelto_nome]
-
-    def is_day_available(check_date):
-        return check_date.weekday() not in GIORNI_CHIUSURA 
-
-    min_date = date.today()
-    # Logica per impostare il default al primo giorno lavorativo disponibile (oggi se aperto)
-    while not is_day_available(min_date):
-        min_date += timedelta(days=1)
-    
-    data_scelta = st.date_input(
-        "Seleziona una data per l'appuntamento:",
-        value=min_date, 
-        min_value=min_date,
-        format="DD/MM/YYYY"
-    )
-
-    if not is_day_available(data_scelta):
-        st.error("Il Barbiere è chiuso di Lunedì e Domenica.")
-        return
-
-    st.subheader("3. Scegli l'ora disponibile")
-    
-    opzioni_disponibili = ["Seleziona un orario..."]
-    slot_to_barbiere_map = {} 
-    
-    barbiere_id = barbiere_id_scelto
-    
-    prenotazioni_barbiere_raw = fetch_prenotazioni_per_barbiere(barbiere_id, data_scelta)
-    prenotazioni_barbiere = [{'start': p['start'], 'end': p['end']} for p in prenotazioni_barbiere_raw]
-
-    slots_liberi = get_orari_disponibili(data_scelta, durata_servizio_min, prenotazioni_barbiere)
-
-    for slot in slots_liberi:
-        slot_time = slot.strftime("%H:%M")
-        
-        # Rimosso il nome del barbiere dall'opzione (es. "15:30")
-        opzione_completa = slot_time 
-
-        if opzione_completa not in slot_to_barbiere_map:
-            opzioni_disponibili.append(opzione_completa)
-            # Associamo lo slot orario al Barbiere ID corretto
-            slot_to_barbiere_map[opzione_completa] = barbiere_id
-
-    
-    slot_options_sorted = sorted([o for o in opzioni_disponibili if o != "Seleziona un orario..."])
-    final_options = [opzioni_disponibili[0]] + slot_options_sorted
-
-
-    selected_slot_option = st.selectbox(
-        "Orari disponibili (solo quelli liberi):",
-        options=final_options,
-        key='final_slot_selector'
-    )
-    
-    
-    # --- Modulo di Conferma Finale (Mostrato se viene selezionato uno slot) ---
-    if selected_slot_option != "Seleziona un orario...":
-        
-        try:
-            barbiere_id_finale = slot_to_barbiere_map[selected_slot_option]
-        except KeyError:
-            st.warning("Seleziona di nuovo l'orario, errore interno nel mapping.")
-            st.session_state.pop('prenotazione_finale', None)
-            return
-
-        barbiere_nome_finale = BARBIERI[barbiere_id_finale]
-        
-        ora_inizio_finale = selected_slot_option 
-        
-        
-        # Aggiorna lo stato della prenotazione in session_state
-        if 'prenotazione_finale' not in st.session_state or st.session_state['prenotazione_finale'].get('ora_inizio') != ora_inizio_finale:
-            st.session_state['prenotazione_finale'] = {
-                'barbiere_id': barbiere_id_finale,
-                'barbiere_nome': barbiere_nome_finale,
-                'data': data_scelta.strftime("%d/%m/%Y"),
-                'ora_inizio': ora_inizio_finale,
-                'servizio': service_selection 
-            }
-        
-        
-    if len(final_options) <= 1 and selected_slot_option == "Seleziona un orario...":
-        st.warning("Nessun orario disponibile per la data e il servizio selezionato.")
-        
-        
-    # --- Modulo di Conferma Dati Cliente (Mostrato dopo la selezione dello slot) ---
-    if 'prenotazione_finale' in st.session_state and selected_slot_option != "Seleziona un orario...":
-        st.success(f"Conferma: {st.session_state['prenotazione_finale']['ora_inizio']} con {st.session_state['prenotazione_finale']['barbiere_nome']}")
-        
-        with st.form("form_prenotazione_finale"):
-            st.write("Completa i tuoi dati per confermare l'appuntamento:")
-            nome = st.text_input("Nome e Cognome", max_chars=100, key="client_nome_final")
-            telefono = st.text_input("Numero di Telefono", max_chars=20, key="client_telefono_final")
-            
-            submitted = st.form_submit_button("CONFERMA LA PRENOTAZIONE")
-            
-            if submitted:
-                if nome and telefono:
-                    try:
-                        dati_finali = st.session_state['prenotazione_finale']
-                        
-                        data_ora_inizio = datetime.strptime(f"{dati_finali['data']} {dati_finali['ora_inizio']}", "%d/%m/%Y %H:%M")
-                        
-                        durata_min = SERVIZI[dati_finali['servizio'].split(" (")[0]]
-                        data_ora_fine = data_ora_inizio + timedelta(minutes=durata_min)
-                        
-                        # 1. SALVA SUL DB 
-                        db = SessionLocal()
-                        nuova_prenotazione = Prenotazione(
-                            barbiere_id=dati_finali['barbiere_id'],
-                            data_appuntamento=data_ora_inizio, 
-                            ora_inizio=data_ora_inizio,
-                            ora_fine=data_ora_fine,
-                            servizio=dati_finali['servizio'],
-                            cliente_nome=nome,
-                            cliente_telefono=telefono
-                        )
-                        db.add(nuova_prenotazione) 
-                        db.commit()
-                        db.close()
-                        
-                        # 2. PREPARA E INVIA MESSAGGIO
-                        dati_finali['cliente_nome'] = nome
-                        send_confirmation_message(telefono, dati_finali)
-                        
-                        # 3. CONFERMA SU STATO PERSISTENTE E RERUN
-                        st.session_state['last_action_status'] = 'success'
-                        st.session_state['last_action_message'] = f"✂️ Appuntamento confermato! Ti aspettiamo il {dati_finali['data']} alle {dati_finali['ora_inizio']}. 💈"
-                        st.session_state.pop('prenotazione_finale') 
-                        st.rerun() 
-                        
-                    except OperationalError as e:
-                        st.session_state['last_action_status'] = 'error'
-                        st.session_state['last_action_message'] = f"Errore DB (Riprova): Impossibile scrivere i dati. Dettagli: {e}"
-                        st.rerun() 
-                    except Exception as e:
-                        st.session_state['last_action_status'] = 'error'
-                        st.session_state['last_action_message'] = f"Errore CRITICO durante il salvataggio. Dettagli: {e}"
-                        st.rerun() 
-
-                else:
-                    st.error("Per favor, inserisci Nome e Telefono.")
-    
-    # --- SEZIONE DI ACCESSO ADMIN ---
-    st.markdown("---")
-    st.subheader("Accesso Riservato")
-    
-    with st.expander("Apri Pannello di Gestione"):
-        password = st.text_input("Password Admin:", type="password", key="admin_password_input")
-        
-        if password == "totore":
-            st.success("Accesso Gestione Effettuato.")
-            if st.button("Vai al Pannello Admin"):
-                st.session_state['current_view'] = 'admin'
-                st.rerun()
-        elif password and password != "totore":
-            st.error("Password errata.")
-
-
-# --- 6. AVVIO APPLICAZIONE (Logica di inizializzazione forzata) ---
-
-if __name__ == "__main__":
-    
-    # AZIONE CRITICA: Forza l'inizializzazione del DB in memoria ad ogni esecuzione.
-    try:
-        init_db() 
-    except Exception as e:
-        st.error(f"Errore critico di inizializzazione del database. L'app non può funzionare. Dettagli: {e}")
-        st.stop()
-            
-    
-    if 'current_view' not in st.session_state:
-        st.session_state['current_view'] = 'client'
-        
-    if st.session_state['current_view'] == 'admin':
-        admin_app()
-    else:
-        main_app()
+import io
+import logging
+import pandas as pd
+import streamlit as st
+from datetime import datetime, time, timedelta, date
+from sqlalchemy.exc import OperationalError, IntegrityError 
+# Il motore (database, disponibilità, prenotazioni) è nel pacchetto core, che non dipende da Streamlit:
+# qui resta solo l'interfaccia.
+from core.db import init_db, misura_db
+
+
+# --- 1. CONFIGURAZIONE DEL NEGOZIO ---
+# Barbieri, servizi, orari, ferie e cadenza sono nel database (core/calendario.py) e si modificano dal
+# pannello admin senza redeploy; core/configurazione.py contiene solo i valori iniziali.
+from core.calendario import configurazione_corrente, salva_configurazione, ConfigurazioneNonValida, NOMI_GIORNI
+from core.cache_disponibilita import cache_disponibilita
+from core.servizio_prenotazioni import (
+    crea_prenotazione, crea_prenotazione_qualsiasi, modifica_prenotazioni, annulla_prenotazioni, riassegna_prenotazioni, sposta_prenotazioni,
+    SlotNonDisponibile, CAMPI_MODIFICABILI,
+)
+from core.profilazione import profilatore, PROFILAZIONE_ENV
+from core.notifiche import WorkerNotifiche, MittenteStub
+from core.istantanea import IstantaneaAgenda
+from core.clienti import cerca_clienti, storico_cliente, nome_cliente, MAX_CLIENTI_RICERCA, MAX_RIGHE_STORICO_CLIENTE
+from core.agenda import cerca_primi_slot_liberi, get_orari_disponibili_barbiere, get_orari_disponibili_qualsiasi, leggi_agenda
+from scambio_dati import importa_prenotazioni, esporta_in_memoria, FORMATI
+from archivio import leggi_storico, applica_politica, statistiche_archivio, ARCHIVIA_DOPO_GIORNI, CONSERVA_ANNI, MAX_RIGHE_STORICO
+
+# Quanti risultati mostra la modalità "Primo orario disponibile"
+NUMERO_PRIMI_SLOT = 5
+# Voce del menu barbieri per la modalità "barbiere indifferente" (assegnato alla conferma)
+BARBIERE_INDIFFERENTE = "Indifferente (il primo libero)"
+# Oltre questo numero di query in un singolo rerun viene loggato un avviso (probabile N+1)
+SOGLIA_QUERY_PER_RERUN = 20
+
+logger = logging.getLogger("natillo")
+
+# --- 2. LOGICA DI SCHEDULAZIONE: vedi core/agenda.py ---
+
+@st.cache_resource
+def get_istantanea_agenda():
+    """Istantanea delle prossime settimane: una per processo, condivisa da tutte le sessioni."""
+    return IstantaneaAgenda()
+
+# --- 3. FUNZIONI DI MESSAGGISTICA ---
+
+@st.cache_resource
+def get_worker_notifiche():
+    """Avvia (una volta per processo) il worker che svuota l'outbox delle notifiche."""
+    worker = WorkerNotifiche(MittenteStub())
+    worker.start()
+    return worker
+
+def send_confirmation_message(telefono, dati_finali):
+    """
+    Non invia più in linea: la conferma è già nell'outbox, scritta nella stessa transazione della
+    prenotazione (vedi crea_prenotazione). Qui si sveglia il worker e si avvisa l'utente.
+    """
+    get_worker_notifiche().sveglia()
+    st.toast(f"Messaggio di conferma in invio a {telefono}", icon='📱')
+    return True 
+
+# --- 4. INTERFACCIA DI GESTIONE (ADMIN PANEL) ---
+
+def _tabella_agenda(righe: list, nomi_barbieri: dict):
+    """DataFrame dell'agenda, indicizzato per ID prenotazione (l'indice non viene mostrato)."""
+    return pd.DataFrame(
+        [
+            {
+                'inizio': p.ora_inizio,
+                'durata_min': int((p.ora_fine - p.ora_inizio).total_seconds() // 60),
+                'barbiere': nomi_barbieri.get(p.barbiere_id, f"#{p.barbiere_id}"),
+                'servizio': p.servizio,
+                'cliente_nome': p.cliente_nome,
+                'cliente_telefono': p.cliente_telefono,
+                'elimina': False,
+            }
+            for p in righe
+        ],
+        index=pd.Index([p.id for p in righe], name='id'),
+        columns=['inizio', 'durata_min', 'barbiere', 'servizio', 'cliente_nome', 'cliente_telefono', 'elimina']
+    )
+
+def mostra_agenda(configurazione, data_inizio: date, data_fine: date):
+    """
+    Agenda di tutti i barbieri in un'unica tabella: selezione multipla delle righe da eliminare e
+    correzione di nome/telefono. Il form raccoglie le modifiche e le applica con un solo commit
+    e un solo rerun, invece di un pulsante (e un rerun) per ogni appuntamento.
+    """
+    with profilatore.fase("db_fetch_admin"):
+        try:
+            righe = leggi_agenda(data_inizio, data_fine, configurazione.barbieri)
+        except OperationalError:
+            st.error("Errore DB: impossibile leggere l'agenda, riprova tra qualche istante.")
+            return
+
+    if not righe:
+        st.info("Nessun appuntamento prenotato.")
+        return
+
+    originale = _tabella_agenda(righe, configurazione.nomi_barbieri)
+    with profilatore.fase("render_calendario"), st.form(f"form_agenda_{data_inizio.isoformat()}_{data_fine.isoformat()}"):
+        st.caption(f"{len(righe)} appuntamenti. Spunta \"Elimina\" o correggi nome e telefono, poi applica.")
+        modificata = st.data_editor(
+            originale, hide_index=True,
+            disabled=['inizio', 'durata_min', 'barbiere', 'servizio'],
+            column_config={
+                'inizio': st.column_config.DatetimeColumn("Inizio", format="ddd DD/MM HH:mm"),
+                'durata_min': st.column_config.NumberColumn("Durata (min)"),
+                'barbiere': "Barbiere",
+                'servizio': "Servizio",
+                'cliente_nome': st.column_config.TextColumn("Cliente", required=True),
+                'cliente_telefono': st.column_config.TextColumn("Telefono", required=True),
+                'elimina': st.column_config.CheckboxColumn("Elimina"),
+            }
+        )
+        applica = st.form_submit_button("Applica modifiche")
+
+    if not applica:
+        return
+
+    da_eliminare = [int(i) for i in modificata.index[modificata['elimina']]]
+    modifiche = {}
+    for prenotazione_id, riga in modificata.iterrows():
+        campi = {
+            campo: riga[campo].strip()
+            for campo in CAMPI_MODIFICABILI
+            if isinstance(riga[campo], str) and riga[campo].strip() != originale.at[prenotazione_id, campo]
+        }
+        if campi:
+            modifiche[int(prenotazione_id)] = campi
+
+    if any(not valore for campi in modifiche.values() for valore in campi.values()):
+        st.error("Nome e Telefono non possono essere vuoti.")
+        return
+    if not da_eliminare and not modifiche:
+        st.info("Nessuna modifica da applicare.")
+        return
+
+    try:
+        esito = modifica_prenotazioni(da_eliminare, modifiche)
+    except OperationalError:
+        st.error("Errore DB: modifiche non applicate, riprova tra qualche istante.")
+        return
+    st.toast(f"Eliminati {esito['eliminate']} appuntamenti, aggiornati {esito['aggiornate']}.", icon='🗑️')
+    if esito['non_trovate']:
+        # Righe sparite tra la lettura e il salvataggio: le altre modifiche sono comunque applicate
+        st.toast(f"{esito['non_trovate']} prenotazioni non più presenti (già eliminate o archiviate).", icon='⚠️')
+    st.rerun()
+
+def _nome_cliente_noto(telefono) -> str:
+    """Nome dell'ultima prenotazione con quel numero, solo lato admin; stringa vuota se sconosciuto o senza DB."""
+    try:
+        return nome_cliente(telefono) or ""
+    except OperationalError:
+        return ""
+
+def mostra_inserimento_manuale(configurazione, data_selezionata: date):
+    """Un solo form per l'inserimento manuale, con la scelta del barbiere."""
+    st.markdown(f"**Aggiungi Appuntamento**")
+    with st.expander("Inserimento Manuale"):
+        with st.form("form_manuale"):
+            servizi = configurazione.servizi
+            service_names = list(servizi.keys())
+            
+            col_barbiere, col_time, col_service = st.columns(3)
+            with col_barbiere:
+                barbiere_id = st.selectbox("Barbiere", options=list(configurazione.barbieri),
+                                           format_func=configurazione.barbieri.get, key="barbiere_manuale")
+            with col_time:
+                ora_manuale = st.time_input("Ora di Inizio", time(8, 30), key="time_manuale")
+            with col_service:
+                servizio_manuale = st.selectbox("Servizio", options=service_names, key="service_manuale")
+            
+            tel_cli = st.text_input("Telefono Cliente", key="tel_manuale")
+            nome_cli = st.text_input("Nome Cliente", key="name_manuale",
+                                     help="Per un cliente già noto si può lasciare vuoto: si usa il nome dell'ultima prenotazione.")
+            
+            if st.form_submit_button("Salva Appuntamento Manuale"):
+                nome_barbiere = configurazione.barbieri[barbiere_id]
+                if tel_cli and not nome_cli:
+                    nome_cli = _nome_cliente_noto(tel_cli)
+                durata_man_min = servizi[servizio_manuale]
+                
+                data_ora_inizio = datetime.combine(data_selezionata, ora_manuale)
+                data_ora_fine = data_ora_inizio + timedelta(minutes=durata_man_min)
+
+                if data_ora_inizio.date() != data_selezionata:
+                    st.error("Errore di data. Controlla l'ora.")
+                elif not nome_cli or not tel_cli:
+                    st.error("Nome e Telefono sono obbligatori.")
+                else:
+                    try:
+                        dati_conferma = {
+                            'cliente_nome': nome_cli, 
+                            'servizio': servizio_manuale, 
+                            'data': data_selezionata.strftime("%d/%m/%Y"), 
+                            'ora_inizio': ora_manuale.strftime("%H:%M"), 
+                            'barbiere_nome': nome_barbiere
+                        }
+                        # Controllo sovrapposizioni + insert + outbox in un'unica transazione immediata
+                        crea_prenotazione(
+                            barbiere_id, data_ora_inizio, data_ora_fine,
+                            f"{servizio_manuale}", nome_cli, tel_cli, dati_notifica=dati_conferma
+                        )
+                        
+                        send_confirmation_message(tel_cli, dati_conferma)
+                        
+                        st.success(f"Appuntamento salvato per {nome_barbiere} alle {ora_manuale.strftime('%H:%M')}!")
+                        st.rerun() 
+                    except SlotNonDisponibile as e:
+                        st.error(f"{e} Scegli un altro orario.")
+                    except IntegrityError:
+                        st.error("Errore: La chiave primaria del DB in memoria è stata resettata. Riprova.")
+                    except OperationalError:
+                        st.error("Errore DB: Tentativo fallito di scrivere. Riprova subito a salvare l'appuntamento.")
+                    except Exception as e:
+                        st.error(f"Errore DB: Impossibile salvare l'appuntamento. Dettagli: {e}")
+                
+def admin_app():
+    st.title("✂️ Pannello di Gestione Appuntamenti")
+    
+    if st.button("⬅️ Torna alla modalità Prenotazione Clienti"):
+        st.session_state['current_view'] = 'client'
+        st.rerun()
+    
+    stat_cache = cache_disponibilita.statistiche()
+    st.caption(f"Cache disponibilità: {stat_cache['hit']} hit / {stat_cache['miss']} miss "
+               f"({stat_cache['voci']}/{stat_cache['capacita']} voci, {stat_cache['invalidazioni']} invalidazioni)")
+    stat_istantanea = get_istantanea_agenda().statistiche()
+    st.caption(f"Istantanea agenda: {stat_istantanea['prenotazioni']} prenotazioni in memoria, "
+               f"{stat_istantanea['aggiornamenti']} aggiornamenti ({stat_istantanea['giorni_ricaricati']} giorni riletti), "
+               f"{stat_istantanea['ricaricamenti_completi']} ricaricamenti completi")
+    if 'ultime_statistiche_db' in st.session_state:
+        stat_db = st.session_state['ultime_statistiche_db']
+        st.caption(f"Rerun precedente: {stat_db['query']} query, {stat_db['connessioni_aperte']} connessioni aperte, "
+                   f"{stat_db['tempo_db_ms']} ms nel DB, {stat_db['connessioni_non_restituite']} non restituite")
+    
+    mostra_diagnostica()
+    mostra_scambio_dati()
+    mostra_configurazione()
+    mostra_storico()
+    mostra_ricerca_clienti()
+    mostra_operazioni_blocco()
+    
+    st.markdown("---")
+    
+    min_date = date.today()
+    col_data, col_vista = st.columns([2, 1])
+    with col_data:
+        data_scelta_admin = st.date_input(
+            "Seleziona la data da visualizzare:",
+            value=min_date,
+            min_value=min_date,
+            format="DD/MM/YYYY"
+        )
+    with col_vista:
+        vista = st.radio("Vista", ["Giorno", "Settimana"], horizontal=True, key="vista_agenda")
+
+    configurazione = configurazione_corrente()
+    if vista == "Giorno" and not configurazione.aperto(data_scelta_admin):
+        st.warning("Giorno di chiusura. Nessuna prenotazione possibile.")
+        return
+
+    st.markdown("---")
+
+    # Una sola query per tutti i barbieri e tutti i giorni della vista, resa in un'unica tabella
+    data_fine = data_scelta_admin + timedelta(days=6) if vista == "Settimana" else data_scelta_admin
+    mostra_agenda(configurazione, data_scelta_admin, data_fine)
+
+    if configurazione.aperto(data_scelta_admin):
+        mostra_inserimento_manuale(configurazione, data_scelta_admin)
+
+def mostra_diagnostica():
+    """Sezione diagnostica: accende la profilazione e mostra p50/p95 per fase, con export JSON lines."""
+    with st.expander("Diagnostica prestazioni"):
+        profilatore.attivo = st.toggle(
+            "Profilazione attiva", value=profilatore.attivo,
+            help=f"Attivabile anche all'avvio con {PROFILAZIONE_ENV}=1"
+        )
+
+        riepilogo = profilatore.riepilogo()
+        if riepilogo:
+            st.dataframe(riepilogo, hide_index=True)
+        else:
+            st.info("Nessun campione raccolto: attiva la profilazione e naviga nell'app.")
+
+        col_export, col_azzera = st.columns(2)
+        with col_export:
+            st.download_button(
+                "Scarica campioni (JSON lines)", data=profilatore.esporta_jsonl(),
+                file_name="profilazione.jsonl", mime="application/jsonl"
+            )
+        with col_azzera:
+            if st.button("Azzera campioni"):
+                profilatore.azzera()
+                st.rerun()
+
+def mostra_scambio_dati():
+    """Import da CSV/JSON (agenda cartacea, altri gestionali) ed export di un intervallo di date."""
+    with st.expander("Importa / Esporta prenotazioni"):
+        st.markdown("**Importa**")
+        st.caption("Colonne: barbiere (o barbiere_id), inizio (AAAA-MM-GG HH:MM), fine (facoltativa), "
+                   "servizio, cliente_nome, cliente_telefono. JSON: un oggetto per riga o un array.")
+        file_caricato = st.file_uploader("File da importare", type=["csv", "json", "jsonl"], key="file_import")
+        simula = st.checkbox("Solo verifica (non salva nulla)", value=True, key="simula_import")
+
+        if file_caricato is not None and st.button("Importa"):
+            formato = 'csv' if file_caricato.name.lower().endswith(".csv") else 'json'
+            testo = io.TextIOWrapper(file_caricato, encoding="utf-8-sig", newline="")
+            try:
+                rapporto = importa_prenotazioni(testo, formato, simula=simula)
+            except OperationalError:
+                st.error("Errore DB: import interrotto, riprova tra qualche istante.")
+            except (ValueError, UnicodeDecodeError) as e:
+                st.error(f"File non leggibile: {e}")
+            else:
+                esito = "valide" if simula else "importate"
+                st.success(f"Lette {rapporto['lette']} righe: {rapporto['importate']} {esito}, "
+                           f"{rapporto['scartate']} scartate.")
+                if rapporto['errori']:
+                    st.dataframe([{'riga': n, 'errore': m} for n, m in rapporto['errori']], hide_index=True)
+
+        st.markdown("**Esporta**")
+        col_dal, col_al, col_formato = st.columns(3)
+        with col_dal:
+            dal = st.date_input("Dal", value=date.today().replace(day=1), format="DD/MM/YYYY", key="export_dal")
+        with col_al:
+            al = st.date_input("Al", value=date.today(), format="DD/MM/YYYY", key="export_al")
+        with col_formato:
+            formato_export = st.selectbox("Formato", options=FORMATI, key="export_formato")
+
+        # Il file viene generato solo su richiesta, non a ogni rerun del pannello
+        if st.button("Prepara esportazione"):
+            st.session_state['export_pronto'] = (
+                esporta_in_memoria(dal, al, formato_export),
+                f"prenotazioni_{dal.isoformat()}_{al.isoformat()}.{'csv' if formato_export == 'csv' else 'jsonl'}"
+            )
+        if 'export_pronto' in st.session_state:
+            contenuto, nome_file = st.session_state['export_pronto']
+            st.download_button("Scarica", data=contenuto, file_name=nome_file,
+                               mime="text/csv" if nome_file.endswith(".csv") else "application/jsonl")
+
+def _righe_editor(tabella) -> list:
+    """Righe di un DataFrame del data_editor come dict, con le celle vuote (NaN/NaT) a None."""
+    return [
+        {colonna: (None if pd.isna(valore) else valore) for colonna, valore in riga.items()}
+        for riga in tabella.to_dict("records")
+    ]
+
+def mostra_configurazione():
+    """Modifica di barbieri, servizi, orari settimanali, ferie e cadenza, salvati in un'unica transazione."""
+    with st.expander("Configurazione negozio"):
+        configurazione = configurazione_corrente()
+        st.caption(f"Versione {configurazione.versione}. Le modifiche valgono subito per tutte le sessioni.")
+
+        barbieri = st.data_editor(
+            pd.DataFrame(
+                [{'id': b, 'nome': nome, 'attivo': b in configurazione.barbieri} for b, nome in configurazione.nomi_barbieri.items()],
+                columns=['id', 'nome', 'attivo']
+            ),
+            num_rows="dynamic", hide_index=True, key="config_barbieri",
+            column_config={'id': st.column_config.NumberColumn("ID", min_value=1, step=1, required=True)}
+        )
+        servizi = st.data_editor(
+            pd.DataFrame(
+                [{'nome': nome, 'durata_min': durata, 'attivo': True} for nome, durata in configurazione.servizi.items()],
+                columns=['nome', 'durata_min', 'attivo']
+            ),
+            num_rows="dynamic", hide_index=True, key="config_servizi",
+            column_config={'durata_min': st.column_config.NumberColumn("Durata (min)", min_value=5, step=5, required=True)}
+        )
+        orari = st.data_editor(
+            pd.DataFrame(
+                [
+                    {'barbiere_id': b, 'giorno': NOMI_GIORNI[g], 'inizio': inizio, 'fine': fine}
+                    for b, per_giorno in sorted(configurazione.orari.items())
+                    for g, fasce in sorted(per_giorno.items())
+                    for inizio, fine in fasce
+                ],
+                columns=['barbiere_id', 'giorno', 'inizio', 'fine']
+            ),
+            num_rows="dynamic", hide_index=True, key="config_orari",
+            column_config={
+                'barbiere_id': st.column_config.NumberColumn("Barbiere (ID)", step=1, required=True),
+                'giorno': st.column_config.SelectboxColumn("Giorno", options=NOMI_GIORNI, required=True),
+                'inizio': st.column_config.TimeColumn("Inizio", format="HH:mm", step=300, required=True),
+                'fine': st.column_config.TimeColumn("Fine", format="HH:mm", step=300, required=True),
+            }
+        )
+        chiusure = st.data_editor(
+            pd.DataFrame(
+                [{'barbiere_id': b, 'data_inizio': dal, 'data_fine': al, 'motivo': motivo}
+                 for b, dal, al, motivo in configurazione.chiusure],
+                columns=['barbiere_id', 'data_inizio', 'data_fine', 'motivo']
+            ),
+            num_rows="dynamic", hide_index=True, key="config_chiusure",
+            column_config={
+                'barbiere_id': st.column_config.NumberColumn("Barbiere (vuoto = tutti)", step=1),
+                'data_inizio': st.column_config.DateColumn("Dal", format="DD/MM/YYYY", required=True),
+                'data_fine': st.column_config.DateColumn("Al", format="DD/MM/YYYY", required=True),
+            }
+        )
+        cadenza_min = st.number_input("Cadenza degli slot (minuti)", min_value=5, step=5,
+                                      value=int(configurazione.cadenza.total_seconds() // 60), key="config_cadenza")
+
+        if st.button("Salva configurazione"):
+            try:
+                salva_configurazione(
+                    _righe_editor(barbieri), _righe_editor(servizi),
+                    [{**riga, 'giorno_settimana': NOMI_GIORNI.index(riga['giorno'])} for riga in _righe_editor(orari)],
+                    _righe_editor(chiusure), cadenza_min
+                )
+            except (ConfigurazioneNonValida, KeyError, TypeError, ValueError) as e:
+                st.error(f"Configurazione non salvata: {e}")
+            except OperationalError:
+                st.error("Errore DB: configurazione non salvata, riprova tra qualche istante.")
+            else:
+                st.toast("Configurazione salvata.", icon='✅')
+                st.rerun()
+
+
+def mostra_storico():
+    """Storico su richiesta (archivio + tabella calda) e avvio manuale dell'archiviazione."""
+    with st.expander("Storico e archivio"):
+        # Le query partono solo premendo i pulsanti: aprire il pannello non costa nulla
+        nomi_barbieri = configurazione_corrente().nomi_barbieri
+        col_dal, col_al, col_barbiere = st.columns(3)
+        with col_dal:
+            dal = st.date_input("Dal", value=date.today() - timedelta(days=365), format="DD/MM/YYYY", key="storico_dal")
+        with col_al:
+            al = st.date_input("Al", value=date.today(), format="DD/MM/YYYY", key="storico_al")
+        with col_barbiere:
+            scelta = st.selectbox("Barbiere", options=["Tutti"] + list(nomi_barbieri.values()), key="storico_barbiere")
+        barbiere_id = next((b for b, nome in nomi_barbieri.items() if nome == scelta), None)
+
+        if st.button("Cerca nello storico"):
+            try:
+                righe = leggi_storico(dal, al, barbiere_id)
+            except OperationalError:
+                st.error("Errore DB: storico non disponibile, riprova tra qualche istante.")
+            else:
+                if len(righe) >= MAX_RIGHE_STORICO:
+                    st.warning(f"Mostrate solo le prime {MAX_RIGHE_STORICO} prenotazioni: restringi l'intervallo.")
+                st.dataframe(
+                    [{**r, 'barbiere': nomi_barbieri.get(r.pop('barbiere_id'), "")} for r in righe],
+                    hide_index=True
+                )
+
+        st.markdown("**Archiviazione**")
+        col_giorni, col_anni = st.columns(2)
+        with col_giorni:
+            giorni = st.number_input("Archivia le prenotazioni più vecchie di (giorni)", min_value=1,
+                                     value=ARCHIVIA_DOPO_GIORNI, key="archivio_giorni")
+        with col_anni:
+            anni = st.number_input("Conserva l'archivio per (anni, 0 = sempre)", min_value=0,
+                                   value=CONSERVA_ANNI, key="archivio_anni")
+        if st.button("Archivia ora"):
+            try:
+                rapporto = applica_politica(int(giorni), int(anni))
+            except OperationalError:
+                st.error("Errore DB: archiviazione interrotta, i lotti già spostati restano in archivio. Riprova.")
+            else:
+                st.success(f"Archiviate {rapporto['archiviate']} prenotazioni, eliminate dall'archivio "
+                           f"{rapporto['eliminate_archivio']}, notifiche eliminate {rapporto['notifiche_eliminate']}.")
+                st.caption(f"Situazione: {statistiche_archivio()}")
+
+
+def mostra_ricerca_clienti():
+    """Clienti per telefono (anche solo le prime cifre, in qualunque formato) e storico del cliente scelto."""
+    with st.expander("Clienti"):
+        testo = st.text_input("Telefono (anche solo le prime cifre)", max_chars=20, key="clienti_ricerca")
+        if not testo:
+            return
+        try:
+            clienti = cerca_clienti(testo)
+        except OperationalError:
+            st.error("Errore DB: ricerca non disponibile, riprova tra qualche istante.")
+            return
+        if not clienti:
+            st.info("Nessun cliente con questo numero.")
+            return
+        if len(clienti) >= MAX_CLIENTI_RICERCA:
+            st.caption(f"Primi {MAX_CLIENTI_RICERCA} numeri: aggiungi cifre per restringere la ricerca.")
+        st.dataframe(clienti, hide_index=True)
+
+        opzioni = {f"{c['cliente_nome']} ({c['cliente_telefono']}), {c['prenotazioni']} prenotazioni": c['telefono']
+                   for c in clienti}
+        scelta = st.selectbox("Storico del cliente", options=list(opzioni), key="clienti_scelta")
+        try:
+            righe = storico_cliente(opzioni[scelta])
+        except OperationalError:
+            st.error("Errore DB: storico non disponibile, riprova tra qualche istante.")
+            return
+        if len(righe) >= MAX_RIGHE_STORICO_CLIENTE:
+            st.caption(f"Mostrate le ultime {MAX_RIGHE_STORICO_CLIENTE} prenotazioni.")
+        nomi_barbieri = configurazione_corrente().nomi_barbieri
+        st.dataframe(
+            [{'barbiere': nomi_barbieri.get(r['barbiere_id'], ""),
+              **{k: v for k, v in r.items() if k != 'barbiere_id'}} for r in righe],
+            hide_index=True
+        )
+
+
+def mostra_operazioni_blocco():
+    """Annulla, riassegna o sposta tutte le prenotazioni di un barbiere in un intervallo, con un solo statement."""
+    with st.expander("Operazioni in blocco (malattia, imprevisti)"):
+        configurazione = configurazione_corrente()
+        col_barbiere, col_dal, col_al = st.columns(3)
+        with col_barbiere:
+            barbiere_id = st.selectbox("Barbiere", options=list(configurazione.barbieri),
+                                       format_func=configurazione.barbieri.get, key="blocco_barbiere")
+        with col_dal:
+            dal = st.date_input("Dal", value=date.today(), min_value=date.today(), format="DD/MM/YYYY", key="blocco_dal")
+        with col_al:
+            al = st.date_input("Al", value=date.today(), min_value=date.today(), format="DD/MM/YYYY", key="blocco_al")
+
+        operazione = st.radio("Operazione", ["Annulla", "Riassegna", "Sposta"], horizontal=True, key="blocco_operazione")
+        if operazione == "Riassegna":
+            altri = [b for b in configurazione.barbieri if b != barbiere_id]
+            destinazione = st.selectbox("Al barbiere", options=altri, format_func=configurazione.barbieri.get,
+                                        key="blocco_destinazione")
+        elif operazione == "Sposta":
+            minuti = st.number_input("Sposta di (minuti, negativo = prima)", step=5, value=30, key="blocco_minuti")
+        avvisa = st.checkbox("Avvisa i clienti", value=True, key="blocco_avvisa")
+
+        if st.button("Esegui", key="blocco_esegui"):
+            try:
+                if operazione == "Annulla":
+                    righe = annulla_prenotazioni(barbiere_id, dal, al, avvisa_clienti=avvisa)
+                elif operazione == "Riassegna":
+                    if destinazione is None:
+                        st.error("Nessun altro barbiere attivo a cui riassegnare.")
+                        return
+                    righe = riassegna_prenotazioni(barbiere_id, destinazione, dal, al, avvisa_clienti=avvisa)
+                else:
+                    righe = sposta_prenotazioni(barbiere_id, dal, al, timedelta(minutes=int(minuti)), avvisa_clienti=avvisa)
+            except SlotNonDisponibile as e:
+                st.error(f"Nessuna prenotazione modificata: {e}")
+            except OperationalError:
+                st.error("Errore DB: operazione non eseguita, riprova tra qualche istante.")
+            else:
+                st.success(f"{operazione}: {len(righe)} prenotazioni.")
+                if righe:
+                    if avvisa:
+                        get_worker_notifiche().sveglia()
+                    st.dataframe(
+                        [{'barbiere': configurazione.nomi_barbieri.get(r['barbiere_id'], ""),
+                          **{k: v for k, v in r.items() if k != 'barbiere_id'}} for r in righe],
+                        hide_index=True
+                    )
+
+# --- 5. INTERFACCIA PRINCIPALE STREAMLIT (Lato Cliente) ---
+
+def mostra_modulo_conferma():
+    """Modulo Nome/Telefono e salvataggio della prenotazione in st.session_state['prenotazione_finale']."""
+    st.success(f"Conferma: {st.session_state['prenotazione_finale']['ora_inizio']} con {st.session_state['prenotazione_finale']['barbiere_nome']}")
+    
+    # Nessuna autocompilazione qui: il modulo è pubblico e dal solo numero rivelerebbe il nome di un cliente
+    with st.form("form_prenotazione_finale"):
+        st.write("Completa i tuoi dati per confermare l'appuntamento:")
+        nome = st.text_input("Nome e Cognome", max_chars=100, key="client_nome_final")
+        telefono = st.text_input("Numero di Telefono", max_chars=20, key="client_telefono_final")
+        
+        submitted = st.form_submit_button("CONFERMA LA PRENOTAZIONE")
+        
+        if submitted:
+            if nome and telefono:
+                try:
+                    dati_finali = st.session_state['prenotazione_finale']
+                    
+                    data_ora_inizio = datetime.strptime(f"{dati_finali['data']} {dati_finali['ora_inizio']}", "%d/%m/%Y %H:%M")
+                    
+                    durata_min = configurazione_corrente().servizi.get(dati_finali['servizio'].split(" (")[0])
+                    if durata_min is None:
+                        st.error("Il servizio scelto non è più disponibile: ricomincia dalla scelta del servizio.")
+                        return
+                    data_ora_fine = data_ora_inizio + timedelta(minutes=durata_min)
+                    
+                    # 1. SALVA SUL DB (slot ricontrollato e conferma accodata nella stessa transazione)
+                    dati_finali['cliente_nome'] = nome
+                    if dati_finali['barbiere_id'] is None:
+                        # Barbiere indifferente: il meno carico tra quelli ancora liberi, scelto nella transazione
+                        _, barbiere_assegnato = crea_prenotazione_qualsiasi(
+                            data_ora_inizio, data_ora_fine,
+                            dati_finali['servizio'], nome, telefono, dati_notifica=dati_finali
+                        )
+                        dati_finali = {**dati_finali, 'barbiere_id': barbiere_assegnato,
+                                       'barbiere_nome': configurazione_corrente().barbieri.get(barbiere_assegnato, "")}
+                    else:
+                        crea_prenotazione(
+                            dati_finali['barbiere_id'], data_ora_inizio, data_ora_fine,
+                            dati_finali['servizio'], nome, telefono, dati_notifica=dati_finali
+                        )
+                    
+                    # 2. SVEGLIA IL WORKER DELLE NOTIFICHE (l'invio avviene in background)
+                    send_confirmation_message(telefono, dati_finali)
+                    
+                    # 3. CONFERMA SU STATO PERSISTENTE E RERUN
+                    st.session_state['last_action_status'] = 'success'
+                    st.session_state['last_action_message'] = f"✂️ Appuntamento confermato! Ti aspettiamo il {dati_finali['data']} alle {dati_finali['ora_inizio']} con {dati_finali['barbiere_nome']}. 💈"
+                    st.session_state.pop('prenotazione_finale') 
+                    st.rerun() 
+                    
+                except SlotNonDisponibile as e:
+                    st.session_state['last_action_status'] = 'error'
+                    st.session_state['last_action_message'] = f"{e} Un altro cliente lo ha appena prenotato: scegli un nuovo orario."
+                    st.session_state.pop('prenotazione_finale', None)
+                    st.rerun() 
+                except OperationalError as e:
+                    st.session_state['last_action_status'] = 'error'
+                    st.session_state['last_action_message'] = f"Errore DB (Riprova): Impossibile scrivere i dati. Dettagli: {e}"
+                    st.rerun() 
+                except Exception as e:
+                    st.session_state['last_action_status'] = 'error'
+                    st.session_state['last_action_message'] = f"Errore CRITICO durante il salvataggio. Dettagli: {e}"
+                    st.rerun() 
+
+            else:
+                st.error("Per favor, inserisci Nome e Telefono.")
+
+def mostra_accesso_admin():
+    """Sezione con password per passare al pannello di gestione."""
+    st.markdown("---")
+    st.subheader("Accesso Riservato")
+    
+    with st.expander("Apri Pannello di Gestione"):
+        password = st.text_input("Password Admin:", type="password", key="admin_password_input")
+        
+        if password == "totore":
+            st.success("Accesso Gestione Effettuato.")
+            if st.button("Vai al Pannello Admin"):
+                st.session_state['current_view'] = 'admin'
+                st.rerun()
+        elif password and password != "totore":
+            st.error("Password errata.")
+
+def mostra_primi_slot_liberi(durata_servizio_min: int, service_selection: str):
+    """Modalità "Primo orario disponibile": i primi slot liberi tra tutti i barbieri, senza scegliere la data."""
+    st.subheader("2. Scegli tra i primi orari disponibili")
+
+    try:
+        primi_slot = cerca_primi_slot_liberi(durata_servizio_min, date.today(), quanti=NUMERO_PRIMI_SLOT,
+                                                 istantanea=get_istantanea_agenda())
+    except OperationalError:
+        st.error("Errore DB: impossibile leggere gli orari disponibili. Riprova tra qualche istante.")
+        return
+
+    if not primi_slot:
+        st.warning("Nessun orario disponibile nei prossimi giorni per il servizio selezionato.")
+        return
+
+    barbieri = configurazione_corrente().barbieri
+    giorni_settimana = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
+    opzioni = {
+        f"{giorni_settimana[inizio.weekday()]} {inizio.strftime('%d/%m/%Y %H:%M')} con {barbieri[barbiere_id]}": (inizio, barbiere_id)
+        for inizio, barbiere_id in primi_slot
+    }
+    selected_slot_option = st.selectbox(
+        "Primi orari liberi:",
+        options=["Seleziona un orario..."] + list(opzioni),
+        key='primo_slot_selector'
+    )
+
+    if selected_slot_option == "Seleziona un orario...":
+        return
+
+    inizio, barbiere_id = opzioni[selected_slot_option]
+    prenotazione = {
+        'barbiere_id': barbiere_id,
+        'barbiere_nome': barbieri[barbiere_id],
+        'data': inizio.strftime("%d/%m/%Y"),
+        'ora_inizio': inizio.strftime("%H:%M"),
+        'servizio': service_selection
+    }
+    if st.session_state.get('prenotazione_finale') != prenotazione:
+        st.session_state['prenotazione_finale'] = prenotazione
+
+    mostra_modulo_conferma()
+
+
+def main_app():
+    st.set_page_config(page_title="Prenotazione Barbiere", layout="centered")
+    
+    # --- GESTIONE MESSAGGI PERSISTENTI (Per visualizzare successo o errore dopo rerun) ---
+    if 'last_action_status' in st.session_state:
+        if st.session_state['last_action_status'] == 'success':
+            st.success(st.session_state['last_action_message'])
+        elif st.session_state['last_action_status'] == 'error':
+            st.error(st.session_state['last_action_message'])
+            
+        # Pulisci lo stato dopo aver mostrato il messaggio una volta
+        st.session_state.pop('last_action_status')
+        st.session_state.pop('last_action_message')
+    # --- FINE GESTIONE MESSAGGI PERSISTENTI ---
+    
+    # --- GRAFICA TESTUALE MIGLIORATA ---
+    st.markdown(
+        """
+        <style>
+        .barber-title {
+            font-family: 'Playfair Display', serif; 
+            font-size: 3.5em; 
+            font-weight: bold;
+            color: #f69a23; 
+            text-align: center;
+            margin-bottom: -15px; 
+            text-shadow: 2px 2px 4px rgba(0,0,0,0.5); 
+        }
+        .barber-subtitle {
+            font-family: 'Open Sans', sans-serif; 
+            font-size: 1.2em;
+            color: #CCCCCC; 
+            text-align: center;
+            margin-bottom: 25px;
+            letter-spacing: 2px; 
+        }
+        </style>
+        <div class="barber-title">SALVATORE NATILLO</div>
+        <div class="barber-subtitle">MODA CAPELLI UOMO</div>
+        """, 
+        unsafe_allow_html=True
+    )
+    # --- FINE GRAFICA TESTUALE ---
+    
+    configurazione = configurazione_corrente()
+
+    st.subheader("1. Scegli il tuo servizio")
+    
+    service_options = ["Seleziona un servizio..."] + [f"{s} ({d} min)" for s, d in configurazione.servizi.items()]
+    service_selection = st.selectbox(
+        "Seleziona il trattamento desiderato:",
+        options=service_options
+    )
+    
+    if service_selection == "Seleziona un servizio...":
+        return 
+        
+    service_name = service_selection.split(" (")[0]
+    durata_servizio_min = configurazione.servizi[service_name]
+    st.info(f"Durata stimata: **{durata_servizio_min} minuti**.")
+
+    modalita = st.radio(
+        "Come preferisci cercare?",
+        options=["Scelgo barbiere e data", "Primo orario disponibile"],
+        horizontal=True,
+        key='modalita_ricerca'
+    )
+
+    if modalita == "Primo orario disponibile":
+        with profilatore.fase("ricerca_primi_slot"):
+            mostra_primi_slot_liberi(durata_servizio_min, service_selection)
+        mostra_accesso_admin()
+        return
+
+
+    st.subheader("2. Scegli Barbiere e Data")
+
+    barbiere_id_map = {name: id for id, name in configurazione.barbieri.items()}
+    
+    # "Indifferente": orari di tutti i barbieri uniti, il barbiere viene assegnato alla conferma
+    barbiere_selection_options = ["Seleziona un barbiere...", BARBIERE_INDIFFERENTE] + list(configurazione.barbieri.values())
+    
+    barbiere_scelto_nome = st.selectbox(
+        "Preferisci prenotare con:",
+        options=barbiere_selection_options
+    )
+    
+    if barbiere_scelto_nome == "Seleziona un barbiere...":
+        return 
+    
+    # None = barbiere indifferente
+    barbiere_id_scelto = barbiere_id_map.get(barbiere_scelto_nome)
+
+    def is_day_available(check_date):
+        # Riposo settimanale e ferie del barbiere scelto (o di tutti, se indifferente), dalla configurazione
+        return configurazione.aperto(check_date, barbiere_id_scelto)
+
+    # Logica per impostare il default al primo giorno lavorativo disponibile (oggi se aperto)
+    min_date = configurazione.primo_giorno_aperto(date.today(), barbiere_id_scelto)
+    if min_date is None:
+        st.warning("Nessun giorno di lavoro in calendario." if barbiere_id_scelto is None
+                   else f"{barbiere_scelto_nome} non ha giorni di lavoro in calendario.")
+        return
+    
+    data_scelta = st.date_input(
+        "Seleziona una data per l'appuntamento:",
+        value=min_date, 
+        min_value=min_date,
+        format="DD/MM/YYYY"
+    )
+
+    if not is_day_available(data_scelta):
+        st.error("Il negozio è chiuso in questa data. Scegli un altro giorno." if barbiere_id_scelto is None
+                 else f"{barbiere_scelto_nome} non lavora in questa data. Scegli un altro giorno.")
+        return
+
+    st.subheader("3. Scegli l'ora disponibile")
+    
+    opzioni_disponibili = ["Seleziona un orario..."]
+    slot_to_barbiere_map = {} 
+    
+    barbiere_id = barbiere_id_scelto
+    
+    try:
+        # Servito dalla cache: i rerun dovuti ai campi Nome/Telefono non rifanno query né calcolo
+        if barbiere_id is None:
+            slots_liberi = get_orari_disponibili_qualsiasi(data_scelta, durata_servizio_min,
+                                                           istantanea=get_istantanea_agenda())
+        else:
+            slots_liberi = get_orari_disponibili_barbiere(barbiere_id, data_scelta, durata_servizio_min,
+                                                          istantanea=get_istantanea_agenda())
+    except OperationalError:
+        st.error("Errore DB: impossibile leggere gli orari disponibili. Riprova tra qualche istante.")
+        return
+
+    for slot in slots_liberi:
+        slot_time = slot.strftime("%H:%M")
+        
+        # Rimosso il nome del barbiere dall'opzione (es. "15:30")
+        opzione_completa = slot_time 
+
+        if opzione_completa not in slot_to_barbiere_map:
+            opzioni_disponibili.append(opzione_completa)
+            # Associamo lo slot orario al Barbiere ID corretto
+            slot_to_barbiere_map[opzione_completa] = barbiere_id
+
+    
+    slot_options_sorted = sorted([o for o in opzioni_disponibili if o != "Seleziona un orario..."])
+    final_options = [opzioni_disponibili[0]] + slot_options_sorted
+
+
+    selected_slot_option = st.selectbox(
+        "Orari disponibili (solo quelli liberi):",
+        options=final_options,
+        key='final_slot_selector'
+    )
+    
+    
+    # --- Modulo di Conferma Finale (Mostrato se viene selezionato uno slot) ---
+    if selected_slot_option != "Seleziona un orario...":
+        
+        try:
+            barbiere_id_finale = slot_to_barbiere_map[selected_slot_option]
+        except KeyError:
+            st.warning("Seleziona di nuovo l'orario, errore interno nel mapping.")
+            st.session_state.pop('prenotazione_finale', None)
+            return
+
+        barbiere_nome_finale = (BARBIERE_INDIFFERENTE if barbiere_id_finale is None
+                                else configurazione.barbieri[barbiere_id_finale])
+        
+        ora_inizio_finale = selected_slot_option 
+        
+        
+        # Aggiorna lo stato della prenotazione in session_state
+        # Confronto su barbiere e data oltre che sull'ora: passare a "Indifferente" non deve lasciare il barbiere di prima
+        prenotazione_corrente = st.session_state.get('prenotazione_finale', {})
+        if (prenotazione_corrente.get('ora_inizio') != ora_inizio_finale
+                or prenotazione_corrente.get('barbiere_id') != barbiere_id_finale
+                or prenotazione_corrente.get('data') != data_scelta.strftime("%d/%m/%Y")):
+            st.session_state['prenotazione_finale'] = {
+                'barbiere_id': barbiere_id_finale,
+                'barbiere_nome': barbiere_nome_finale,
+                'data': data_scelta.strftime("%d/%m/%Y"),
+                'ora_inizio': ora_inizio_finale,
+                'servizio': service_selection 
+            }
+        
+        
+    if len(final_options) <= 1 and selected_slot_option == "Seleziona un orario...":
+        st.warning("Nessun orario disponibile per la data e il servizio selezionato.")
+        
+        
+    # --- Modulo di Conferma Dati Cliente (Mostrato dopo la selezione dello slot) ---
+    if 'prenotazione_finale' in st.session_state and selected_slot_option != "Seleziona un orario...":
+        mostra_modulo_conferma()
+    
+    mostra_accesso_admin()
+
+
+# --- 6. AVVIO APPLICAZIONE (Logica di inizializzazione forzata) ---
+
+@st.cache_resource
+def inizializza_database():
+    """
+    Tabelle e migrazioni una volta per processo: init_db sono una ventina di istruzioni DDL/PRAGMA,
+    troppe per ogni rerun. Se fallisce non viene messo in cache e il rerun successivo riprova.
+    """
+    init_db()
+    return True
+
+def registra_statistiche_rerun(statistiche_db):
+    """Logga le statistiche DB del rerun e le conserva per il pannello admin; segnala leak e N+1."""
+    dati = statistiche_db.come_dict()
+    st.session_state['ultime_statistiche_db'] = dati
+    logger.info("Rerun (%s): %s", st.session_state.get('current_view'), dati)
+
+    if statistiche_db.connessioni_non_restituite > 0:
+        logger.warning("Rerun con %d connessioni non restituite al pool: sessione non chiusa?",
+                       statistiche_db.connessioni_non_restituite)
+    if statistiche_db.query > SOGLIA_QUERY_PER_RERUN:
+        logger.warning("Rerun con %d query (soglia %d): possibile pattern N+1.",
+                       statistiche_db.query, SOGLIA_QUERY_PER_RERUN)
+
+
+if __name__ == "__main__":
+    
+    # AZIONE CRITICA: il DB deve essere inizializzato prima di qualsiasi lettura (una volta per processo).
+    try:
+        inizializza_database()
+    except Exception as e:
+        st.error(f"Errore critico di inizializzazione del database. L'app non può funzionare. Dettagli: {e}")
+        st.stop()
+            
+    
+    if 'current_view' not in st.session_state:
+        st.session_state['current_view'] = 'client'
+        
+    # Contabilità DB del rerun: query, connessioni aperte, tempo speso nel DB e sessioni non chiuse
+    with misura_db() as statistiche_db, profilatore.fase(f"rerun_{st.session_state['current_view']}"):
+        try:
+            if st.session_state['current_view'] == 'admin':
+                admin_app()
+            else:
+                main_app()
+        finally:
+            registra_statistiche_rerun(statistiche_db)
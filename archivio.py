@@ -0,0 +1,201 @@
+# File: archivio.py
+
+import argparse
+import sys
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import delete, func, insert, select, union_all
+
+from core.db import get_engine, sessione, init_db, intervallo_giorni
+from core.modelli import Prenotazione, PrenotazioneArchiviata, NotificaOutbox
+from core.istantanea import CONSERVA_REGISTRO, elimina_registro_modifiche
+from core.cache_disponibilita import cache_disponibilita
+
+# --- Archiviazione e conservazione delle prenotazioni passate ---
+# Il flusso clienti guarda solo da oggi in avanti, ma la tabella prenotazioni cresceva per sempre.
+# Qui le prenotazioni più vecchie di ARCHIVIA_DOPO_GIORNI vengono spostate in prenotazioni_archivio
+# (INSERT ... SELECT + DELETE per lotti, ognuno in una breve transazione immediata, così le
+# prenotazioni dei clienti non restano bloccate). Oltre CONSERVA_ANNI l'archivio viene eliminato.
+#
+#   python archivio.py                      # applica la politica predefinita
+#   python archivio.py --giorni 30 --conserva-anni 5 --simula
+
+ARCHIVIA_DOPO_GIORNI = 90
+CONSERVA_ANNI = 10
+DIMENSIONE_LOTTO = 2000
+# Lo storico mostrato nel pannello admin viene troncato oltre questo numero di righe
+MAX_RIGHE_STORICO = 1000
+
+_COLONNE = ('barbiere_id', 'data_appuntamento', 'ora_inizio', 'ora_fine', 'servizio', 'cliente_nome', 'cliente_telefono')
+
+
+def limite_archiviazione(giorni: int = ARCHIVIA_DOPO_GIORNI, oggi: date = None) -> datetime:
+    """Le prenotazioni con data_appuntamento precedente a questo istante vanno in archivio."""
+    if oggi is None:
+        oggi = date.today()
+    return datetime.combine(oggi - timedelta(days=giorni), time.min)
+
+
+def limite_conservazione(anni: int = CONSERVA_ANNI, oggi: date = None) -> datetime:
+    """Le prenotazioni archiviate precedenti a questo istante vengono eliminate."""
+    if oggi is None:
+        oggi = date.today()
+    try:
+        giorno = oggi.replace(year=oggi.year - anni)
+    except ValueError:
+        # 29 febbraio verso un anno non bisestile
+        giorno = oggi.replace(year=oggi.year - anni, day=28)
+    return datetime.combine(giorno, time.min)
+
+
+def conta_da_archiviare(limite: datetime) -> int:
+    with sessione() as db:
+        return db.execute(
+            select(func.count()).select_from(Prenotazione).where(Prenotazione.data_appuntamento < limite)
+        ).scalar()
+
+
+def archivia_prenotazioni(limite: datetime, dimensione_lotto: int = DIMENSIONE_LOTTO) -> int:
+    """
+    Sposta in archivio, a lotti, le prenotazioni con data_appuntamento < limite.
+    Ogni lotto è copiato e cancellato nella stessa transazione: una riga non è mai in entrambe
+    le tabelle né in nessuna. Restituisce quante prenotazioni ha spostato.
+    """
+    # L'ID della tabella calda va in id_originale: l'archivio ha una chiave propria (vedi core/modelli.py)
+    colonne_archivio = ['id_originale', *_COLONNE]
+    colonne_calde = [Prenotazione.id, *(getattr(Prenotazione, nome) for nome in _COLONNE)]
+    spostate = 0
+    while True:
+        with sessione(immediata=True) as db:
+            # Range sull'indice di data_appuntamento: il lotto più vecchio, senza scandire la tabella
+            ids = db.execute(
+                select(Prenotazione.id).where(Prenotazione.data_appuntamento < limite)
+                .order_by(Prenotazione.data_appuntamento).limit(dimensione_lotto)
+            ).scalars().all()
+            if not ids:
+                break
+
+            db.execute(
+                insert(PrenotazioneArchiviata).from_select(
+                    colonne_archivio, select(*colonne_calde).where(Prenotazione.id.in_(ids))
+                )
+            )
+            db.execute(delete(Prenotazione).where(Prenotazione.id.in_(ids)))
+        spostate += len(ids)
+
+    if spostate:
+        # Giorni passati, ma eventuali voci in cache non devono sopravvivere alle righe spostate
+        cache_disponibilita.svuota()
+    return spostate
+
+
+def elimina_archivio_scaduto(limite: datetime, dimensione_lotto: int = DIMENSIONE_LOTTO) -> int:
+    """Politica di conservazione: elimina a lotti le prenotazioni archiviate precedenti a `limite`."""
+    eliminate = 0
+    while True:
+        with sessione(immediata=True) as db:
+            ids = db.execute(
+                select(PrenotazioneArchiviata.id).where(PrenotazioneArchiviata.data_appuntamento < limite)
+                .order_by(PrenotazioneArchiviata.data_appuntamento).limit(dimensione_lotto)
+            ).scalars().all()
+            if not ids:
+                break
+            db.execute(delete(PrenotazioneArchiviata).where(PrenotazioneArchiviata.id.in_(ids)))
+        eliminate += len(ids)
+    return eliminate
+
+
+def elimina_notifiche_concluse(limite: datetime) -> int:
+    """Le notifiche già inviate (o fallite definitivamente) prima del limite non servono più."""
+    with sessione(immediata=True) as db:
+        return db.execute(
+            delete(NotificaOutbox).where(
+                NotificaOutbox.stato.in_(("inviata", "fallita")),
+                NotificaOutbox.creata_il < limite
+            )
+        ).rowcount
+
+
+def applica_politica(giorni: int = ARCHIVIA_DOPO_GIORNI, conserva_anni: int = CONSERVA_ANNI,
+                     dimensione_lotto: int = DIMENSIONE_LOTTO, oggi: date = None) -> dict:
+    """Archiviazione + conservazione + pulizia di outbox e registro modifiche; restituisce i conteggi."""
+    limite = limite_archiviazione(giorni, oggi)
+    rapporto = {
+        'archiviate': archivia_prenotazioni(limite, dimensione_lotto),
+        'eliminate_archivio': elimina_archivio_scaduto(limite_conservazione(conserva_anni, oggi), dimensione_lotto)
+                              if conserva_anni else 0,
+        'notifiche_eliminate': elimina_notifiche_concluse(limite),
+        'modifiche_eliminate': elimina_registro_modifiche(datetime.now() - CONSERVA_REGISTRO),
+    }
+    # Statistiche aggiornate per il pianificatore dopo uno spostamento consistente
+    with get_engine().begin() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+    return rapporto
+
+
+# --- Consultazione dello storico (pannello admin) ---
+
+def leggi_storico(data_inizio: date, data_fine: date, barbiere_id=None, limite_righe: int = MAX_RIGHE_STORICO) -> list:
+    """
+    Prenotazioni dell'intervallo (inclusi) prese sia dall'archivio sia dalla tabella calda,
+    in ordine di orario, come dict. Ogni ramo usa l'indice (barbiere, data) o quello sulla data.
+    """
+    inizio, fine = intervallo_giorni(data_inizio, data_fine)
+
+    def ramo(tabella):
+        filtri = [tabella.data_appuntamento >= inizio, tabella.data_appuntamento < fine]
+        if barbiere_id is not None:
+            filtri.append(tabella.barbiere_id == barbiere_id)
+        return select(
+            tabella.barbiere_id, tabella.ora_inizio, tabella.ora_fine,
+            tabella.servizio, tabella.cliente_nome, tabella.cliente_telefono
+        ).where(*filtri)
+
+    unione = union_all(ramo(PrenotazioneArchiviata), ramo(Prenotazione)).subquery()
+    with sessione() as db:
+        righe = db.execute(select(unione).order_by(unione.c.ora_inizio).limit(limite_righe)).all()
+    return [
+        {
+            'barbiere_id': barbiere, 'inizio': ora_inizio, 'fine': ora_fine,
+            'servizio': servizio, 'cliente_nome': cliente_nome, 'cliente_telefono': cliente_telefono,
+        }
+        for barbiere, ora_inizio, ora_fine, servizio, cliente_nome, cliente_telefono in righe
+    ]
+
+
+def statistiche_archivio() -> dict:
+    """Righe nella tabella calda e in archivio, per la diagnostica."""
+    with sessione() as db:
+        return {
+            'prenotazioni': db.execute(select(func.count()).select_from(Prenotazione)).scalar(),
+            'archiviate': db.execute(select(func.count()).select_from(PrenotazioneArchiviata)).scalar(),
+        }
+
+
+# --- Riga di comando ---
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python archivio.py", description="Archiviazione delle prenotazioni passate.")
+    parser.add_argument("--giorni", type=int, default=ARCHIVIA_DOPO_GIORNI,
+                        help="Archivia le prenotazioni più vecchie di tanti giorni")
+    parser.add_argument("--conserva-anni", type=int, default=CONSERVA_ANNI,
+                        help="Elimina dall'archivio le prenotazioni più vecchie di tanti anni (0 = mai)")
+    parser.add_argument("--lotto", type=int, default=DIMENSIONE_LOTTO, help="Righe spostate per transazione")
+    parser.add_argument("--simula", action="store_true", help="Mostra solo quante righe verrebbero archiviate")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.simula:
+        limite = limite_archiviazione(args.giorni)
+        print(f"Da archiviare (prima del {limite:%d/%m/%Y}): {conta_da_archiviare(limite)}")
+        return 0
+
+    rapporto = applica_politica(args.giorni, args.conserva_anni, args.lotto)
+    print(f"Archiviate {rapporto['archiviate']}, eliminate dall'archivio {rapporto['eliminate_archivio']}, "
+          f"notifiche eliminate {rapporto['notifiche_eliminate']}, registro modifiche {rapporto['modifiche_eliminate']}")
+    print(f"Situazione: {statistiche_archivio()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+# File: benchmark/__init__.py
+#
+# Benchmark dei percorsi critici (disponibilità, letture, insert, delete) su database sintetici.
+# Uso: python -m benchmark --help
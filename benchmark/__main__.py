@@ -0,0 +1,170 @@
+# File: benchmark/__main__.py
+#
+# Esegue i benchmark dei percorsi critici su database sintetici di varie dimensioni
+# e confronta i risultati con una baseline salvata.
+#
+#   python -m benchmark                          # esegue e confronta con benchmark/baseline.json
+#   python -m benchmark --salva-baseline         # esegue e salva i risultati come nuova baseline
+#   python -m benchmark --dimensioni settimana,anno --tolleranza 0.3
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from statistics import median
+from time import perf_counter
+
+from benchmark.generatore import DIMENSIONI, GIORNI_FUTURI, genera_database
+from core.configurazione import SERVIZI, ORARI_APERTURA, SLOT_CADENZA, GIORNI_CHIUSURA
+from core.disponibilita import giorni_lavorativi
+
+BASELINE_PREDEFINITA = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _cronometra(funzione, argomenti: list) -> dict:
+    """Esegue `funzione(*a)` per ogni a in argomenti e restituisce mediana e p95 in microsecondi."""
+    durate = []
+    for a in argomenti:
+        inizio = perf_counter()
+        funzione(*a)
+        durate.append(perf_counter() - inizio)
+    durate.sort()
+    return {
+        'mediana_us': round(median(durate) * 1e6, 1),
+        'p95_us': round(durate[int(0.95 * (len(durate) - 1))] * 1e6, 1),
+        'chiamate': len(durate),
+    }
+
+
+def esegui_dimensione(cartella: str, nome: str, giorni_storico: int, barbieri: int, ripetizioni: int, seed: int) -> dict:
+    """Genera il database per una dimensione e cronometra le operazioni critiche."""
+    # Import ritardati: agenda/servizio usano SessionLocal, che genera_database ricollega al DB sintetico
+    from core import agenda
+    from core.db import sessione
+    from core.modelli import Prenotazione, normalizza_telefono
+    from core.servizio_prenotazioni import crea_prenotazione
+    from core.clienti import cerca_clienti, storico_cliente
+
+    oggi = date.today()
+    righe = genera_database(f"sqlite:///{os.path.join(cartella, nome + '.db')}", giorni_storico, barbieri, seed=seed, oggi=oggi)
+    rnd = random.Random(seed)
+    barbieri_ids = list(range(1, barbieri + 1))
+
+    # Giorni lavorativi casuali nell'intervallo generato (storico + futuro), estratti dai soli giorni aperti:
+    # spostare di un giorno quelli chiusi non basta con più giorni di chiusura consecutivi (domenica e lunedì)
+    giorni_aperti = list(giorni_lavorativi(oggi - timedelta(days=giorni_storico), oggi + timedelta(days=GIORNI_FUTURI)))
+    giorni = [rnd.choice(giorni_aperti) for _ in range(ripetizioni)]
+
+    risultati = {'righe': righe}
+
+    argomenti_fetch = [(rnd.choice(barbieri_ids), g) for g in giorni]
+    risultati['fetch_prenotazioni_per_barbiere'] = _cronometra(agenda.fetch_prenotazioni_per_barbiere, argomenti_fetch)
+
+    # Disponibilità: solo calcolo, sulle prenotazioni già lette dei giorni campionati
+    argomenti_orari = [
+        (g, rnd.choice(list(SERVIZI.values())), agenda.fetch_prenotazioni_per_barbiere(b, g))
+        for b, g in argomenti_fetch
+    ]
+    risultati['get_orari_disponibili'] = _cronometra(agenda.get_orari_disponibili, argomenti_orari)
+
+    # Insert: slot liberi in giorni successivi all'intervallo generato
+    primo_giorno_libero = oggi + timedelta(days=GIORNI_FUTURI + 1)
+    argomenti_insert = []
+    giorno, indice = primo_giorno_libero, 0
+    while len(argomenti_insert) < ripetizioni:
+        if giorno.weekday() not in GIORNI_CHIUSURA:
+            for barbiere_id in barbieri_ids:
+                inizio = datetime.combine(giorno, ORARI_APERTURA[0][0]) + indice * SLOT_CADENZA
+                argomenti_insert.append((barbiere_id, inizio, inizio + SLOT_CADENZA, "Taglio Uomo (30 min)", "Bench", "3000000000"))
+        indice += 1
+        if indice >= 8:
+            giorno, indice = giorno + timedelta(days=1), 0
+    risultati['crea_prenotazione'] = _cronometra(crea_prenotazione, argomenti_insert[:ripetizioni])
+
+    # Delete: prenotazioni esistenti scelte a caso
+    with sessione() as db:
+        ids = [riga[0] for riga in db.query(Prenotazione.id).order_by(Prenotazione.id).all()]
+    argomenti_delete = [(i,) for i in rnd.sample(ids, min(ripetizioni, len(ids)))]
+    risultati['delete_appointment'] = _cronometra(agenda.delete_appointment, argomenti_delete)
+
+    # Ricerca clienti per prefisso (4 cifre: migliaia di righe nel range) e storico di un cliente
+    with sessione() as db:
+        telefoni = [riga[0] for riga in db.query(Prenotazione.cliente_telefono).order_by(Prenotazione.id).limit(5000).all()]
+    campione = [rnd.choice(telefoni) for _ in range(ripetizioni)]
+    risultati['cerca_clienti'] = _cronometra(cerca_clienti, [(normalizza_telefono(t)[:4],) for t in campione])
+    risultati['storico_cliente'] = _cronometra(storico_cliente, [(t,) for t in campione])
+
+    return risultati
+
+
+def confronta(risultati: dict, baseline: dict, tolleranza: float) -> list:
+    """Restituisce le regressioni: operazioni con mediana oltre baseline × (1 + tolleranza)."""
+    regressioni = []
+    for dimensione, operazioni in risultati.items():
+        for operazione, misura in operazioni.items():
+            riferimento = baseline.get(dimensione, {}).get(operazione)
+            if not isinstance(misura, dict) or not riferimento:
+                continue
+            limite = riferimento['mediana_us'] * (1 + tolleranza)
+            if misura['mediana_us'] > limite:
+                regressioni.append(
+                    f"{dimensione}/{operazione}: {misura['mediana_us']} µs > {limite:.1f} µs "
+                    f"(baseline {riferimento['mediana_us']} µs)"
+                )
+    return regressioni
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark dei percorsi critici.")
+    parser.add_argument("--dimensioni", default=",".join(DIMENSIONI),
+                        help=f"Dimensioni da eseguire, separate da virgola ({', '.join(DIMENSIONI)})")
+    parser.add_argument("--barbieri", type=int, default=2)
+    parser.add_argument("--ripetizioni", type=int, default=200, help="Chiamate cronometrate per operazione")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PREDEFINITA)
+    parser.add_argument("--salva-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--tolleranza", type=float, default=0.5,
+                        help="Rallentamento ammesso rispetto alla baseline (0.5 = +50%%)")
+    args = parser.parse_args(argv)
+
+    risultati = {}
+    with tempfile.TemporaryDirectory(prefix="natillo_bench_") as cartella:
+        for nome in args.dimensioni.split(","):
+            nome = nome.strip()
+            if nome not in DIMENSIONI:
+                parser.error(f"Dimensione sconosciuta: {nome}")
+            risultati[nome] = esegui_dimensione(cartella, nome, DIMENSIONI[nome], args.barbieri, args.ripetizioni, args.seed)
+
+            print(f"\n== {nome} ({risultati[nome]['righe']} prenotazioni) ==")
+            for operazione, misura in risultati[nome].items():
+                if isinstance(misura, dict):
+                    print(f"  {operazione:<34} mediana {misura['mediana_us']:>10} µs   p95 {misura['p95_us']:>10} µs")
+
+    if args.salva_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, indent=2, sort_keys=True)
+        print(f"\nBaseline salvata in {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNessuna baseline in {args.baseline}: eseguire con --salva-baseline per crearla.")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        regressioni = confronta(risultati, json.load(f), args.tolleranza)
+
+    if regressioni:
+        print("\nREGRESSIONI rispetto alla baseline:")
+        for regressione in regressioni:
+            print(f"  - {regressione}")
+        return 1
+
+    print("\nNessuna regressione rispetto alla baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# File: benchmark/carico.py
+#
+# Load test del flusso di prenotazione: molte sessioni cliente simulate, in thread (ed eventualmente
+# in più processi, come più server Streamlit sullo stesso appuntamenti.db), chiamano direttamente la
+# logica di prenotazione: scelta servizio -> barbiere -> data -> orari liberi -> conferma.
+#
+#   python -m benchmark.carico --sessioni 2000 --thread 16
+#   python -m benchmark.carico --processi 4 --thread 8 --db /tmp/carico.db
+#   python -m benchmark.carico --processi 4 --istantanea   # letture dall'istantanea condivisa per processo
+#   python -m benchmark.carico --qualsiasi 0.5             # metà dei clienti sceglie "barbiere indifferente"
+#
+# Riporta throughput, percentili di latenza, tasso di OperationalError, conflitti (slot preso da
+# un'altra sessione) e prenotazioni doppie trovate nel DB a fine prova (devono essere zero).
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from time import perf_counter
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from benchmark.generatore import genera_database
+
+FASI = ('disponibilita', 'prenotazione', 'sessione')
+
+
+def _sessione_cliente(rnd: random.Random, giorni: list, barbieri_ids: list, istantanea=None,
+                      quota_qualsiasi: float = 0.0) -> dict:
+    """Una sessione simulata; restituisce esito e latenze (in secondi) delle fasi."""
+    from core.agenda import get_orari_disponibili_barbiere, get_orari_disponibili_qualsiasi
+    from core.calendario import configurazione_corrente
+    from core.servizio_prenotazioni import crea_prenotazione, crea_prenotazione_qualsiasi, SlotNonDisponibile
+
+    nome_servizio, durata = rnd.choice(list(configurazione_corrente().servizi.items()))
+    barbiere_id = rnd.choice(barbieri_ids)
+    giorno = rnd.choice(giorni)
+    # None = barbiere indifferente; con quota 0 la sequenza casuale resta quella di sempre
+    if quota_qualsiasi and rnd.random() < quota_qualsiasi:
+        barbiere_id = None
+    esito = {'latenze': {}}
+
+    inizio_sessione = perf_counter()
+    try:
+        inizio = perf_counter()
+        if barbiere_id is None:
+            liberi = get_orari_disponibili_qualsiasi(giorno, durata, istantanea=istantanea)
+        else:
+            liberi = get_orari_disponibili_barbiere(barbiere_id, giorno, durata, istantanea=istantanea)
+        esito['latenze']['disponibilita'] = perf_counter() - inizio
+
+        if not liberi:
+            esito['risultato'] = 'nessuno_slot'
+        else:
+            slot = rnd.choice(liberi)
+            inizio = perf_counter()
+            try:
+                argomenti = (slot, slot + timedelta(minutes=durata),
+                             f"{nome_servizio} ({durata} min)", "Carico", f"3{rnd.randrange(10**9):09d}")
+                if barbiere_id is None:
+                    crea_prenotazione_qualsiasi(*argomenti)
+                else:
+                    crea_prenotazione(barbiere_id, *argomenti)
+                esito['risultato'] = 'prenotata'
+            except SlotNonDisponibile:
+                esito['risultato'] = 'conflitto'
+            esito['latenze']['prenotazione'] = perf_counter() - inizio
+    except OperationalError:
+        esito['risultato'] = 'operational_error'
+
+    esito['latenze']['sessione'] = perf_counter() - inizio_sessione
+    return esito
+
+
+def _esegui_worker(url: str, sessioni: int, thread: int, giorni: list, barbieri_ids: list, seed: int,
+                   usa_istantanea: bool = False, quota_qualsiasi: float = 0.0) -> list:
+    """Esegue `sessioni` sessioni su `thread` thread nel processo corrente."""
+    from core.db import configura_database
+    from core.istantanea import IstantaneaAgenda
+    configura_database(url)
+    # Come get_istantanea_agenda in app.py: una per processo, condivisa dai thread
+    istantanea = IstantaneaAgenda() if usa_istantanea else None
+
+    semi = random.Random(seed)
+    locale = threading.local()
+
+    def esegui(_):
+        if not hasattr(locale, 'rnd'):
+            locale.rnd = random.Random(semi.random())
+        return _sessione_cliente(locale.rnd, giorni, barbieri_ids, istantanea, quota_qualsiasi)
+
+    with ThreadPoolExecutor(max_workers=thread) as pool:
+        return list(pool.map(esegui, range(sessioni)))
+
+
+def _percentili(valori: list) -> dict:
+    if not valori:
+        return {}
+    valori = sorted(valori)
+    def p(q):
+        return round(valori[min(int(q * len(valori)), len(valori) - 1)] * 1000, 2)
+    return {'p50_ms': p(0.50), 'p95_ms': p(0.95), 'p99_ms': p(0.99), 'max_ms': round(valori[-1] * 1000, 2)}
+
+
+def conta_prenotazioni_doppie(url: str) -> int:
+    """Coppie di prenotazioni dello stesso barbiere che si sovrappongono."""
+    from core.db import configura_database, get_engine
+    configura_database(url)
+    with get_engine().connect() as conn:
+        return conn.execute(text(
+            "SELECT COUNT(*) FROM prenotazioni a JOIN prenotazioni b "
+            "ON a.barbiere_id = b.barbiere_id AND a.id < b.id "
+            "AND a.data_appuntamento >= date(b.data_appuntamento) "
+            "AND a.data_appuntamento < date(b.data_appuntamento, '+1 day') "
+            "AND a.ora_inizio < b.ora_fine AND b.ora_inizio < a.ora_fine"
+        )).scalar()
+
+
+def esegui_carico(url: str, sessioni: int, thread: int, processi: int, giorni: int, barbieri: int, seed: int,
+                  usa_istantanea: bool = False, quota_qualsiasi: float = 0.0) -> dict:
+    """Lancia il carico e restituisce il rapporto aggregato."""
+    from core.disponibilita import giorni_lavorativi
+
+    giorni_disponibili = list(giorni_lavorativi(date.today() + timedelta(days=1), date.today() + timedelta(days=giorni)))
+    barbieri_ids = list(range(1, barbieri + 1))
+
+    inizio = perf_counter()
+    if processi <= 1:
+        esiti = _esegui_worker(url, sessioni, thread, giorni_disponibili, barbieri_ids, seed, usa_istantanea,
+                               quota_qualsiasi)
+    else:
+        quote = [sessioni // processi + (1 if i < sessioni % processi else 0) for i in range(processi)]
+        with ProcessPoolExecutor(max_workers=processi) as pool:
+            futuri = [
+                pool.submit(_esegui_worker, url, quota, thread, giorni_disponibili, barbieri_ids, seed + i, usa_istantanea,
+                            quota_qualsiasi)
+                for i, quota in enumerate(quote)
+            ]
+            esiti = [esito for futuro in futuri for esito in futuro.result()]
+    durata = perf_counter() - inizio
+
+    conteggi = {}
+    for esito in esiti:
+        conteggi[esito['risultato']] = conteggi.get(esito['risultato'], 0) + 1
+
+    return {
+        'sessioni': len(esiti),
+        'durata_s': round(durata, 2),
+        'sessioni_al_s': round(len(esiti) / durata, 1),
+        'prenotazioni_al_s': round(conteggi.get('prenotata', 0) / durata, 1),
+        'esiti': conteggi,
+        'tasso_operational_error': round(conteggi.get('operational_error', 0) / len(esiti), 4) if esiti else 0.0,
+        'tasso_conflitti': round(conteggi.get('conflitto', 0) / len(esiti), 4) if esiti else 0.0,
+        'latenze': {fase: _percentili([e['latenze'][fase] for e in esiti if fase in e['latenze']]) for fase in FASI},
+        'prenotazioni_doppie': conta_prenotazioni_doppie(url),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark.carico", description="Load test del flusso di prenotazione.")
+    parser.add_argument("--sessioni", type=int, default=1000, help="Sessioni cliente simulate in totale")
+    parser.add_argument("--thread", type=int, default=16, help="Thread per processo")
+    parser.add_argument("--processi", type=int, default=1, help="Processi (come più server Streamlit)")
+    parser.add_argument("--giorni", type=int, default=30, help="Giorni futuri tra cui scelgono i clienti")
+    parser.add_argument("--barbieri", type=int, default=2)
+    parser.add_argument("--storico", type=int, default=30, help="Giorni di storico sintetico pre-caricati")
+    parser.add_argument("--db", help="File SQLite da usare (default: file temporaneo)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--istantanea", action="store_true",
+                        help="Disponibilità letta dall'istantanea condivisa (una per processo)")
+    parser.add_argument("--qualsiasi", type=float, default=0.0,
+                        help="Frazione di sessioni in modalità barbiere indifferente (0-1)")
+    args = parser.parse_args(argv)
+
+    percorso = args.db or os.path.join(tempfile.mkdtemp(prefix="natillo_carico_"), "carico.db")
+    url = f"sqlite:///{percorso}"
+    righe = genera_database(url, args.storico, args.barbieri, riempimento=0.3, seed=args.seed)
+    print(f"Database {percorso}: {righe} prenotazioni pre-caricate")
+
+    rapporto = esegui_carico(url, args.sessioni, args.thread, args.processi, args.giorni, args.barbieri, args.seed,
+                             args.istantanea, args.qualsiasi)
+
+    print(f"\nSessioni: {rapporto['sessioni']} in {rapporto['durata_s']} s "
+          f"({rapporto['sessioni_al_s']} sessioni/s, {rapporto['prenotazioni_al_s']} prenotazioni/s)")
+    print(f"Esiti: {rapporto['esiti']}")
+    print(f"OperationalError: {rapporto['tasso_operational_error']:.2%}   Conflitti: {rapporto['tasso_conflitti']:.2%}")
+    for fase, percentili in rapporto['latenze'].items():
+        print(f"  {fase:<14} {percentili}")
+    print(f"Prenotazioni doppie nel DB: {rapporto['prenotazioni_doppie']}")
+
+    return 1 if rapporto['prenotazioni_doppie'] or rapporto['esiti'].get('operational_error') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# File: benchmark/generatore.py
+
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert
+
+from core import db as database
+from core.modelli import Base, Barbiere, OrarioBarbiere, Prenotazione
+from core.configurazione import BARBIERI, SERVIZI, ORARI_APERTURA, SLOT_CADENZA, GIORNI_CHIUSURA
+from core.disponibilita import giorni_lavorativi
+
+# --- Generatore di database sintetici ---
+# Riempie la tabella prenotazioni con barbieri, giorni e densità configurabili, da una settimana
+# a diversi anni di storico. Le prenotazioni di uno stesso barbiere non si sovrappongono mai,
+# come nel database reale.
+
+# Dimensioni predefinite: giorni di storico generati (più 30 giorni futuri)
+DIMENSIONI = {
+    'settimana': 7,
+    'trimestre': 90,
+    'anno': 365,
+    'triennio': 3 * 365,
+}
+
+GIORNI_FUTURI = 30
+BLOCCO_INSERT = 5000
+# Clienti abituali: ogni prenotazione ne sceglie uno, con il telefono scritto come lo digitano i clienti
+CLIENTI = 100000
+FORMATI_TELEFONO = 4
+
+
+def _cliente(numero: int, formato: int) -> dict:
+    """Nome e telefono del cliente `numero`; il telefono in uno dei FORMATI_TELEFONO formati liberi."""
+    telefono = f"3{numero * 7919 % 10**9:09d}"
+    telefono = (telefono, f"+39 {telefono}", f"{telefono[:3]}-{telefono[3:]}", f"0039{telefono}")[formato]
+    return {'cliente_nome': f"Cliente {numero}", 'cliente_telefono': telefono}
+
+
+def genera_prenotazioni(barbieri_ids, data_inizio: date, data_fine: date, riempimento: float = 0.7, seed: int = 0):
+    """
+    Genera dict di prenotazioni non sovrapposte per ogni barbiere e giorno aperto in [data_inizio, data_fine].
+    `riempimento` è la probabilità che uno slot libero venga occupato.
+    """
+    rnd = random.Random(seed)
+    servizi = list(SERVIZI.items())
+
+    for giorno in giorni_lavorativi(data_inizio, data_fine):
+        for barbiere_id in barbieri_ids:
+            for start_time, end_time in ORARI_APERTURA:
+                corrente = datetime.combine(giorno, start_time)
+                limite = datetime.combine(giorno, end_time)
+
+                while corrente < limite:
+                    nome_servizio, durata = rnd.choice(servizi)
+                    fine = corrente + timedelta(minutes=durata)
+                    if fine > limite:
+                        break
+                    if rnd.random() < riempimento:
+                        yield {
+                            'barbiere_id': barbiere_id,
+                            'data_appuntamento': corrente,
+                            'ora_inizio': corrente,
+                            'ora_fine': fine,
+                            'servizio': f"{nome_servizio} ({durata} min)",
+                            **_cliente(rnd.randrange(CLIENTI), rnd.randrange(FORMATI_TELEFONO)),
+                        }
+                        corrente = fine
+                    else:
+                        corrente += SLOT_CADENZA
+
+
+def genera_database(url: str, giorni_storico: int, barbieri: int = 2, riempimento: float = 0.7,
+                    seed: int = 0, oggi: date = None) -> int:
+    """
+    Crea (o ricrea) il database `url` con `giorni_storico` giorni passati e GIORNI_FUTURI giorni futuri.
+    Collega SessionLocal al nuovo database e restituisce il numero di prenotazioni inserite.
+    """
+    if oggi is None:
+        oggi = date.today()
+
+    database.configura_database(url)
+    Base.metadata.drop_all(bind=database.get_engine())
+    database.init_db()
+    _aggiungi_barbieri(barbieri)
+
+    righe = genera_prenotazioni(
+        range(1, barbieri + 1), oggi - timedelta(days=giorni_storico), oggi + timedelta(days=GIORNI_FUTURI),
+        riempimento, seed
+    )
+
+    totale = 0
+    blocco = []
+    for riga in righe:
+        blocco.append(riga)
+        if len(blocco) >= BLOCCO_INSERT:
+            totale += _inserisci_blocco(blocco)
+            blocco = []
+    if blocco:
+        totale += _inserisci_blocco(blocco)
+
+    with database.get_engine().begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    return totale
+
+
+def _aggiungi_barbieri(barbieri: int):
+    """Oltre ai barbieri di configurazione.py (già inseriti da init_db) aggiunge gli altri con gli stessi orari."""
+    nuovi = [barbiere_id for barbiere_id in range(1, barbieri + 1) if barbiere_id not in BARBIERI]
+    if not nuovi:
+        return
+    with database.sessione() as db:
+        db.execute(insert(Barbiere), [{'id': b, 'nome': f"Barbiere {b}", 'attivo': True} for b in nuovi])
+        db.execute(insert(OrarioBarbiere), [
+            {'barbiere_id': b, 'giorno_settimana': giorno, 'inizio': inizio, 'fine': fine}
+            for b in nuovi
+            for giorno in range(7) if giorno not in GIORNI_CHIUSURA
+            for inizio, fine in ORARI_APERTURA
+        ])
+
+
+def _inserisci_blocco(blocco: list) -> int:
+    """Insert in stile executemany: un'unica istruzione per tutto il blocco."""
+    with database.sessione() as db:
+        db.execute(insert(Prenotazione), blocco)
+    return len(blocco)
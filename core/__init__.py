@@ -0,0 +1,4 @@
+# File: core/__init__.py
+#
+# Motore del gestionale (database, configurazione, disponibilità, prenotazioni, notifiche) senza
+# dipendenze da Streamlit: app.py è solo l'interfaccia, script e job batch importano da qui.
@@ -0,0 +1,207 @@
+# File: core/agenda.py
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from core.db import sessione, intervallo_giorni, query_intervalli_barbiere, query_intervalli
+from core.modelli import Prenotazione
+from core.calendario import configurazione_corrente
+from core.occupazione import (
+    orari_liberi_bitmap, orari_liberi_intervallo_bitmap, itera_orari_liberi, orari_liberi_modello, unione_orari_liberi,
+)
+from core.disponibilita import giorni_lavorativi
+from core.cache_disponibilita import cache_disponibilita, QUALSIASI_BARBIERE
+from core.profilazione import profilatore
+from core.servizio_prenotazioni import modifica_prenotazioni
+
+# Logica di agenda estratta da app.py: nessuna dipendenza da Streamlit, così benchmark, job batch
+# e script la importano senza caricare l'interfaccia.
+
+# --- LOGICA DI SCHEDULAZIONE (Motore di calcolo disponibilità) ---
+
+def get_orari_disponibili(data_selezionata: date, durata_servizio_min: int, prenotazioni_esistenti: list) -> list:
+    """
+    Calcola gli orari di inizio disponibili per una data e durata specificate.
+    Delegato alla bitmap di occupazione.py (ripiega sullo sweep se i dati non sono allineati ai 5 minuti).
+    """
+    return orari_liberi_bitmap(data_selezionata, durata_servizio_min, prenotazioni_esistenti)
+
+def get_orari_disponibili_intervallo(data_inizio: date, data_fine: date, durata_servizio_min: int, prenotazioni_per_barbiere: dict) -> dict:
+    """
+    Versione batch: orari liberi per ogni giorno aperto dell'intervallo e per ogni barbiere attivo,
+    con gli orari e le ferie della configurazione. Restituisce {barbiere_id: {data: [datetime, ...]}}.
+    """
+    configurazione = configurazione_corrente()
+    return orari_liberi_intervallo_bitmap(
+        data_inizio, data_fine, durata_servizio_min, prenotazioni_per_barbiere, configurazione.barbieri,
+        giorni_chiusura=configurazione.giorni_chiusura, modelli=configurazione.modello
+    )
+
+# --- ACCESSO ALLE PRENOTAZIONI ---
+
+def _leggi_prenotazioni(barbiere_id, data_selezionata: date) -> list:
+    """
+    Coppie (inizio, fine) delle prenotazioni del giorno, senza intercettare gli errori (usata anche dalla cache).
+    Solo le due colonne che servono alla disponibilità: niente oggetti ORM né dict intermedi.
+    """
+    with sessione() as db:
+        # Intervallo semiaperto [giorno, giorno+1): sargable, usa l'indice (barbiere_id, data_appuntamento)
+        inizio, fine = intervallo_giorni(data_selezionata)
+        return query_intervalli_barbiere(db, barbiere_id, inizio, fine).all()
+
+def fetch_prenotazioni_per_barbiere(barbiere_id, data_selezionata: date):
+    """
+    Recupera le prenotazioni REALI dal database, filtrando sulla data, come coppie (inizio, fine).
+    """
+    try:
+        return _leggi_prenotazioni(barbiere_id, data_selezionata)
+    except OperationalError as e:
+        # In caso di errore di lettura all'inizio, restituisce una lista vuota.
+        return []
+
+def _leggi_prenotazioni_intervallo(data_inizio: date, data_fine: date = None, barbieri=None) -> dict:
+    """Come fetch_prenotazioni_intervallo, ma senza intercettare gli errori di lettura."""
+    if barbieri is None:
+        barbieri = configurazione_corrente().barbieri
+    risultati = {barbiere_id: [] for barbiere_id in barbieri}
+
+    with sessione() as db:
+        inizio, fine = intervallo_giorni(data_inizio, data_fine)
+        for barbiere_id, ora_inizio, ora_fine in query_intervalli(db, risultati.keys(), inizio, fine):
+            risultati[barbiere_id].append((ora_inizio, ora_fine))
+    return risultati
+
+def fetch_prenotazioni_intervallo(data_inizio: date, data_fine: date = None, barbieri=None) -> dict:
+    """
+    Recupera con UNA sola query le prenotazioni di tutti i barbieri tra data_inizio e data_fine (inclusi)
+    e le raggruppa in memoria: {barbiere_id: [(inizio, fine) ordinate per ora]}.
+    """
+    try:
+        return _leggi_prenotazioni_intervallo(data_inizio, data_fine, barbieri)
+    except OperationalError as e:
+        # Come fetch_prenotazioni_per_barbiere: in caso di errore di lettura, nessuna prenotazione.
+        return {barbiere_id: [] for barbiere_id in (barbieri if barbieri is not None else configurazione_corrente().barbieri)}
+
+def cerca_primi_slot_liberi(durata_servizio_min: int, data_partenza: date, quanti: int = 5, barbieri=None,
+                            giorni_per_blocco: int = 7, orizzonte_giorni: int = 90, dopo: datetime = None,
+                            istantanea=None) -> list:
+    """
+    Restituisce i `quanti` primi slot liberi come coppie (datetime, barbiere_id), in ordine di orario,
+    cercando tra tutti i barbieri a partire da data_partenza.
+
+    Le prenotazioni vengono lette a blocchi di `giorni_per_blocco` giorni (una query per blocco), i giorni
+    di chiusura sono saltati e la ricerca si ferma appena trovati `quanti` risultati. Gli orari precedenti
+    a `dopo` (default: adesso) sono esclusi. Con `istantanea` (IstantaneaAgenda) i blocchi che cadono
+    nella sua finestra non costano query.
+    """
+    if istantanea is not None:
+        istantanea.aggiorna()
+    configurazione = configurazione_corrente()
+    if barbieri is None:
+        barbieri = configurazione.barbieri
+    if dopo is None:
+        dopo = datetime.now()
+
+    risultati = []
+    limite = data_partenza + timedelta(days=orizzonte_giorni)
+    blocco_inizio = data_partenza
+
+    while blocco_inizio < limite:
+        blocco_fine = min(blocco_inizio + timedelta(days=giorni_per_blocco - 1), limite - timedelta(days=1))
+        giorni = list(giorni_lavorativi(blocco_inizio, blocco_fine, configurazione.giorni_chiusura))
+
+        # Un blocco di soli giorni di chiusura non costa nemmeno una query
+        if giorni:
+            prenotazioni = istantanea.intervalli_per_barbiere(giorni, barbieri) if istantanea is not None else None
+            if prenotazioni is None:
+                prenotazioni = _leggi_prenotazioni_intervallo(giorni[0], giorni[-1], barbieri)
+
+            for giorno, per_barbiere in itera_orari_liberi(giorni, durata_servizio_min, prenotazioni, barbieri,
+                                                           modelli=configurazione.modello):
+                del_giorno = sorted(
+                    (inizio, barbiere_id)
+                    for barbiere_id, orari in per_barbiere.items()
+                    for inizio in orari if inizio >= dopo
+                )
+                risultati.extend(del_giorno[:quanti - len(risultati)])
+                if len(risultati) >= quanti:
+                    return risultati
+
+        blocco_inizio = blocco_fine + timedelta(days=1)
+
+    return risultati
+
+def get_orari_disponibili_barbiere(barbiere_id, data_selezionata: date, durata_servizio_min: int,
+                                   istantanea=None) -> tuple:
+    """
+    Orari liberi per (barbiere, data, durata) serviti dalla cache per-giorno.
+    Un errore di lettura non viene messo in cache: si propaga e il rerun successivo riprova.
+    Con `istantanea` le scritture di altri processi invalidano la cache prima della lettura e i giorni
+    della sua finestra vengono dalla memoria invece che dal database.
+    """
+    if istantanea is not None:
+        istantanea.aggiorna()
+    modello = configurazione_corrente().modello(barbiere_id, data_selezionata, durata_servizio_min)
+    if modello is None:
+        # Barbiere assente quel giorno (riposo settimanale o ferie): nessuna query
+        return ()
+
+    def calcola():
+        with profilatore.fase("db_fetch"):
+            prenotazioni = istantanea.intervalli(barbiere_id, data_selezionata) if istantanea is not None else None
+            if prenotazioni is None:
+                prenotazioni = _leggi_prenotazioni(barbiere_id, data_selezionata)
+        with profilatore.fase("calcolo_slot"):
+            return orari_liberi_modello(data_selezionata, modello, prenotazioni)
+
+    return cache_disponibilita.ottieni(barbiere_id, data_selezionata, durata_servizio_min, calcola)
+
+def get_orari_disponibili_qualsiasi(data_selezionata: date, durata_servizio_min: int, istantanea=None) -> tuple:
+    """
+    Modalità "barbiere indifferente": orari in cui almeno un barbiere attivo è libero.
+    Una sola lettura per tutti i barbieri (dall'istantanea o con una query) e una sola unione di bitmap,
+    invece di una chiamata per barbiere; il risultato va nella stessa cache, sotto QUALSIASI_BARBIERE.
+    Chi sarà il barbiere lo decide crea_prenotazione_qualsiasi alla conferma.
+    """
+    if istantanea is not None:
+        istantanea.aggiorna()
+    configurazione = configurazione_corrente()
+    if not configurazione.aperto(data_selezionata):
+        return ()
+
+    def calcola():
+        barbieri = list(configurazione.barbieri)
+        with profilatore.fase("db_fetch"):
+            prenotazioni = (istantanea.intervalli_per_barbiere([data_selezionata], barbieri)
+                            if istantanea is not None else None)
+            if prenotazioni is None:
+                prenotazioni = _leggi_prenotazioni_intervallo(data_selezionata, data_selezionata, barbieri)
+        with profilatore.fase("calcolo_slot"):
+            return unione_orari_liberi(data_selezionata, durata_servizio_min, prenotazioni, barbieri,
+                                       configurazione.modello)
+
+    return cache_disponibilita.ottieni(QUALSIASI_BARBIERE, data_selezionata, durata_servizio_min, calcola)
+
+def leggi_agenda(data_inizio: date, data_fine: date = None, barbieri=None) -> list:
+    """
+    Righe dell'agenda admin: le prenotazioni di tutti i barbieri tra data_inizio e data_fine (inclusi),
+    lette con una sola query e ordinate per orario e barbiere. Sono righe-tupla con attributi
+    (id, barbiere_id, ora_inizio, ora_fine, servizio, cliente_nome, cliente_telefono).
+    """
+    if barbieri is None:
+        barbieri = configurazione_corrente().barbieri
+    with sessione() as db:
+        inizio, fine = intervallo_giorni(data_inizio, data_fine)
+        return db.query(
+            Prenotazione.id, Prenotazione.barbiere_id, Prenotazione.ora_inizio, Prenotazione.ora_fine,
+            Prenotazione.servizio, Prenotazione.cliente_nome, Prenotazione.cliente_telefono
+        ).filter(
+            Prenotazione.barbiere_id.in_(list(barbieri)),
+            Prenotazione.data_appuntamento >= inizio,
+            Prenotazione.data_appuntamento < fine
+        ).order_by(Prenotazione.data_appuntamento, Prenotazione.barbiere_id).all()
+
+def delete_appointment(prenotazione_id):
+    """Elimina una prenotazione dal database dato l'ID."""
+    return modifica_prenotazioni(da_eliminare=[prenotazione_id])['eliminate'] == 1
@@ -0,0 +1,118 @@
+# File: core/cache_disponibilita.py
+
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date
+
+# --- Cache per-giorno degli orari disponibili ---
+# Ogni rerun di Streamlit (anche un tasto premuto nel campo Nome) ricalcolava fetch + disponibilità.
+# Qui teniamo gli orari liberi per (barbiere_id, data, durata) in una LRU limitata,
+# invalidata in modo puntuale dai percorsi di inserimento ed eliminazione.
+#
+# La modalità "barbiere indifferente" salva l'unione degli orari di tutti i barbieri con
+# barbiere_id = QUALSIASI_BARBIERE: ogni invalidazione di un barbiere scarta anche l'unione del giorno.
+
+QUALSIASI_BARBIERE = None
+
+
+class CacheDisponibilita:
+    """LRU thread-safe degli orari liberi, con chiave (barbiere_id, data, durata_min)."""
+
+    def __init__(self, capacita: int = 512):
+        self.capacita = capacita
+        self._voci = OrderedDict()
+        # (barbiere_id, data) -> durate in cache, per invalidare un giorno senza scorrere tutta la LRU
+        self._durate_per_giorno = defaultdict(set)
+        # (barbiere_id, data) -> [calcoli in corso, generazione], solo per i giorni con un calcolo fuori dal lock:
+        # un'invalidazione durante il calcolo incrementa la generazione e il risultato non viene salvato.
+        # La voce sparisce con l'ultimo calcolo, quindi la mappa è grande quanto i calcoli concorrenti.
+        self._in_corso = {}
+        # Incrementata da svuota(): vale come invalidazione di TUTTI i giorni, anche quelli non ancora in cache
+        self._epoca = 0
+        self._lock = threading.Lock()
+        self.hit = 0
+        self.miss = 0
+        self.invalidazioni = 0
+        self.espulsioni = 0
+
+    def ottieni(self, barbiere_id, data_selezionata: date, durata_min: int, calcola) -> tuple:
+        """Restituisce gli orari in cache o li calcola con `calcola()` e li memorizza."""
+        chiave = (barbiere_id, data_selezionata, durata_min)
+        giorno = (barbiere_id, data_selezionata)
+
+        with self._lock:
+            if chiave in self._voci:
+                self._voci.move_to_end(chiave)
+                self.hit += 1
+                return self._voci[chiave]
+            self.miss += 1
+            stato = self._in_corso.setdefault(giorno, [0, 0])
+            stato[0] += 1
+            generazione = (self._epoca, stato[1])
+
+        # Il calcolo (query + sweep) avviene fuori dal lock per non serializzare le sessioni.
+        # Se solleva, il giorno esce comunque dai calcoli in corso e non si salva nulla.
+        valore = None
+        try:
+            valore = tuple(calcola())
+        finally:
+            with self._lock:
+                stato[0] -= 1
+                if not stato[0]:
+                    del self._in_corso[giorno]
+                if valore is not None and (self._epoca, stato[1]) == generazione:
+                    self._memorizza(chiave, giorno, valore)
+        return valore
+
+    def invalida(self, barbiere_id, data_selezionata: date):
+        """Scarta tutte le durate in cache per un barbiere in un giorno (dopo insert/delete), unione compresa."""
+        with self._lock:
+            for chi in {barbiere_id, QUALSIASI_BARBIERE}:
+                giorno = (chi, data_selezionata)
+                stato = self._in_corso.get(giorno)
+                if stato is not None:
+                    stato[1] += 1
+                for durata in self._durate_per_giorno.pop(giorno, ()):
+                    self._voci.pop((chi, data_selezionata, durata), None)
+            self.invalidazioni += 1
+
+    def svuota(self):
+        """Svuota completamente la cache (mantiene i contatori), es. dopo un cambio di configurazione."""
+        with self._lock:
+            self._epoca += 1
+            self._voci.clear()
+            self._durate_per_giorno.clear()
+
+    def statistiche(self) -> dict:
+        """Contatori di hit/miss per la diagnostica."""
+        with self._lock:
+            totale = self.hit + self.miss
+            return {
+                'hit': self.hit,
+                'miss': self.miss,
+                'hit_rate': self.hit / totale if totale else 0.0,
+                'voci': len(self._voci),
+                'capacita': self.capacita,
+                'invalidazioni': self.invalidazioni,
+                'espulsioni': self.espulsioni,
+            }
+
+    def _memorizza(self, chiave, giorno, valore):
+        self._voci[chiave] = valore
+        self._voci.move_to_end(chiave)
+        self._durate_per_giorno[giorno].add(chiave[2])
+        while len(self._voci) > self.capacita:
+            (b_id, giorno_espulso, durata), _ = self._voci.popitem(last=False)
+            self._rimuovi_durata((b_id, giorno_espulso), durata)
+            self.espulsioni += 1
+
+    def _rimuovi_durata(self, giorno, durata):
+        durate = self._durate_per_giorno.get(giorno)
+        if durate is not None:
+            durate.discard(durata)
+            if not durate:
+                del self._durate_per_giorno[giorno]
+
+
+# Istanza condivisa dal processo: tutte le sessioni Streamlit vedono le stesse invalidazioni.
+cache_disponibilita = CacheDisponibilita()
@@ -0,0 +1,276 @@
+# File: core/calendario.py
+
+import threading
+from collections import defaultdict
+from datetime import date, time, timedelta
+from time import monotonic
+
+from sqlalchemy import delete, select, text
+
+from core.db import get_engine, sessione
+from core.modelli import Barbiere, Servizio, OrarioBarbiere, Chiusura, Impostazione
+from core.occupazione import ModelloSlot
+from core.cache_disponibilita import cache_disponibilita
+
+# --- Configurazione del negozio letta dal database ---
+# Barbieri, servizi, orari per barbiere e giorno della settimana, ferie e cadenza vivono nelle tabelle
+# di configurazione (popolate la prima volta da configurazione.py). Vengono caricate una volta in
+# una ConfigurazioneNegozio immutabile, con i ModelloSlot già compilati per ogni (barbiere, giorno
+# della settimana, durata). I trigger incrementano la 'versione' a ogni modifica: il caricatore la
+# rilegge al massimo ogni INTERVALLO_CONTROLLO_S e ricarica tutto solo se è cambiata.
+
+INTERVALLO_CONTROLLO_S = 2.0
+NOMI_GIORNI = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+
+
+class ConfigurazioneNegozio:
+    """Istantanea in sola lettura della configurazione, condivisa da tutte le sessioni."""
+
+    def __init__(self, versione: int, barbieri: dict, nomi_barbieri: dict, servizi: dict,
+                 cadenza: timedelta, orari: dict, chiusure: list):
+        self.versione = versione
+        self.barbieri = barbieri              # {barbiere_id: nome}, solo i barbieri attivi
+        self.nomi_barbieri = nomi_barbieri    # {barbiere_id: nome}, anche i disattivati (storico)
+        self.servizi = servizi                # {nome: durata_min}, solo i servizi attivi
+        self.cadenza = cadenza
+        self.orari = orari                    # {barbiere_id: {giorno_settimana: ((inizio, fine), ...)}}
+        self.chiusure = chiusure              # [(barbiere_id o None, data_inizio, data_fine, motivo)]
+
+        # Giorni della settimana in cui non lavora nessun barbiere attivo: utili a giorni_lavorativi
+        self.giorni_chiusura = tuple(
+            giorno for giorno in range(7)
+            if not any(self.orari.get(b, {}).get(giorno) for b in self.barbieri)
+        )
+
+        # Orari identici (caso tipico: tutti i barbieri con le stesse fasce) condividono lo stesso modello
+        self._modelli = {}
+        compilati = {}
+        for barbiere_id in self.barbieri:
+            for giorno, fasce in self.orari.get(barbiere_id, {}).items():
+                for durata in set(self.servizi.values()):
+                    if (fasce, durata) not in compilati:
+                        compilati[fasce, durata] = ModelloSlot(fasce, self.cadenza, durata)
+                    self._modelli[barbiere_id, giorno, durata] = compilati[fasce, durata]
+
+    def in_ferie(self, barbiere_id, giorno: date) -> bool:
+        return any(
+            (chi is None or chi == barbiere_id) and dal <= giorno <= al
+            for chi, dal, al, _ in self.chiusure
+        )
+
+    def orari_del_giorno(self, barbiere_id, giorno: date) -> tuple:
+        """Fasce di lavoro del barbiere in quella data; () se non lavora o è in ferie."""
+        if self.in_ferie(barbiere_id, giorno):
+            return ()
+        return self.orari.get(barbiere_id, {}).get(giorno.weekday(), ())
+
+    def aperto(self, giorno: date, barbiere_id=None) -> bool:
+        """True se il barbiere (o, senza barbiere, almeno uno dei barbieri attivi) lavora quel giorno."""
+        barbieri = self.barbieri if barbiere_id is None else (barbiere_id,)
+        return any(self.orari_del_giorno(b, giorno) for b in barbieri)
+
+    def primo_giorno_aperto(self, dal: date, barbiere_id=None, orizzonte_giorni: int = 366) -> date:
+        """Prima data da `dal` in poi in cui si lavora; None se non ce n'è entro l'orizzonte."""
+        for scarto in range(orizzonte_giorni):
+            giorno = dal + timedelta(days=scarto)
+            if self.aperto(giorno, barbiere_id):
+                return giorno
+        return None
+
+    def modello(self, barbiere_id, giorno: date, durata_min: int) -> ModelloSlot:
+        """ModelloSlot precompilato per il barbiere in quella data; None se non lavora."""
+        if self.in_ferie(barbiere_id, giorno):
+            return None
+        chiave = (barbiere_id, giorno.weekday(), durata_min)
+        modello = self._modelli.get(chiave)
+        if modello is None:
+            fasce = self.orari.get(barbiere_id, {}).get(giorno.weekday())
+            if not fasce:
+                return None
+            # Durata fuori listino (es. servizio appena aggiunto altrove): compilata al volo e conservata
+            modello = self._modelli.setdefault(chiave, ModelloSlot(fasce, self.cadenza, durata_min))
+        return modello
+
+
+def _leggi_versione(db) -> int:
+    valore = db.execute(text("SELECT valore FROM impostazioni WHERE chiave = 'versione'")).scalar()
+    return int(valore or 0)
+
+
+def carica_configurazione() -> ConfigurazioneNegozio:
+    """Legge tutte le tabelle di configurazione in un'unica transazione (istantanea coerente)."""
+    with sessione() as db:
+        versione = _leggi_versione(db)
+        impostazioni = dict(db.execute(select(Impostazione.chiave, Impostazione.valore)).all())
+
+        barbieri, nomi_barbieri = {}, {}
+        for barbiere_id, nome, attivo in db.execute(
+            select(Barbiere.id, Barbiere.nome, Barbiere.attivo).order_by(Barbiere.id)
+        ):
+            nomi_barbieri[barbiere_id] = nome
+            if attivo:
+                barbieri[barbiere_id] = nome
+
+        servizi = dict(db.execute(
+            select(Servizio.nome, Servizio.durata_min).where(Servizio.attivo.is_(True)).order_by(Servizio.id)
+        ).all())
+
+        orari = defaultdict(lambda: defaultdict(list))
+        for barbiere_id, giorno, inizio, fine in db.execute(
+            select(OrarioBarbiere.barbiere_id, OrarioBarbiere.giorno_settimana, OrarioBarbiere.inizio, OrarioBarbiere.fine)
+        ):
+            if inizio < fine:
+                orari[barbiere_id][giorno].append((inizio, fine))
+
+        chiusure = [
+            tuple(riga) for riga in db.execute(select(Chiusura.barbiere_id, Chiusura.data_inizio, Chiusura.data_fine, Chiusura.motivo))
+        ]
+
+    return ConfigurazioneNegozio(
+        versione=versione,
+        barbieri=barbieri,
+        nomi_barbieri=nomi_barbieri,
+        servizi=servizi,
+        cadenza=timedelta(minutes=int(impostazioni.get('cadenza_min', 30))),
+        orari={b: {g: tuple(sorted(fasce)) for g, fasce in per_giorno.items()} for b, per_giorno in orari.items()},
+        chiusure=chiusure,
+    )
+
+
+class CaricatoreConfigurazione:
+    """Tiene la ConfigurazioneNegozio corrente e la ricarica quando cambia la versione nel database."""
+
+    def __init__(self, intervallo_controllo_s: float = INTERVALLO_CONTROLLO_S):
+        self.intervallo_controllo_s = intervallo_controllo_s
+        self._configurazione = None
+        self._engine = None
+        self._ultimo_controllo = 0.0
+        self._lock = threading.Lock()
+        self.ricaricamenti = 0
+
+    def corrente(self) -> ConfigurazioneNegozio:
+        """Configurazione in memoria; al più una query ogni `intervallo_controllo_s` per vedere se è cambiata."""
+        configurazione = self._configurazione
+        if (configurazione is not None and self._engine is get_engine()
+                and monotonic() - self._ultimo_controllo < self.intervallo_controllo_s):
+            return configurazione
+
+        with self._lock:
+            # core.db.configura_database può aver cambiato DB (benchmark, job batch): ricarica da zero
+            if self._configurazione is None or self._engine is not get_engine():
+                return self._ricarica()
+            if monotonic() - self._ultimo_controllo >= self.intervallo_controllo_s:
+                with sessione() as db:
+                    versione = _leggi_versione(db)
+                self._ultimo_controllo = monotonic()
+                if versione != self._configurazione.versione:
+                    return self._ricarica()
+            return self._configurazione
+
+    def ricarica(self) -> ConfigurazioneNegozio:
+        """Ricarica subito (dopo un salvataggio dal pannello admin)."""
+        with self._lock:
+            return self._ricarica()
+
+    def _ricarica(self) -> ConfigurazioneNegozio:
+        engine_corrente = get_engine()
+        self._configurazione = carica_configurazione()
+        self._engine = engine_corrente
+        self._ultimo_controllo = monotonic()
+        self.ricaricamenti += 1
+        # Gli orari in cache sono stati calcolati con la configurazione precedente
+        cache_disponibilita.svuota()
+        return self._configurazione
+
+
+# Istanza condivisa dal processo (come cache_disponibilita)
+caricatore_configurazione = CaricatoreConfigurazione()
+
+
+def configurazione_corrente() -> ConfigurazioneNegozio:
+    return caricatore_configurazione.corrente()
+
+
+# --- Modifica della configurazione (pannello admin) ---
+
+class ConfigurazioneNonValida(ValueError):
+    """I dati inseriti nel pannello di configurazione non sono coerenti."""
+
+
+def _ora(valore) -> time:
+    if isinstance(valore, time):
+        return valore
+    try:
+        return time.fromisoformat(str(valore).strip())
+    except ValueError:
+        raise ConfigurazioneNonValida(f"Ora non valida: '{valore}' (formato HH:MM)")
+
+
+def salva_configurazione(barbieri: list, servizi: list, orari: list, chiusure: list, cadenza_min: int) -> ConfigurazioneNegozio:
+    """
+    Sostituisce la configurazione in un'unica transazione e la ricarica. Ogni lista contiene dict con le
+    colonne della tabella corrispondente (senza id, tranne per i barbieri, il cui id è quello delle prenotazioni).
+    I trigger incrementano la versione, così anche gli altri processi ricaricano al controllo successivo.
+    """
+    if cadenza_min <= 0:
+        raise ConfigurazioneNonValida("La cadenza deve essere positiva.")
+
+    ids_barbieri = set()
+    for riga in barbieri:
+        if not str(riga.get('nome') or "").strip():
+            raise ConfigurazioneNonValida("Ogni barbiere deve avere un nome.")
+        ids_barbieri.add(int(riga['id']))
+    if len(ids_barbieri) != len(barbieri):
+        raise ConfigurazioneNonValida("Due barbieri con lo stesso ID.")
+
+    nomi_servizi = set()
+    for riga in servizi:
+        if not str(riga.get('nome') or "").strip() or int(riga.get('durata_min') or 0) <= 0:
+            raise ConfigurazioneNonValida("Ogni servizio deve avere un nome e una durata positiva.")
+        nomi_servizi.add(riga['nome'].strip())
+    if len(nomi_servizi) != len(servizi):
+        raise ConfigurazioneNonValida("Due servizi con lo stesso nome.")
+
+    righe_orari = []
+    for riga in orari:
+        inizio, fine = _ora(riga['inizio']), _ora(riga['fine'])
+        if int(riga['barbiere_id']) not in ids_barbieri or not 0 <= int(riga['giorno_settimana']) <= 6:
+            raise ConfigurazioneNonValida(f"Orario con barbiere o giorno sconosciuto: {riga}")
+        if inizio >= fine:
+            raise ConfigurazioneNonValida(f"Fascia vuota: {inizio.strftime('%H:%M')} - {fine.strftime('%H:%M')}")
+        righe_orari.append({'barbiere_id': int(riga['barbiere_id']), 'giorno_settimana': int(riga['giorno_settimana']),
+                            'inizio': inizio, 'fine': fine})
+
+    righe_chiusure = []
+    for riga in chiusure:
+        barbiere_id = riga.get('barbiere_id')
+        barbiere_id = None if barbiere_id in (None, "") else int(barbiere_id)
+        if barbiere_id is not None and barbiere_id not in ids_barbieri:
+            raise ConfigurazioneNonValida(f"Chiusura per un barbiere sconosciuto: {barbiere_id}")
+        if riga['data_fine'] < riga['data_inizio']:
+            raise ConfigurazioneNonValida("Una chiusura finisce prima di iniziare.")
+        righe_chiusure.append({'barbiere_id': barbiere_id, 'data_inizio': riga['data_inizio'],
+                               'data_fine': riga['data_fine'], 'motivo': riga.get('motivo')})
+
+    with sessione(immediata=True) as db:
+        # I barbieri non si cancellano (il loro id è nelle prenotazioni): si aggiornano o si disattivano
+        for riga in barbieri:
+            db.merge(Barbiere(id=int(riga['id']), nome=riga['nome'].strip(), attivo=bool(riga.get('attivo', True))))
+        db.execute(Barbiere.__table__.update().where(Barbiere.id.not_in(ids_barbieri)).values(attivo=False))
+
+        esistenti = {nome: servizio_id for servizio_id, nome in db.execute(select(Servizio.id, Servizio.nome))}
+        for riga in servizi:
+            nome = riga['nome'].strip()
+            db.merge(Servizio(id=esistenti.get(nome), nome=nome, durata_min=int(riga['durata_min']),
+                              attivo=bool(riga.get('attivo', True))))
+        db.execute(Servizio.__table__.update().where(Servizio.nome.not_in(nomi_servizi)).values(attivo=False))
+
+        db.execute(delete(OrarioBarbiere))
+        if righe_orari:
+            db.execute(OrarioBarbiere.__table__.insert(), righe_orari)
+        db.execute(delete(Chiusura))
+        if righe_chiusure:
+            db.execute(Chiusura.__table__.insert(), righe_chiusure)
+        db.merge(Impostazione(chiave="cadenza_min", valore=str(int(cadenza_min))))
+
+    return caricatore_configurazione.ricarica()
@@ -0,0 +1,134 @@
+# File: core/clienti.py
+
+from sqlalchemy import desc, func, select, union_all
+from sqlalchemy.orm import aliased
+
+from core.db import sessione
+from core.modelli import Prenotazione, PrenotazioneArchiviata, normalizza_telefono
+
+# --- Clienti per numero di telefono ---
+# I clienti non hanno una tabella propria: sono il nome e il telefono scritti su ogni prenotazione.
+# telefono_normalizzato (colonna generata, vedi core/modelli.py) con l'indice
+# (telefono_normalizzato, data_appuntamento) su prenotazioni e archivio rende un cliente ritrovabile
+# senza scandire la tabella:
+#   - ricerca per prefisso: range [prefisso, prefisso successivo) sull'indice, prima i numeri distinti
+#     (al massimo `limite`) e poi i loro conteggi, quindi il costo non dipende da quante righe combaciano;
+#   - storico e nome di un cliente noto: uguaglianza sul numero, righe già ordinate per data nell'indice.
+
+MAX_CLIENTI_RICERCA = 20
+MAX_RIGHE_STORICO_CLIENTE = 200
+# Il nome di un cliente noto si recupera solo da un numero completo, mai da un prefisso
+CIFRE_MINIME_AUTOCOMPILAZIONE = 8
+
+_TABELLE = (Prenotazione, PrenotazioneArchiviata)
+
+
+def _intervallo_prefisso(prefisso: str) -> tuple:
+    """[prefisso, successivo): tutte e sole le stringhe che iniziano con il prefisso, come range sull'indice."""
+    return prefisso, prefisso[:-1] + chr(ord(prefisso[-1]) + 1)
+
+
+def cerca_clienti(testo: str, limite: int = MAX_CLIENTI_RICERCA) -> list:
+    """
+    Ricerca admin: clienti il cui telefono normalizzato inizia con `testo` (normalizzato allo stesso modo),
+    in ordine di numero. Per ognuno: ultimo nome e telefono usati, numero di prenotazioni (archivio compreso),
+    prima e ultima data. Restituisce dict; lista vuota se il testo non contiene un numero.
+    """
+    prefisso = normalizza_telefono(testo)
+    if not prefisso:
+        return []
+    minimo, massimo = _intervallo_prefisso(prefisso)
+
+    with sessione() as db:
+        # 1. Numeri distinti nel range, letti dall'indice in ordine e fermati al limite
+        telefoni = set()
+        for tabella in _TABELLE:
+            telefoni.update(db.execute(
+                select(tabella.telefono_normalizzato).distinct()
+                .where(tabella.telefono_normalizzato >= minimo, tabella.telefono_normalizzato < massimo)
+                .order_by(tabella.telefono_normalizzato).limit(limite)
+            ).scalars())
+        telefoni = sorted(telefoni)[:limite]
+        if not telefoni:
+            return []
+
+        # 2. Aggregati solo per quei numeri. Nome e telefono più recenti con una sottoquery correlata
+        #    ORDER BY data DESC LIMIT 1 sull'indice: con min() e max() nella stessa query, le colonne
+        #    "nude" di SQLite verrebbero da una riga qualsiasi del gruppo.
+        clienti = {}
+        for tabella in _TABELLE:
+            recente = aliased(tabella)
+
+            def ultimo(colonna):
+                return (
+                    select(colonna).where(recente.telefono_normalizzato == tabella.telefono_normalizzato)
+                    .order_by(desc(recente.data_appuntamento)).limit(1).scalar_subquery()
+                )
+
+            for telefono, prenotazioni, prima, ultima, nome, originale in db.execute(
+                select(
+                    tabella.telefono_normalizzato, func.count(), func.min(tabella.data_appuntamento),
+                    func.max(tabella.data_appuntamento), ultimo(recente.cliente_nome), ultimo(recente.cliente_telefono)
+                ).where(tabella.telefono_normalizzato.in_(telefoni)).group_by(tabella.telefono_normalizzato)
+            ):
+                cliente = clienti.get(telefono)
+                if cliente is None:
+                    clienti[telefono] = {
+                        'telefono': telefono, 'cliente_nome': nome, 'cliente_telefono': originale,
+                        'prenotazioni': prenotazioni, 'prima': prima, 'ultima': ultima,
+                    }
+                    continue
+                cliente['prenotazioni'] += prenotazioni
+                cliente['prima'] = min(cliente['prima'], prima)
+                if ultima > cliente['ultima']:
+                    cliente.update(ultima=ultima, cliente_nome=nome, cliente_telefono=originale)
+
+    return [clienti[telefono] for telefono in telefoni]
+
+
+def storico_cliente(telefono: str, limite_righe: int = MAX_RIGHE_STORICO_CLIENTE) -> list:
+    """
+    Prenotazioni (archivio compreso) con lo stesso telefono normalizzato, dalla più recente, come dict con
+    le chiavi di archivio.leggi_storico. Ogni ramo è una ricerca per uguaglianza sull'indice del telefono.
+    """
+    numero = normalizza_telefono(telefono)
+    if not numero:
+        return []
+
+    def ramo(tabella):
+        return select(
+            tabella.barbiere_id, tabella.ora_inizio, tabella.ora_fine,
+            tabella.servizio, tabella.cliente_nome, tabella.cliente_telefono
+        ).where(tabella.telefono_normalizzato == numero)
+
+    unione = union_all(*(ramo(tabella) for tabella in _TABELLE)).subquery()
+    with sessione() as db:
+        righe = db.execute(select(unione).order_by(desc(unione.c.ora_inizio)).limit(limite_righe)).all()
+    return [
+        {
+            'barbiere_id': barbiere, 'inizio': ora_inizio, 'fine': ora_fine,
+            'servizio': servizio, 'cliente_nome': cliente_nome, 'cliente_telefono': cliente_telefono,
+        }
+        for barbiere, ora_inizio, ora_fine, servizio, cliente_nome, cliente_telefono in righe
+    ]
+
+
+def nome_cliente(telefono: str):
+    """
+    Inserimento manuale (admin): il nome dell'ultima prenotazione con esattamente quel numero (normalizzato);
+    None per numeri sconosciuti o troppo corti. Solo lato admin: nel modulo pubblico rivelerebbe a chiunque
+    il nome associato a un numero.
+    """
+    numero = normalizza_telefono(telefono)
+    if sum(carattere.isdigit() for carattere in numero) < CIFRE_MINIME_AUTOCOMPILAZIONE:
+        return None
+    with sessione() as db:
+        # La tabella calda contiene le prenotazioni più recenti: l'archivio solo se lì non c'è nulla
+        for tabella in _TABELLE:
+            nome = db.execute(
+                select(tabella.cliente_nome).where(tabella.telefono_normalizzato == numero)
+                .order_by(desc(tabella.data_appuntamento)).limit(1)
+            ).scalar()
+            if nome:
+                return nome
+    return None
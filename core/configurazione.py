@@ -0,0 +1,28 @@
+# File: core/configurazione.py
+
+from datetime import time, timedelta
+
+# --- DATI STATICI DEL PROGETTO (Configurazione) ---
+# Separati da app.py così il motore di disponibilità può usarli senza importare l'interfaccia.
+
+# Definisci i barbieri e gli ID (ID 1 e 2 devono corrispondere a core/modelli.py)
+BARBIERI = {
+    1: "Salvatore",
+    2: "Raffaele"
+}
+
+# Definisci i servizi e la loro durata in minuti
+SERVIZI = {
+    "Taglio Uomo": 30,
+    "Barba": 15,
+    "Taglio + Barba": 45
+}
+
+# Orari di apertura definitivi del barbiere
+ORARI_APERTURA = [
+    (time(8, 30), time(12, 30)),  # Mattina
+    (time(15, 0), time(19, 30))   # Pomeriggio
+]
+SLOT_CADENZA = timedelta(minutes=30)
+# 0=Lunedì, 6=Domenica. Si lavora da Martedì (2) a Sabato (5). Domenica (6) e Lunedì (0) chiusi.
+GIORNI_CHIUSURA = [0, 6]
@@ -0,0 +1,382 @@
+# File: core/db.py
+
+import threading
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, date, time, timedelta
+from time import perf_counter
+
+from core.configurazione import BARBIERI, SERVIZI, ORARI_APERTURA, SLOT_CADENZA, GIORNI_CHIUSURA
+from core.modelli import (
+    Base, Prenotazione, PrenotazioneArchiviata, Barbiere, Servizio, OrarioBarbiere, Impostazione, TABELLE_CONFIGURAZIONE,
+)
+
+# --- Engine, sessioni e migrazioni (senza Streamlit) ---
+# L'engine viene creato alla prima sessione, non all'import: job batch, worker e benchmark
+# possono importare questo modulo e chiamare configura_database() prima di toccare il DB.
+
+# --- Configurazione del Database PERSISTENTE ---
+# Utilizziamo un file chiamato 'appuntamenti.db' nella directory dell'app
+# Questo risolve il problema della perdita di dati tra i refresh.
+DATABASE_URL = "sqlite:///appuntamenti.db"
+
+# Quanto attende una connessione quando il DB è bloccato da un'altra scrittura, invece di
+# fallire subito con "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# Pool di connessioni esplicito: poche connessioni riusate da tutte le sessioni Streamlit.
+# Se il pool resta esaurito per POOL_TIMEOUT_S secondi, quasi certamente c'è una sessione non chiusa.
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+POOL_TIMEOUT_S = 10
+
+# --- Configurazione delle connessioni SQLite (WAL + busy timeout) ---
+
+def _configura_connessione_sqlite(dbapi_connection, connection_record):
+    """Pragma applicati a ogni nuova connessione SQLite."""
+    # Gestiamo noi il BEGIN (vedi _inizia_transazione): il driver sqlite3 altrimenti
+    # aprirebbe le transazioni in modo implicito e sempre DEFERRED.
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    # WAL: i lettori non si bloccano dietro a chi scrive (e viceversa)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # In WAL, NORMAL è sicuro contro la corruzione e molto più veloce di FULL
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _inizia_transazione(conn):
+    """
+    Apre la transazione. Con l'opzione di esecuzione `sqlite_immediate` usa BEGIN IMMEDIATE:
+    il lock di scrittura viene preso subito, così controllo e insert avvengono senza che
+    un'altra sessione possa scrivere nel mezzo.
+    """
+    if conn.get_execution_options().get("sqlite_immediate"):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.exec_driver_sql("BEGIN")
+
+def crea_engine(url: str = DATABASE_URL):
+    """Crea un motore SQLAlchemy con i pragma di concorrenza applicati a ogni connessione."""
+    nuovo_engine = create_engine(
+        url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        poolclass=QueuePool, pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT_S
+    )
+    event.listen(nuovo_engine, "connect", _configura_connessione_sqlite)
+    event.listen(nuovo_engine, "begin", _inizia_transazione)
+    _registra_strumentazione(nuovo_engine)
+    return nuovo_engine
+
+# --- Strumentazione: query, connessioni e tempo DB per ogni rerun ---
+
+class StatisticheDB:
+    """Contatori raccolti durante una misurazione (tipicamente un rerun di Streamlit)."""
+    __slots__ = ("query", "connessioni_aperte", "checkout", "checkin", "tempo_db_s")
+
+    def __init__(self):
+        self.query = 0
+        self.connessioni_aperte = 0
+        self.checkout = 0
+        self.checkin = 0
+        self.tempo_db_s = 0.0
+
+    @property
+    def connessioni_non_restituite(self) -> int:
+        """Checkout senza checkin: sessioni rimaste aperte (leak)."""
+        return self.checkout - self.checkin
+
+    def come_dict(self) -> dict:
+        return {
+            'query': self.query,
+            'connessioni_aperte': self.connessioni_aperte,
+            'checkout': self.checkout,
+            'connessioni_non_restituite': self.connessioni_non_restituite,
+            'tempo_db_ms': round(self.tempo_db_s * 1000, 2),
+        }
+
+# Ogni sessione Streamlit esegue il suo script in un thread proprio: la ContextVar isola i contatori.
+_statistiche_correnti = ContextVar("statistiche_db", default=None)
+
+@contextmanager
+def misura_db():
+    """Raccoglie le StatisticheDB di tutto ciò che accade nel blocco (nello stesso thread)."""
+    statistiche = StatisticheDB()
+    token = _statistiche_correnti.set(statistiche)
+    try:
+        yield statistiche
+    finally:
+        _statistiche_correnti.reset(token)
+
+def _registra_strumentazione(engine_da_strumentare):
+    """Aggancia gli eventi di engine e pool ai contatori della misurazione corrente."""
+
+    @event.listens_for(engine_da_strumentare, "before_cursor_execute")
+    def _prima_della_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("inizio_query", []).append(perf_counter())
+
+    @event.listens_for(engine_da_strumentare, "after_cursor_execute")
+    def _dopo_la_query(conn, cursor, statement, parameters, context, executemany):
+        durata = perf_counter() - conn.info["inizio_query"].pop()
+        statistiche = _statistiche_correnti.get()
+        if statistiche is not None:
+            statistiche.query += 1
+            statistiche.tempo_db_s += durata
+
+    @event.listens_for(engine_da_strumentare, "connect")
+    def _nuova_connessione(dbapi_connection, connection_record):
+        statistiche = _statistiche_correnti.get()
+        if statistiche is not None:
+            statistiche.connessioni_aperte += 1
+
+    @event.listens_for(engine_da_strumentare, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        statistiche = _statistiche_correnti.get()
+        if statistiche is not None:
+            statistiche.checkout += 1
+
+    @event.listens_for(engine_da_strumentare, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        statistiche = _statistiche_correnti.get()
+        if statistiche is not None:
+            statistiche.checkin += 1
+
+# --- Engine pigro condiviso dal processo ---
+# Un solo engine per processo: i moduli importati non vengono rieseguiti dai rerun di Streamlit,
+# quindi non serve più st.cache_resource per condividerlo tra le sessioni.
+
+_engine = None
+_url = DATABASE_URL
+_lock_engine = threading.Lock()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+def get_engine():
+    """Restituisce l'engine del processo, creandolo alla prima chiamata."""
+    global _engine
+    if _engine is None:
+        with _lock_engine:
+            if _engine is None:
+                nuovo_engine = crea_engine(_url)
+                SessionLocal.configure(bind=nuovo_engine)
+                _engine = nuovo_engine
+    return _engine
+
+@contextmanager
+def sessione(immediata: bool = False):
+    """
+    Unità di lavoro: apre una sessione, fa commit all'uscita, rollback in caso di errore
+    e la chiude SEMPRE. Con `immediata=True` la transazione parte con BEGIN IMMEDIATE.
+    Gli oggetti ORM vanno letti dentro il blocco (dopo il commit sono scaduti).
+    """
+    get_engine()
+    db = SessionLocal()
+    try:
+        if immediata:
+            db.connection(execution_options={"sqlite_immediate": True})
+        yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def configura_database(url: str):
+    """Ricollega SessionLocal (e init_db) a un altro database: stress test, benchmark, job batch."""
+    global _engine, _url
+    with _lock_engine:
+        _url = url
+        _engine = crea_engine(url)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+def init_db():
+    """Crea le tabelle se non esistono e applica le migrazioni in loco."""
+    # Base.metadata.drop_all(bind=get_engine()) # DEBUG: Decommenta per resettare
+    Base.metadata.create_all(bind=get_engine())
+    migra_archivio()
+    migra_telefoni()
+    migra_indici()
+    migra_configurazione()
+    migra_registro_modifiche()
+
+def migra_indici():
+    """
+    Migrazione per i file appuntamenti.db già esistenti: create_all non aggiunge
+    indici a tabelle già create, quindi li creiamo qui (operazione idempotente).
+    """
+    with get_engine().begin() as conn:
+        for modello in (Prenotazione, PrenotazioneArchiviata):
+            for indice in modello.__table__.indexes:
+                indice.create(bind=conn, checkfirst=True)
+        # L'indice singolo su barbiere_id è ridondante: è il prefisso dell'indice composto.
+        conn.execute(text("DROP INDEX IF EXISTS ix_prenotazioni_barbiere_id"))
+
+def migra_archivio():
+    """
+    Archivi creati quando la chiave primaria era l'ID originale della prenotazione: SQLite non può cambiare
+    la chiave di una tabella, quindi la si ricostruisce (rinomina, nuova tabella, copia, drop) in un'unica
+    transazione. L'ID di prima finisce in id_originale; gli indici li ricrea la nuova tabella.
+    """
+    tabella = PrenotazioneArchiviata.__table__
+    with get_engine().begin() as conn:
+        colonne = {riga[1] for riga in conn.exec_driver_sql(f"PRAGMA table_xinfo({tabella.name})")}
+        if "id_originale" in colonne:
+            return
+        vecchia = f"{tabella.name}_vecchio"
+        conn.exec_driver_sql(f"ALTER TABLE {tabella.name} RENAME TO {vecchia}")
+        # Gli indici seguono la tabella rinominata ma tengono il nome: vanno tolti prima di ricrearli
+        for (indice,) in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (vecchia,)
+        ).fetchall():
+            conn.exec_driver_sql(f"DROP INDEX {indice}")
+        tabella.create(bind=conn)
+        copiate = ("barbiere_id", "data_appuntamento", "ora_inizio", "ora_fine", "servizio",
+                   "cliente_nome", "cliente_telefono", "archiviata_il")
+        conn.exec_driver_sql(
+            f"INSERT INTO {tabella.name} (id_originale, {', '.join(copiate)}) "
+            f"SELECT id, {', '.join(copiate)} FROM {vecchia} ORDER BY id"
+        )
+        conn.exec_driver_sql(f"DROP TABLE {vecchia}")
+
+def migra_telefoni():
+    """
+    Aggiunge telefono_normalizzato (colonna generata VIRTUAL) a prenotazioni e archivio dei database
+    precedenti. Il backfill non richiede UPDATE: le righe esistenti vengono normalizzate da SQLite mentre
+    migra_indici costruisce gli indici (telefono_normalizzato, data_appuntamento), in una sola passata.
+    """
+    with get_engine().begin() as conn:
+        for modello in (Prenotazione, PrenotazioneArchiviata):
+            tabella = modello.__table__
+            # Le colonne generate compaiono solo in table_xinfo, non in table_info
+            colonne = {riga[1] for riga in conn.exec_driver_sql(f"PRAGMA table_xinfo({tabella.name})")}
+            if "telefono_normalizzato" not in colonne:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {tabella.name} ADD COLUMN telefono_normalizzato VARCHAR "
+                    f"GENERATED ALWAYS AS ({tabella.c.telefono_normalizzato.computed.sqltext}) VIRTUAL"
+                )
+
+def migra_configurazione():
+    """
+    Su un database nuovo o precedente alle tabelle di configurazione le popola con i valori di
+    configurazione.py, poi crea (se mancano) i trigger che incrementano la versione della configurazione.
+    I trigger vengono dopo il popolamento: un database appena creato parte dalla versione 1.
+    """
+    with get_engine().begin() as conn:
+        if conn.execute(text("SELECT 1 FROM impostazioni WHERE chiave = 'versione'")).first() is None:
+            conn.execute(Impostazione.__table__.insert(), [
+                {'chiave': "versione", 'valore': "1"},
+                {'chiave': "cadenza_min", 'valore': str(int(SLOT_CADENZA.total_seconds() // 60))},
+            ])
+            conn.execute(Barbiere.__table__.insert(), [
+                {'id': barbiere_id, 'nome': nome, 'attivo': True} for barbiere_id, nome in BARBIERI.items()
+            ])
+            conn.execute(Servizio.__table__.insert(), [
+                {'nome': nome, 'durata_min': durata, 'attivo': True} for nome, durata in SERVIZI.items()
+            ])
+            conn.execute(OrarioBarbiere.__table__.insert(), [
+                {'barbiere_id': barbiere_id, 'giorno_settimana': giorno, 'inizio': inizio, 'fine': fine}
+                for barbiere_id in BARBIERI
+                for giorno in range(7) if giorno not in GIORNI_CHIUSURA
+                for inizio, fine in ORARI_APERTURA
+            ])
+
+        for tabella in TABELLE_CONFIGURAZIONE:
+            for operazione, riga in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+                # La riga 'versione' non deve far scattare il proprio trigger
+                condizione = f"WHEN {riga}.chiave != 'versione' " if tabella == "impostazioni" else ""
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_versione_{tabella}_{operazione.lower()} "
+                    f"AFTER {operazione} ON {tabella} {condizione}"
+                    f"BEGIN UPDATE impostazioni SET valore = CAST(valore AS INTEGER) + 1 WHERE chiave = 'versione'; END"
+                ))
+
+def migra_registro_modifiche():
+    """
+    Crea (se mancano) i trigger che annotano in prenotazioni_modifiche barbiere e giorno di ogni prenotazione
+    inserita, modificata (vecchi e nuovi valori) o cancellata. Valgono per qualunque percorso di scrittura,
+    anche da altri processi. I giorni passati non interessano a nessuno: l'archiviazione non riempie il registro.
+    """
+    with get_engine().begin() as conn:
+        for operazione, righe in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+            for riga in righe:
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_modifiche_prenotazioni_{operazione.lower()}_{riga.lower()} "
+                    f"AFTER {operazione} ON prenotazioni WHEN {riga}.data_appuntamento >= date('now', 'localtime') "
+                    f"BEGIN INSERT INTO prenotazioni_modifiche (barbiere_id, giorno, registrata_il) "
+                    f"VALUES ({riga}.barbiere_id, date({riga}.data_appuntamento), datetime('now', 'localtime')); END"
+                ))
+
+# --- Query sulle prenotazioni ---
+
+def intervallo_giorni(data_inizio: date, data_fine: date = None):
+    """Restituisce l'intervallo semiaperto [inizio, fine) che copre i giorni indicati (inclusi)."""
+    if data_fine is None:
+        data_fine = data_inizio
+    return datetime.combine(data_inizio, time.min), datetime.combine(data_fine + timedelta(days=1), time.min)
+
+def query_prenotazioni_barbiere(db, barbiere_id, inizio: datetime, fine: datetime):
+    """
+    Prenotazioni di un barbiere con data_appuntamento in [inizio, fine).
+    Il confronto diretto sulla colonna (senza func.date) permette a SQLite di usare l'indice composto.
+    """
+    return db.query(Prenotazione).filter(
+        Prenotazione.barbiere_id == barbiere_id,
+        Prenotazione.data_appuntamento >= inizio,
+        Prenotazione.data_appuntamento < fine
+    ).order_by(Prenotazione.data_appuntamento)
+
+def query_prenotazioni_intervallo(db, barbieri_ids, inizio: datetime, fine: datetime):
+    """
+    Prenotazioni di più barbieri con data_appuntamento in [inizio, fine), in una sola query.
+    `barbiere_id IN (...)` + range resta una SEARCH sull'indice composto (un salto per barbiere).
+    """
+    return db.query(Prenotazione).filter(
+        Prenotazione.barbiere_id.in_(list(barbieri_ids)),
+        Prenotazione.data_appuntamento >= inizio,
+        Prenotazione.data_appuntamento < fine
+    ).order_by(Prenotazione.barbiere_id, Prenotazione.data_appuntamento) # ordine dell'indice: niente sort
+
+def query_intervalli_barbiere(db, barbiere_id, inizio: datetime, fine: datetime):
+    """
+    Come query_prenotazioni_barbiere, ma solo le colonne (ora_inizio, ora_fine): righe-tupla leggere,
+    senza idratare oggetti Prenotazione. È tutto ciò che serve al calcolo della disponibilità.
+    """
+    return db.query(Prenotazione.ora_inizio, Prenotazione.ora_fine).filter(
+        Prenotazione.barbiere_id == barbiere_id,
+        Prenotazione.data_appuntamento >= inizio,
+        Prenotazione.data_appuntamento < fine
+    ).order_by(Prenotazione.data_appuntamento)
+
+def query_intervalli(db, barbieri_ids, inizio: datetime, fine: datetime):
+    """Versione multi-barbiere: righe (barbiere_id, ora_inizio, ora_fine), stesso piano di query_prenotazioni_intervallo."""
+    return db.query(Prenotazione.barbiere_id, Prenotazione.ora_inizio, Prenotazione.ora_fine).filter(
+        Prenotazione.barbiere_id.in_(list(barbieri_ids)),
+        Prenotazione.data_appuntamento >= inizio,
+        Prenotazione.data_appuntamento < fine
+    ).order_by(Prenotazione.barbiere_id, Prenotazione.data_appuntamento)
+
+def piano_query(db, query) -> list:
+    """Esegue EXPLAIN QUERY PLAN sulla query ORM e restituisce le righe di dettaglio del piano."""
+    # render_postcompile espande anche i parametri IN (...) in segnaposto posizionali
+    compilata = query.statement.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    # Per il piano contano solo i segnaposto, non i valori reali
+    parametri = tuple(str(compilata.params[nome]) for nome in compilata.positiontup)
+    righe = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compilata), parametri).fetchall()
+    return [riga[-1] for riga in righe]
+
+def verifica_indice_prenotazioni() -> list:
+    """
+    Controlla che la query giornaliera per barbiere usi l'indice composto.
+    Solleva AssertionError con il piano completo se SQLite ripiega su una scansione.
+    """
+    with sessione() as db:
+        inizio, fine = intervallo_giorni(date.today())
+        piano = piano_query(db, query_intervalli_barbiere(db, 1, inizio, fine))
+
+    assert any("ix_prenotazioni_barbiere_data" in riga for riga in piano), f"Indice non usato: {piano}"
+    return piano
@@ -0,0 +1,126 @@
+# File: core/disponibilita.py
+
+from datetime import date, datetime, timedelta
+
+from core.configurazione import BARBIERI, ORARI_APERTURA, SLOT_CADENZA, GIORNI_CHIUSURA
+
+# --- Motore di calcolo disponibilità (interval sweep) ---
+# Le prenotazioni vengono ordinate e fuse UNA sola volta; poi un unico puntatore
+# avanza insieme agli slot candidati (che sono generati in ordine crescente).
+# Costo: O(P log P + S) invece di O(S × P) del controllo slot-per-prenotazione.
+
+
+def _durata(durata_servizio_min: int) -> timedelta:
+    """
+    Durata del servizio come timedelta. Solo durate positive: con durata nulla lo sweep (che fonde gli
+    intervalli contigui) e il controllo slot-per-prenotazione darebbero risultati diversi ai bordi.
+    """
+    if durata_servizio_min <= 0:
+        raise ValueError(f"La durata del servizio deve essere positiva: {durata_servizio_min} min")
+    return timedelta(minutes=durata_servizio_min)
+
+
+def _intervalli_occupati(prenotazioni) -> list:
+    """Ordina le coppie (inizio, fine) e fonde quelle sovrapposte o contigue in intervalli disgiunti."""
+    intervalli = sorted(
+        (start, end) for start, end in prenotazioni if end is not None
+    )
+
+    fusi = []
+    for start, end in intervalli:
+        if fusi and start <= fusi[-1][1]:
+            if end > fusi[-1][1]:
+                fusi[-1][1] = end
+        else:
+            fusi.append([start, end])
+    return fusi
+
+
+def _slot_candidati(data_selezionata: date, durata: timedelta, orari_apertura, cadenza: timedelta):
+    """Genera in ordine crescente gli orari di inizio che rientrano nelle fasce di apertura."""
+    for start_time, end_time in sorted(orari_apertura):
+        current_time = datetime.combine(data_selezionata, start_time)
+        end_boundary = datetime.combine(data_selezionata, end_time)
+
+        while current_time < end_boundary and current_time + durata <= end_boundary:
+            yield current_time
+            current_time += cadenza
+
+
+def _sweep(candidati, durata: timedelta, occupati: list) -> list:
+    """Scarta i candidati che si sovrappongono agli intervalli occupati con un solo passaggio."""
+    liberi = []
+    i = 0
+    n = len(occupati)
+
+    for inizio in candidati:
+        fine = inizio + durata
+        # Gli intervalli che finiscono prima di questo candidato non servono più a nessuno dei successivi
+        while i < n and occupati[i][1] <= inizio:
+            i += 1
+        if i == n or occupati[i][0] >= fine:
+            liberi.append(inizio)
+
+    return liberi
+
+
+def orari_liberi(data_selezionata: date, durata_servizio_min: int, prenotazioni_esistenti: list,
+                 orari_apertura=ORARI_APERTURA, cadenza=SLOT_CADENZA) -> list:
+    """
+    Calcola gli orari di inizio liberi per un singolo giorno.
+    `prenotazioni_esistenti` è una sequenza di coppie (inizio, fine), es. le righe di query_intervalli_barbiere.
+    """
+    durata = _durata(durata_servizio_min)
+    candidati = _slot_candidati(data_selezionata, durata, orari_apertura, cadenza)
+    return _sweep(candidati, durata, _intervalli_occupati(prenotazioni_esistenti))
+
+
+def orari_liberi_da_candidati(candidati, durata_servizio_min: int, prenotazioni_esistenti: list) -> list:
+    """Come orari_liberi, ma con gli inizi candidati (crescenti) già pronti, es. da un modello precompilato."""
+    return _sweep(candidati, _durata(durata_servizio_min), _intervalli_occupati(prenotazioni_esistenti))
+
+
+def giorni_lavorativi(data_inizio: date, data_fine: date, giorni_chiusura=GIORNI_CHIUSURA):
+    """Restituisce i giorni aperti compresi tra data_inizio e data_fine (inclusi)."""
+    giorno = data_inizio
+    while giorno <= data_fine:
+        if giorno.weekday() not in giorni_chiusura:
+            yield giorno
+        giorno += timedelta(days=1)
+
+
+def orari_liberi_intervallo(data_inizio: date, data_fine: date, durata_servizio_min: int,
+                            prenotazioni_per_barbiere: dict, barbieri=None,
+                            orari_apertura=ORARI_APERTURA, cadenza=SLOT_CADENZA,
+                            giorni_chiusura=GIORNI_CHIUSURA) -> dict:
+    """
+    Calcola in una sola chiamata gli orari liberi per più giorni e per tutti i barbieri.
+
+    `prenotazioni_per_barbiere` mappa barbiere_id -> prenotazioni dell'intero intervallo
+    (in qualsiasi ordine). Restituisce {barbiere_id: {data: [datetime, ...]}}; i giorni
+    di chiusura non compaiono nel risultato.
+    """
+    if barbieri is None:
+        barbieri = BARBIERI
+
+    durata = _durata(durata_servizio_min)
+    giorni = list(giorni_lavorativi(data_inizio, data_fine, giorni_chiusura))
+
+    risultato = {}
+    for barbiere_id in barbieri:
+        occupati = _intervalli_occupati(prenotazioni_per_barbiere.get(barbiere_id, []))
+
+        # I candidati di tutti i giorni sono crescenti: basta un unico sweep per barbiere
+        candidati = [
+            slot
+            for giorno in giorni
+            for slot in _slot_candidati(giorno, durata, orari_apertura, cadenza)
+        ]
+        liberi = _sweep(candidati, durata, occupati)
+
+        per_giorno = {giorno: [] for giorno in giorni}
+        for slot in liberi:
+            per_giorno[slot.date()].append(slot)
+        risultato[barbiere_id] = per_giorno
+
+    return risultato
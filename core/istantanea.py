@@ -0,0 +1,171 @@
+# File: core/istantanea.py
+
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import OperationalError
+
+from core.db import get_engine, sessione, intervallo_giorni, query_intervalli
+from core.modelli import Prenotazione, ModificaPrenotazioni
+from core.cache_disponibilita import cache_disponibilita
+
+# --- Istantanea condivisa delle prossime settimane ---
+# Con più server Streamlit sullo stesso appuntamenti.db ogni rerun rileggeva le prenotazioni, e la cache
+# disponibilità di un processo non vedeva le scritture degli altri. L'istantanea tiene in memoria le coppie
+# (inizio, fine) di tutti i barbieri per i prossimi ORIZZONTE_GIORNI giorni.
+#
+# Prima di ogni lettura `PRAGMA data_version`, su una connessione dedicata che non scrive mai, dice in
+# pochi microsecondi se QUALCUNO (questo o un altro processo) ha fatto commit. Solo allora si leggono dal
+# registro prenotazioni_modifiche (riempito dai trigger) i giorni toccati: si ricaricano quelli e si
+# invalida la cache disponibilità per gli stessi giorni. Al cambio di data si ricarica tutto.
+#
+# Il registro serve solo per CONSERVA_REGISTRO: un'istantanea rimasta ferma più a lungo ha già cambiato data
+# e si ricarica da zero, quindi non può perdere modifiche. Ogni ricaricamento completo (all'avvio e a ogni
+# cambio di data) elimina le righe più vecchie, così il registro resta limitato anche se archivio.py
+# non viene mai pianificato; archivio.py fa la stessa pulizia.
+
+ORIZZONTE_GIORNI = 28
+CONSERVA_REGISTRO = timedelta(days=1)
+
+
+def elimina_registro_modifiche(limite: datetime) -> int:
+    """Righe del registro annotate prima del limite (almeno CONSERVA_REGISTRO fa); restituisce quante."""
+    with sessione(immediata=True) as db:
+        return db.execute(delete(ModificaPrenotazioni).where(ModificaPrenotazioni.registrata_il < limite)).rowcount
+
+
+class IstantaneaAgenda:
+    """Prenotazioni dei prossimi giorni in memoria, aggiornate in modo incrementale. Thread-safe."""
+
+    def __init__(self, orizzonte_giorni: int = ORIZZONTE_GIORNI):
+        self.orizzonte_giorni = orizzonte_giorni
+        # (primo giorno, ultimo giorno, {(barbiere_id, giorno): ((inizio, fine), ...)}), sostituita in blocco
+        self._stato = (None, None, {})
+        self._ultima_modifica = 0      # id più alto del registro già applicato
+        self._engine = None
+        self._connessione = None       # connessione sqlite3 dedicata a PRAGMA data_version
+        self._data_version = None
+        self._lock = threading.Lock()
+        self.ricaricamenti_completi = 0
+        self.aggiornamenti = 0
+        self.giorni_ricaricati = 0
+
+    def aggiorna(self):
+        """Allinea l'istantanea al database se qualcuno ha scritto: va chiamata prima di leggere."""
+        with self._lock:
+            if self._engine is not get_engine() or self._stato[0] != date.today():
+                self._ricarica_tutto()
+                return
+            versione = self._versione_dati()
+            if versione is not None and versione == self._data_version:
+                return
+            self._applica_modifiche(versione)
+
+    def intervalli(self, barbiere_id, giorno: date):
+        """Coppie (inizio, fine) del barbiere nel giorno; None se il giorno è fuori dalla finestra."""
+        dal, al, intervalli = self._stato
+        if dal is None or not dal <= giorno <= al:
+            return None
+        return intervalli.get((barbiere_id, giorno), ())
+
+    def intervalli_per_barbiere(self, giorni: list, barbieri):
+        """{barbiere_id: [(inizio, fine), ...]} sui giorni (crescenti) indicati; None se escono dalla finestra."""
+        dal, al, intervalli = self._stato
+        if dal is None or not giorni or giorni[0] < dal or giorni[-1] > al:
+            return None
+        return {
+            barbiere_id: [intervallo for giorno in giorni for intervallo in intervalli.get((barbiere_id, giorno), ())]
+            for barbiere_id in barbieri
+        }
+
+    def statistiche(self) -> dict:
+        dal, al, intervalli = self._stato
+        return {
+            'dal': dal, 'al': al,
+            'prenotazioni': sum(len(v) for v in intervalli.values()),
+            'ricaricamenti_completi': self.ricaricamenti_completi,
+            'aggiornamenti': self.aggiornamenti,
+            'giorni_ricaricati': self.giorni_ricaricati,
+        }
+
+    def _versione_dati(self):
+        """PRAGMA data_version: cambia a ogni commit di un'altra connessione. None senza un file su disco."""
+        if self._connessione is None:
+            return None
+        return self._connessione.execute("PRAGMA data_version").fetchone()[0]
+
+    def _apri_connessione(self, engine):
+        if self._connessione is not None:
+            self._connessione.close()
+            self._connessione = None
+        percorso = engine.url.database
+        if engine.dialect.name == "sqlite" and percorso and percorso != ":memory:":
+            # Usata solo sotto self._lock, quindi può passare da un thread all'altro
+            self._connessione = sqlite3.connect(percorso, check_same_thread=False, isolation_level=None)
+
+    def _ricarica_tutto(self):
+        engine = get_engine()
+        if engine is not self._engine:
+            self._apri_connessione(engine)
+        try:
+            elimina_registro_modifiche(datetime.now() - CONSERVA_REGISTRO)
+        except OperationalError:
+            # Solo manutenzione: con il database occupato ci riprova il prossimo ricaricamento
+            pass
+        # Letta PRIMA dei dati: un commit che arriva durante la lettura verrà rivisto al giro successivo
+        self._data_version = self._versione_dati()
+
+        dal = date.today()
+        al = dal + timedelta(days=self.orizzonte_giorni - 1)
+        inizio, fine = intervallo_giorni(dal, al)
+        intervalli = defaultdict(list)
+        # Registro e prenotazioni nella stessa transazione di lettura: stessa fotografia del WAL
+        with sessione() as db:
+            ultima_modifica = db.execute(select(func.max(ModificaPrenotazioni.id))).scalar() or 0
+            for barbiere_id, ora_inizio, ora_fine in db.query(
+                Prenotazione.barbiere_id, Prenotazione.ora_inizio, Prenotazione.ora_fine
+            ).filter(
+                Prenotazione.data_appuntamento >= inizio,
+                Prenotazione.data_appuntamento < fine
+            ).order_by(Prenotazione.data_appuntamento):
+                intervalli[barbiere_id, ora_inizio.date()].append((ora_inizio, ora_fine))
+
+        self._stato = (dal, al, {chiave: tuple(lista) for chiave, lista in intervalli.items()})
+        self._ultima_modifica = ultima_modifica
+        self._engine = engine
+        self.ricaricamenti_completi += 1
+        # Non sappiamo cosa sia cambiato prima di questa fotografia
+        cache_disponibilita.svuota()
+
+    def _applica_modifiche(self, versione):
+        dal, al, intervalli = self._stato
+        with sessione() as db:
+            modifiche = db.execute(
+                select(ModificaPrenotazioni.id, ModificaPrenotazioni.barbiere_id, ModificaPrenotazioni.giorno)
+                .where(ModificaPrenotazioni.id > self._ultima_modifica)
+                .order_by(ModificaPrenotazioni.id)
+            ).all()
+            toccati = {(barbiere_id, giorno) for _, barbiere_id, giorno in modifiche}
+            da_ricaricare = [(barbiere_id, giorno) for barbiere_id, giorno in toccati if dal <= giorno <= al]
+
+            nuovi = defaultdict(list)
+            if da_ricaricare:
+                # Una sola query per tutti i giorni toccati, sull'indice (barbiere_id, data_appuntamento)
+                inizio, fine = intervallo_giorni(min(g for _, g in da_ricaricare), max(g for _, g in da_ricaricare))
+                for barbiere_id, ora_inizio, ora_fine in query_intervalli(db, {b for b, _ in da_ricaricare}, inizio, fine):
+                    nuovi[barbiere_id, ora_inizio.date()].append((ora_inizio, ora_fine))
+
+        for chiave in da_ricaricare:
+            intervalli[chiave] = tuple(nuovi.get(chiave, ()))
+        if modifiche:
+            self._ultima_modifica = modifiche[-1][0]
+            self.aggiornamenti += 1
+            self.giorni_ricaricati += len(da_ricaricare)
+        self._data_version = versione
+
+        # Anche i giorni oltre la finestra possono essere nella cache disponibilità
+        for barbiere_id, giorno in toccati:
+            cache_disponibilita.invalida(barbiere_id, giorno)
@@ -0,0 +1,185 @@
+# File: core/modelli.py
+
+from datetime import datetime
+
+from sqlalchemy import Column, Computed, Integer, String, DateTime, Date, Time, Boolean, Index
+from sqlalchemy.orm import declarative_base
+
+# --- Modelli SQLAlchemy ---
+# Solo le tabelle: nessun engine, nessuna connessione. Importarli non apre il database.
+
+Base = declarative_base()
+
+# --- Telefono normalizzato ---
+# cliente_telefono è testo libero ("+39 333 123 4567", "333-1234567", ...). La colonna generata
+# telefono_normalizzato toglie separatori e prefisso internazionale (+39/0039, o solo +/00) ed è indicizzata:
+# è VIRTUAL, quindi qualunque percorso di scrittura (ORM, UPDATE in blocco, INSERT ... SELECT
+# dell'archivio, altri processi) la tiene allineata senza codice. normalizza_telefono è la stessa
+# regola in Python, per normalizzare ciò che si cerca.
+
+SEPARATORI_TELEFONO = " -./()"
+# Dopo aver riscritto "+" come "00": prima il prefisso italiano, poi quello internazionale generico
+PREFISSI_TELEFONO = ("0039", "00")
+
+
+def normalizza_telefono(telefono) -> str:
+    """Versione Python di _sql_telefono_normalizzato: devono dare sempre lo stesso risultato."""
+    numero = telefono or ""
+    for separatore in SEPARATORI_TELEFONO:
+        numero = numero.replace(separatore, "")
+    numero = numero.replace("+", "00")
+    for prefisso in PREFISSI_TELEFONO:
+        if numero.startswith(prefisso):
+            return numero[len(prefisso):]
+    return numero
+
+
+def _sql_telefono_normalizzato(colonna: str = "cliente_telefono") -> str:
+    """Espressione SQLite (deterministica) della colonna generata."""
+    numero = colonna
+    for separatore in SEPARATORI_TELEFONO:
+        numero = f"replace({numero}, '{separatore}', '')"
+    numero = f"replace({numero}, '+', '00')"
+    casi = " ".join(
+        f"WHEN substr({numero}, 1, {len(prefisso)}) = '{prefisso}' THEN substr({numero}, {len(prefisso) + 1})"
+        for prefisso in PREFISSI_TELEFONO
+    )
+    return f"CASE {casi} ELSE {numero} END"
+
+
+# Definizione del modello
+class Prenotazione(Base):
+    __tablename__ = "prenotazioni"
+    __table_args__ = (
+        # Indice composto: il filtro (barbiere, intervallo di date) diventa una range scan
+        # sull'indice invece di leggere tutto lo storico del barbiere.
+        Index("ix_prenotazioni_barbiere_data", "barbiere_id", "data_appuntamento"),
+        # Ricerca clienti: range sul prefisso del numero, storico del cliente già in ordine di data
+        Index("ix_prenotazioni_telefono_data", "telefono_normalizzato", "data_appuntamento"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    barbiere_id = Column(Integer) # 1 per Salvatore, 2 per Raffaele (coperto dall'indice composto)
+    data_appuntamento = Column(DateTime, index=True) 
+    ora_inizio = Column(DateTime, default=datetime.utcnow)
+    ora_fine = Column(DateTime)
+    servizio = Column(String)
+    cliente_nome = Column(String)
+    cliente_telefono = Column(String)
+    telefono_normalizzato = Column(String, Computed(_sql_telefono_normalizzato(), persisted=False))
+
+    def __repr__(self):
+        return f"<Prenotazione(id={self.id}, barbiere={self.barbiere_id}, data='{self.data_appuntamento}')>"
+
+# Archivio: le prenotazioni concluse da più di un certo tempo vengono spostate qui da archivio.py,
+# così la tabella calda (e i suoi indici) contiene solo lo storico recente e il futuro.
+# prenotazioni non è AUTOINCREMENT: archiviati gli ID più alti, SQLite li riassegna alle nuove prenotazioni.
+# Per questo l'archivio ha una chiave propria e l'ID originale è solo un riferimento, non univoco.
+class PrenotazioneArchiviata(Base):
+    __tablename__ = "prenotazioni_archivio"
+    __table_args__ = (
+        Index("ix_prenotazioni_archivio_barbiere_data", "barbiere_id", "data_appuntamento"),
+        Index("ix_prenotazioni_archivio_data", "data_appuntamento"),
+        Index("ix_prenotazioni_archivio_telefono_data", "telefono_normalizzato", "data_appuntamento"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    id_originale = Column(Integer, index=True) # ID che aveva in prenotazioni (può ripetersi)
+    barbiere_id = Column(Integer)
+    data_appuntamento = Column(DateTime)
+    ora_inizio = Column(DateTime)
+    ora_fine = Column(DateTime)
+    servizio = Column(String)
+    cliente_nome = Column(String)
+    cliente_telefono = Column(String)
+    telefono_normalizzato = Column(String, Computed(_sql_telefono_normalizzato(), persisted=False))
+    archiviata_il = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<PrenotazioneArchiviata(id={self.id}, barbiere={self.barbiere_id}, data='{self.data_appuntamento}')>"
+
+# Outbox delle notifiche: scritta nella stessa transazione della prenotazione,
+# svuotata in background da notifiche.WorkerNotifiche.
+class NotificaOutbox(Base):
+    __tablename__ = "notifiche_outbox"
+    __table_args__ = (
+        # Il worker cerca solo le notifiche da inviare e già scadute: stato + prossimo_tentativo
+        Index("ix_notifiche_outbox_stato_prossimo", "stato", "prossimo_tentativo"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    prenotazione_id = Column(Integer)
+    telefono = Column(String)
+    contenuto = Column(String) # JSON con i dati della prenotazione
+    stato = Column(String, default="in_attesa") # in_attesa | in_invio | inviata | fallita
+    tentativi = Column(Integer, default=0)
+    prossimo_tentativo = Column(DateTime, default=datetime.now)
+    creata_il = Column(DateTime, default=datetime.now)
+    ultimo_errore = Column(String)
+
+    def __repr__(self):
+        return f"<NotificaOutbox(id={self.id}, prenotazione={self.prenotazione_id}, stato='{self.stato}')>"
+
+# Registro delle modifiche: una riga (barbiere, giorno) per ogni prenotazione futura inserita, modificata
+# o cancellata, scritta dai trigger di db.migra_registro_modifiche qualunque sia il processo che scrive.
+# istantanea.py lo legge per sapere quali giorni hanno cambiato gli altri server.
+class ModificaPrenotazioni(Base):
+    __tablename__ = "prenotazioni_modifiche"
+    # AUTOINCREMENT: gli id non vengono riusati nemmeno dopo la pulizia delle righe vecchie
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = Column(Integer, primary_key=True)
+    barbiere_id = Column(Integer)
+    giorno = Column(Date)
+    registrata_il = Column(DateTime)
+
+    def __repr__(self):
+        return f"<ModificaPrenotazioni(id={self.id}, barbiere={self.barbiere_id}, giorno='{self.giorno}')>"
+
+# --- Configurazione del negozio (letta e messa in cache da calendario.py) ---
+# Alla prima creazione le tabelle vengono popolate con i valori di configurazione.py.
+
+class Barbiere(Base):
+    __tablename__ = "barbieri"
+
+    id = Column(Integer, primary_key=True)
+    nome = Column(String, nullable=False)
+    attivo = Column(Boolean, default=True, nullable=False) # disattivato: resta nello storico, non prenotabile
+
+class Servizio(Base):
+    __tablename__ = "servizi"
+
+    id = Column(Integer, primary_key=True)
+    nome = Column(String, nullable=False, unique=True)
+    durata_min = Column(Integer, nullable=False)
+    attivo = Column(Boolean, default=True, nullable=False)
+
+# Fasce di lavoro di ogni barbiere per giorno della settimana: un giorno senza fasce è di chiusura
+class OrarioBarbiere(Base):
+    __tablename__ = "orari_barbieri"
+
+    id = Column(Integer, primary_key=True)
+    barbiere_id = Column(Integer, nullable=False, index=True)
+    giorno_settimana = Column(Integer, nullable=False) # 0=Lunedì ... 6=Domenica
+    inizio = Column(Time, nullable=False)
+    fine = Column(Time, nullable=False)
+
+# Ferie e chiusure straordinarie (date incluse); barbiere_id NULL = chiude tutto il negozio
+class Chiusura(Base):
+    __tablename__ = "chiusure"
+
+    id = Column(Integer, primary_key=True)
+    barbiere_id = Column(Integer)
+    data_inizio = Column(Date, nullable=False)
+    data_fine = Column(Date, nullable=False)
+    motivo = Column(String)
+
+# Impostazioni chiave/valore: cadenza degli slot e 'versione' della configurazione,
+# incrementata dai trigger a ogni modifica delle tabelle di configurazione.
+class Impostazione(Base):
+    __tablename__ = "impostazioni"
+
+    chiave = Column(String, primary_key=True)
+    valore = Column(String)
+
+TABELLE_CONFIGURAZIONE = ("barbieri", "servizi", "orari_barbieri", "chiusure", "impostazioni")
@@ -0,0 +1,164 @@
+# File: core/notifiche.py
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from core.db import sessione
+from core.modelli import NotificaOutbox
+
+# --- Outbox delle notifiche con worker in background ---
+# La prenotazione scrive la sua notifica nella tabella notifiche_outbox nella STESSA transazione
+# dell'insert; un thread separato la invia a lotti, con tentativi e backoff esponenziale.
+# La latenza della prenotazione non dipende più dal gateway SMS/WhatsApp.
+
+logger = logging.getLogger("natillo.notifiche")
+
+DIMENSIONE_LOTTO = 20
+MAX_TENTATIVI = 5
+BACKOFF_BASE_S = 5
+BACKOFF_MAX_S = 15 * 60
+# Una notifica "in_invio" da più di così è di un worker morto a metà lotto: torna in coda
+TIMEOUT_IN_INVIO = timedelta(minutes=5)
+
+
+def componi_messaggio(dati: dict) -> str:
+    """Testo del messaggio (conferma, spostamento o annullamento) a partire dai dati della prenotazione."""
+    tipo = dati.get('tipo', 'conferma')
+    appuntamento = (
+        f"Ciao {dati.get('cliente_nome', 'Cliente')}, il tuo appuntamento per {dati.get('servizio', '')} "
+        f"con {dati.get('barbiere_nome', '')}"
+    )
+    quando = f"{dati.get('data', '')} alle {dati.get('ora_inizio', '')}"
+    if tipo == 'annullamento':
+        return (f"{appuntamento} del {quando} è stato annullato. Contattaci per fissarne un altro. "
+                f"Salvatore Natillo - Moda Capelli Uomo")
+    esito = "è stato spostato al" if tipo == 'modifica' else "è confermato il"
+    return f"{appuntamento} {esito} {quando}. Salvatore Natillo - Moda Capelli Uomo"
+
+
+def nuova_notifica(telefono: str, dati: dict) -> NotificaOutbox:
+    """Riga di outbox da aggiungere alla sessione che inserisce la prenotazione."""
+    return NotificaOutbox(telefono=telefono, contenuto=json.dumps(dati), stato="in_attesa",
+                          tentativi=0, prossimo_tentativo=datetime.now())
+
+
+class MittenteStub:
+    """
+    Mittente locale per sviluppo e test: non contatta nessun gateway, registra i messaggi.
+    Un mittente reale deve solo esporre `invia(telefono, testo)` e sollevare un'eccezione se fallisce.
+    """
+
+    def __init__(self):
+        self.inviati = []
+        self._lock = threading.Lock()
+
+    def invia(self, telefono: str, testo: str):
+        with self._lock:
+            self.inviati.append((telefono, testo))
+        logger.info("Messaggio (stub) a %s: %s", telefono, testo)
+
+
+def _backoff(tentativi: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_BASE_S * 2 ** (tentativi - 1), BACKOFF_MAX_S))
+
+
+def reclama_lotto(dimensione: int = DIMENSIONE_LOTTO) -> list:
+    """
+    Prende in carico (stato -> in_invio) un lotto di notifiche scadute e le restituisce.
+    Avviene in una transazione immediata, quindi più worker (anche in processi diversi)
+    non reclamano mai la stessa notifica.
+    """
+    adesso = datetime.now()
+    with sessione(immediata=True) as db:
+        ids = db.execute(
+            select(NotificaOutbox.id).where(
+                ((NotificaOutbox.stato == "in_attesa") & (NotificaOutbox.prossimo_tentativo <= adesso))
+                | ((NotificaOutbox.stato == "in_invio") & (NotificaOutbox.prossimo_tentativo <= adesso - TIMEOUT_IN_INVIO))
+            ).order_by(NotificaOutbox.prossimo_tentativo).limit(dimensione)
+        ).scalars().all()
+        if not ids:
+            return []
+
+        db.execute(
+            update(NotificaOutbox).where(NotificaOutbox.id.in_(ids))
+            .values(stato="in_invio", prossimo_tentativo=adesso)
+        )
+        return [
+            (n.id, n.telefono, n.contenuto, n.tentativi)
+            for n in db.query(NotificaOutbox).filter(NotificaOutbox.id.in_(ids))
+        ]
+
+
+def invia_lotto(mittente, lotto: list) -> dict:
+    """Invia un lotto reclamato e registra gli esiti con un unico commit."""
+    esiti = {'inviate': 0, 'ritentate': 0, 'fallite': 0}
+    aggiornamenti = []
+
+    for notifica_id, telefono, contenuto, tentativi in lotto:
+        try:
+            mittente.invia(telefono, componi_messaggio(json.loads(contenuto)))
+            aggiornamenti.append((notifica_id, {'stato': "inviata", 'tentativi': tentativi + 1, 'ultimo_errore': None}))
+            esiti['inviate'] += 1
+        except Exception as e:
+            tentativi += 1
+            if tentativi >= MAX_TENTATIVI:
+                valori = {'stato': "fallita", 'tentativi': tentativi, 'ultimo_errore': repr(e)}
+                esiti['fallite'] += 1
+                logger.error("Notifica %s fallita definitivamente: %r", notifica_id, e)
+            else:
+                valori = {'stato': "in_attesa", 'tentativi': tentativi, 'ultimo_errore': repr(e),
+                          'prossimo_tentativo': datetime.now() + _backoff(tentativi)}
+                esiti['ritentate'] += 1
+            aggiornamenti.append((notifica_id, valori))
+
+    with sessione() as db:
+        for notifica_id, valori in aggiornamenti:
+            db.execute(update(NotificaOutbox).where(NotificaOutbox.id == notifica_id).values(**valori))
+    return esiti
+
+
+class WorkerNotifiche(threading.Thread):
+    """Thread demone che svuota l'outbox; `sveglia()` lo fa partire subito dopo una prenotazione."""
+
+    def __init__(self, mittente=None, intervallo_s: float = 10.0, dimensione_lotto: int = DIMENSIONE_LOTTO):
+        super().__init__(name="worker-notifiche", daemon=True)
+        self.mittente = mittente if mittente is not None else MittenteStub()
+        self.intervallo_s = intervallo_s
+        self.dimensione_lotto = dimensione_lotto
+        self._sveglia = threading.Event()
+        self._fermato = threading.Event()
+        self.totali = {'inviate': 0, 'ritentate': 0, 'fallite': 0}
+
+    def sveglia(self):
+        self._sveglia.set()
+
+    def ferma(self, timeout: float = None):
+        self._fermato.set()
+        self._sveglia.set()
+        self.join(timeout)
+
+    def svuota_outbox(self) -> int:
+        """Invia lotti finché ce ne sono di pronti; restituisce quante notifiche ha gestito."""
+        gestite = 0
+        while not self._fermato.is_set():
+            lotto = reclama_lotto(self.dimensione_lotto)
+            if not lotto:
+                break
+            for chiave, valore in invia_lotto(self.mittente, lotto).items():
+                self.totali[chiave] += valore
+            gestite += len(lotto)
+        return gestite
+
+    def run(self):
+        while not self._fermato.is_set():
+            try:
+                self.svuota_outbox()
+            except Exception:
+                # Il DB può essere momentaneamente bloccato: si riprova al giro successivo
+                logger.exception("Errore nel worker delle notifiche")
+            self._sveglia.wait(self.intervallo_s)
+            self._sveglia.clear()
@@ -0,0 +1,263 @@
+# File: core/occupazione.py
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+from core.configurazione import BARBIERI, ORARI_APERTURA, SLOT_CADENZA, GIORNI_CHIUSURA
+from core.disponibilita import orari_liberi, orari_liberi_da_candidati, giorni_lavorativi
+
+# --- Occupazione a bitmap (un intero Python per barbiere-giorno) ---
+# Il giorno è diviso in quanti da 5 minuti: il bit i rappresenta [i*5min, (i+1)*5min).
+# Gli interi Python fanno da bitset di lunghezza arbitraria, quindi le operazioni sono
+# "vettoriali" senza dipendenze esterne: gli inizi liberi per un servizio di k quanti si
+# ottengono con O(log k) AND/shift sull'intera giornata invece di cicli annidati.
+#
+# La bitmap è esatta solo se orari, cadenza, durata e prenotazioni sono allineati ai quanti:
+# in caso contrario si ripiega sul motore a sweep di disponibilita.py (stesso risultato).
+# verifica_occupazione.py confronta i motori con il ciclo slot-per-prenotazione originale.
+
+QUANTO_MIN = 5
+QUANTI_GIORNO = 24 * 60 // QUANTO_MIN
+_QUANTO_SEC = QUANTO_MIN * 60
+
+
+def _quanto_esatto(secondi) -> int:
+    """Indice del quanto per un offset in secondi; None se non è allineato."""
+    if secondi % _QUANTO_SEC:
+        return None
+    return int(secondi // _QUANTO_SEC)
+
+
+@lru_cache(maxsize=64)
+def _maschere_fasce(orari_apertura: tuple, cadenza_sec: int) -> tuple:
+    """
+    Precalcola per ogni fascia di apertura (maschera quanti aperti, maschera inizi candidati).
+    Restituisce None se orari o cadenza non sono allineati ai quanti.
+    """
+    if cadenza_sec <= 0 or cadenza_sec % _QUANTO_SEC:
+        return None
+
+    fasce = []
+    for start_time, end_time in sorted(orari_apertura):
+        a = _quanto_esatto(start_time.hour * 3600 + start_time.minute * 60 + start_time.second)
+        b = _quanto_esatto(end_time.hour * 3600 + end_time.minute * 60 + end_time.second)
+        if a is None or b is None or start_time.microsecond or end_time.microsecond:
+            return None
+        if b <= a:
+            continue
+
+        aperta = ((1 << (b - a)) - 1) << a
+        candidati = 0
+        for q in range(a, b, cadenza_sec // _QUANTO_SEC):
+            candidati |= 1 << q
+        fasce.append((aperta, candidati))
+    return tuple(fasce)
+
+
+def maschera_occupata(giorno: date, prenotazioni) -> int:
+    """
+    Costruisce la bitmap dei quanti occupati in un giorno a partire dalle coppie (inizio, fine).
+    Restituisce None se una prenotazione non è allineata ai quanti o ha durata nulla/negativa.
+    """
+    ordinale = giorno.toordinal()
+    occupata = 0
+    for start, end in prenotazioni:
+        if end is None:
+            continue
+        if end <= start or start.second or start.microsecond or end.second or end.microsecond:
+            return None
+        # Minuti dalla mezzanotte del giorno (negativi o oltre 1440 se la prenotazione sconfina)
+        a = (start.toordinal() - ordinale) * 1440 + start.hour * 60 + start.minute
+        b = (end.toordinal() - ordinale) * 1440 + end.hour * 60 + end.minute
+        if a % QUANTO_MIN or b % QUANTO_MIN:
+            return None
+        a = a // QUANTO_MIN if a > 0 else 0
+        b = b // QUANTO_MIN if b < 1440 else QUANTI_GIORNO
+        if a < b:
+            occupata |= ((1 << (b - a)) - 1) << a
+    return occupata
+
+
+def finestre_libere(libero: int, quanti: int) -> int:
+    """Bit i acceso se i quanti i..i+quanti-1 sono tutti liberi (AND a raddoppio)."""
+    finestre = libero
+    coperti = 1
+    while coperti < quanti:
+        passo = min(coperti, quanti - coperti)
+        finestre &= finestre >> passo
+        coperti += passo
+    return finestre
+
+
+# Offset precalcolati dei quanti, per non ricreare un timedelta per ogni slot
+_OFFSET_QUANTI = [timedelta(minutes=q * QUANTO_MIN) for q in range(QUANTI_GIORNO)]
+
+
+def orari_da_bitmap(giorno: date, inizi: int) -> list:
+    """Converte i bit accesi (in ordine crescente) negli orari di inizio del giorno."""
+    mezzanotte = datetime.combine(giorno, time.min)
+    orari = []
+    while inizi:
+        bit_basso = inizi & -inizi
+        orari.append(mezzanotte + _OFFSET_QUANTI[bit_basso.bit_length() - 1])
+        inizi ^= bit_basso
+    return orari
+
+
+def inizi_liberi(occupata: int, durata_servizio_min: int, fasce: tuple) -> int:
+    """Bitmap degli inizi liberi: per ogni fascia, finestre libere ∩ inizi candidati."""
+    quanti = durata_servizio_min // QUANTO_MIN
+    inizi = 0
+    for aperta, candidati in fasce:
+        inizi |= finestre_libere(aperta & ~occupata, quanti) & candidati
+    return inizi
+
+
+def _bitmap_applicabile(durata_servizio_min: int, fasce) -> bool:
+    return fasce is not None and durata_servizio_min > 0 and durata_servizio_min % QUANTO_MIN == 0
+
+
+def orari_liberi_bitmap(data_selezionata: date, durata_servizio_min: int, prenotazioni_esistenti: list,
+                        orari_apertura=ORARI_APERTURA, cadenza=SLOT_CADENZA) -> list:
+    """Stesso risultato di disponibilita.orari_liberi, calcolato sulla bitmap del giorno."""
+    fasce = _maschere_fasce(tuple(orari_apertura), int(cadenza.total_seconds()))
+    occupata = maschera_occupata(data_selezionata, prenotazioni_esistenti)
+
+    if not _bitmap_applicabile(durata_servizio_min, fasce) or occupata is None:
+        return orari_liberi(data_selezionata, durata_servizio_min, prenotazioni_esistenti, orari_apertura, cadenza)
+
+    return orari_da_bitmap(data_selezionata, inizi_liberi(occupata, durata_servizio_min, fasce))
+
+
+class ModelloSlot:
+    """
+    Griglia di inizi precompilata per (fasce di apertura di un giorno, cadenza, durata): vale per tutte
+    le date con quegli orari, quindi si calcola una volta al caricamento della configurazione.
+    """
+    __slots__ = ("durata_min", "fasce", "offset_inizi")
+
+    def __init__(self, orari_apertura, cadenza: timedelta, durata_servizio_min: int):
+        self.durata_min = durata_servizio_min
+        fasce = _maschere_fasce(tuple(orari_apertura), int(cadenza.total_seconds()))
+        self.fasce = fasce if _bitmap_applicabile(durata_servizio_min, fasce) else None
+        # Inizi di un giorno senza prenotazioni, come offset dalla mezzanotte (ordinati)
+        giorno_qualsiasi = date(2000, 1, 3)
+        mezzanotte = datetime.combine(giorno_qualsiasi, time.min)
+        self.offset_inizi = tuple(
+            inizio - mezzanotte for inizio in orari_liberi(giorno_qualsiasi, durata_servizio_min, [], orari_apertura, cadenza)
+        )
+
+
+def orari_liberi_modello(giorno: date, modello: ModelloSlot, prenotazioni_esistenti: list, occupata: int = None) -> list:
+    """
+    Orari liberi del giorno a partire da un ModelloSlot: niente datetime.combine né ricostruzione delle fasce.
+    `occupata` è la bitmap del giorno se già costruita (es. da costruisci_occupazioni).
+    """
+    mezzanotte = datetime.combine(giorno, time.min)
+    if not prenotazioni_esistenti and not occupata:
+        return [mezzanotte + offset for offset in modello.offset_inizi]
+
+    if modello.fasce is not None:
+        if occupata is None:
+            occupata = maschera_occupata(giorno, prenotazioni_esistenti)
+        if occupata is not None:
+            return orari_da_bitmap(giorno, inizi_liberi(occupata, modello.durata_min, modello.fasce))
+
+    candidati = (mezzanotte + offset for offset in modello.offset_inizi)
+    return orari_liberi_da_candidati(candidati, modello.durata_min, prenotazioni_esistenti)
+
+
+def costruisci_occupazioni(prenotazioni: list) -> dict:
+    """
+    Raggruppa per giorno e costruisce le bitmap in un solo passaggio: {data: bitmap}.
+    Un giorno con prenotazioni non allineate ha valore None (verrà calcolato con lo sweep).
+    """
+    per_giorno = defaultdict(list)
+    for intervallo in prenotazioni:
+        per_giorno[intervallo[0].date()].append(intervallo)
+    return {giorno: maschera_occupata(giorno, lista) for giorno, lista in per_giorno.items()}
+
+
+def itera_orari_liberi(giorni, durata_servizio_min: int, prenotazioni_per_barbiere: dict, barbieri,
+                       orari_apertura=ORARI_APERTURA, cadenza=SLOT_CADENZA, modelli=None):
+    """
+    Generatore pigro: per ogni giorno (nell'ordine dato) produce (giorno, {barbiere_id: [datetime, ...]}).
+    Le bitmap vengono costruite una volta per barbiere; chi consuma può fermarsi quando vuole
+    senza pagare il calcolo dei giorni successivi.
+
+    Con `modelli(barbiere_id, giorno, durata)` (es. ConfigurazioneNegozio.modello) gli orari di ogni
+    barbiere e giorno vengono dal ModelloSlot restituito, e None vuol dire barbiere assente quel giorno;
+    `orari_apertura` e `cadenza` vengono allora ignorati.
+    """
+    fasce = _maschere_fasce(tuple(orari_apertura), int(cadenza.total_seconds()))
+    applicabile = _bitmap_applicabile(durata_servizio_min, fasce)
+    occupazioni = {b: costruisci_occupazioni(prenotazioni_per_barbiere.get(b, [])) for b in barbieri}
+
+    for giorno in giorni:
+        per_barbiere = {}
+        for barbiere_id in barbieri:
+            occupata = occupazioni[barbiere_id].get(giorno, 0)
+            if modelli is not None:
+                modello = modelli(barbiere_id, giorno, durata_servizio_min)
+                if modello is None:
+                    per_barbiere[barbiere_id] = []
+                    continue
+                # Con la bitmap già pronta le prenotazioni del giorno servono solo per lo sweep di ripiego
+                del_giorno = [] if occupata is not None and modello.fasce is not None else [
+                    p for p in prenotazioni_per_barbiere.get(barbiere_id, []) if p[0].date() == giorno
+                ]
+                per_barbiere[barbiere_id] = orari_liberi_modello(giorno, modello, del_giorno, occupata)
+            elif applicabile and occupata is not None:
+                per_barbiere[barbiere_id] = orari_da_bitmap(giorno, inizi_liberi(occupata, durata_servizio_min, fasce))
+            else:
+                del_giorno = [p for p in prenotazioni_per_barbiere.get(barbiere_id, []) if p[0].date() == giorno]
+                per_barbiere[barbiere_id] = orari_liberi(giorno, durata_servizio_min, del_giorno, orari_apertura, cadenza)
+        yield giorno, per_barbiere
+
+
+def unione_orari_liberi(giorno: date, durata_servizio_min: int, prenotazioni_per_barbiere: dict, barbieri, modelli) -> list:
+    """
+    Modalità "barbiere indifferente": inizi in cui ALMENO UN barbiere è libero, in ordine e senza doppioni.
+    Le bitmap dei singoli barbieri si uniscono con un OR, quindi il costo è quello di un passaggio sulle
+    prenotazioni di tutti; solo un barbiere non allineato ai quanti passa dallo sweep (unito come insieme).
+    `modelli(barbiere_id, giorno, durata)` come in itera_orari_liberi.
+    """
+    unione = 0
+    extra = set()
+    for barbiere_id in barbieri:
+        modello = modelli(barbiere_id, giorno, durata_servizio_min)
+        if modello is None:
+            continue
+        prenotazioni = prenotazioni_per_barbiere.get(barbiere_id, ())
+        occupata = maschera_occupata(giorno, prenotazioni) if modello.fasce is not None else None
+        if occupata is not None:
+            unione |= inizi_liberi(occupata, modello.durata_min, modello.fasce)
+        else:
+            extra.update(orari_liberi_modello(giorno, modello, prenotazioni))
+
+    orari = orari_da_bitmap(giorno, unione)
+    if extra:
+        orari = sorted(extra.union(orari))
+    return orari
+
+
+def orari_liberi_intervallo_bitmap(data_inizio: date, data_fine: date, durata_servizio_min: int,
+                                   prenotazioni_per_barbiere: dict, barbieri=None,
+                                   orari_apertura=ORARI_APERTURA, cadenza=SLOT_CADENZA,
+                                   giorni_chiusura=GIORNI_CHIUSURA, modelli=None) -> dict:
+    """
+    Equivalente a disponibilita.orari_liberi_intervallo: {barbiere_id: {data: [datetime, ...]}}.
+    Pensata per scansionare settimane di disponibilità di tutti i barbieri.
+    """
+    if barbieri is None:
+        barbieri = BARBIERI
+
+    risultato = {barbiere_id: {} for barbiere_id in barbieri}
+    giorni = giorni_lavorativi(data_inizio, data_fine, giorni_chiusura)
+    for giorno, per_barbiere in itera_orari_liberi(giorni, durata_servizio_min, prenotazioni_per_barbiere,
+                                                   barbieri, orari_apertura, cadenza, modelli):
+        for barbiere_id, orari in per_barbiere.items():
+            risultato[barbiere_id][giorno] = orari
+
+    return risultato
@@ -0,0 +1,89 @@
+# File: core/profilazione.py
+
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from time import perf_counter, time
+
+# --- Profilazione per fasi di ogni rerun ---
+# Cronometra le fasi (fetch DB, calcolo slot, rendering) e tiene in memoria le ultime N durate
+# per fase, da cui si ricavano p50/p95. Spenta di default: si accende con NATILLO_PROFILING=1
+# oppure dal pannello admin. Da spenta, `fase()` costa un solo controllo booleano.
+
+PROFILAZIONE_ENV = "NATILLO_PROFILING"
+
+
+def _percentile(valori_ordinati: list, p: float) -> float:
+    """Percentile con interpolazione lineare su una lista già ordinata."""
+    if not valori_ordinati:
+        return 0.0
+    posizione = (len(valori_ordinati) - 1) * p
+    basso = int(posizione)
+    alto = min(basso + 1, len(valori_ordinati) - 1)
+    return valori_ordinati[basso] + (valori_ordinati[alto] - valori_ordinati[basso]) * (posizione - basso)
+
+
+class Profilatore:
+    """Finestre mobili delle durate per fase, condivise da tutte le sessioni del processo."""
+
+    def __init__(self, finestra: int = 500, attivo: bool = None):
+        if attivo is None:
+            attivo = os.environ.get(PROFILAZIONE_ENV, "").lower() in ("1", "true", "si", "yes")
+        self.attivo = attivo
+        self.finestra = finestra
+        # fase -> deque di (timestamp, durata_s)
+        self._campioni = defaultdict(lambda: deque(maxlen=self.finestra))
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def fase(self, nome: str):
+        """Cronometra il blocco come fase `nome` (nessun costo se la profilazione è spenta)."""
+        if not self.attivo:
+            yield
+            return
+        inizio = perf_counter()
+        try:
+            yield
+        finally:
+            self.registra(nome, perf_counter() - inizio)
+
+    def registra(self, nome: str, durata_s: float):
+        with self._lock:
+            self._campioni[nome].append((time(), durata_s))
+
+    def riepilogo(self) -> list:
+        """Una riga per fase con numero di campioni, p50, p95 e massimo in millisecondi."""
+        with self._lock:
+            istantanea = {nome: [d for _, d in campioni] for nome, campioni in self._campioni.items()}
+
+        righe = []
+        for nome, durate in sorted(istantanea.items()):
+            durate.sort()
+            righe.append({
+                'fase': nome,
+                'campioni': len(durate),
+                'p50_ms': round(_percentile(durate, 0.50) * 1000, 3),
+                'p95_ms': round(_percentile(durate, 0.95) * 1000, 3),
+                'max_ms': round(durate[-1] * 1000, 3),
+            })
+        return righe
+
+    def esporta_jsonl(self) -> str:
+        """Tutti i campioni in finestra come JSON lines, per l'analisi offline."""
+        with self._lock:
+            righe = [
+                json.dumps({'fase': nome, 'timestamp': ts, 'durata_ms': round(durata * 1000, 3)})
+                for nome, campioni in self._campioni.items()
+                for ts, durata in campioni
+            ]
+        return "\n".join(righe) + ("\n" if righe else "")
+
+    def azzera(self):
+        with self._lock:
+            self._campioni.clear()
+
+
+# Istanza condivisa dal processo (come cache_disponibilita)
+profilatore = Profilatore()
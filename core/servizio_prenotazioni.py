@@ -0,0 +1,332 @@
+# File: core/servizio_prenotazioni.py
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import String, and_, bindparam, delete, func, select, update
+from sqlalchemy.orm import aliased
+
+from core.db import sessione, intervallo_giorni, query_intervalli
+from core.modelli import Prenotazione
+from core.cache_disponibilita import cache_disponibilita
+from core.calendario import configurazione_corrente
+from core.notifiche import nuova_notifica
+
+# --- Servizio di scrittura delle prenotazioni ---
+# Controllo di sovrapposizione, insert e riga di outbox avvengono nella stessa transazione BEGIN IMMEDIATE:
+# due sessioni che puntano allo stesso slot vengono serializzate da SQLite e solo la
+# prima riesce. I lettori (in WAL) non vengono mai bloccati.
+
+
+class SlotNonDisponibile(Exception):
+    """Lo slot richiesto si sovrappone a una prenotazione già esistente."""
+
+
+def esiste_sovrapposizione(db, barbiere_id, inizio: datetime, fine: datetime) -> bool:
+    """True se il barbiere ha già una prenotazione che interseca [inizio, fine)."""
+    # Il limite inferiore sul giorno mantiene la query sull'indice (barbiere_id, data_appuntamento)
+    inizio_giorno, _ = intervallo_giorni(inizio.date())
+    return db.query(Prenotazione.id).filter(
+        Prenotazione.barbiere_id == barbiere_id,
+        Prenotazione.data_appuntamento >= inizio_giorno,
+        Prenotazione.data_appuntamento < fine,
+        Prenotazione.ora_fine > inizio
+    ).first() is not None
+
+
+def _inserisci_prenotazione(db, barbiere_id, inizio: datetime, fine: datetime, servizio: str,
+                            cliente_nome: str, cliente_telefono: str, dati_notifica: dict = None) -> int:
+    """Insert della prenotazione (e della riga di outbox) nella transazione già aperta; restituisce l'ID."""
+    nuova_prenotazione = Prenotazione(
+        barbiere_id=barbiere_id,
+        data_appuntamento=inizio,
+        ora_inizio=inizio,
+        ora_fine=fine,
+        servizio=servizio,
+        cliente_nome=cliente_nome,
+        cliente_telefono=cliente_telefono
+    )
+    db.add(nuova_prenotazione)
+    db.flush()
+    prenotazione_id = nuova_prenotazione.id
+
+    if dati_notifica is not None:
+        notifica = nuova_notifica(cliente_telefono, dati_notifica)
+        notifica.prenotazione_id = prenotazione_id
+        db.add(notifica)
+    return prenotazione_id
+
+
+def crea_prenotazione(barbiere_id, inizio: datetime, fine: datetime, servizio: str,
+                      cliente_nome: str, cliente_telefono: str, dati_notifica: dict = None) -> int:
+    """
+    Ricontrolla lo slot e inserisce la prenotazione in un'unica transazione immediata.
+    Con `dati_notifica` la conferma viene accodata nell'outbox nella stessa transazione.
+    Restituisce l'ID creato; solleva SlotNonDisponibile se lo slot è stato preso nel frattempo.
+    """
+    with sessione(immediata=True) as db:
+        if esiste_sovrapposizione(db, barbiere_id, inizio, fine):
+            raise SlotNonDisponibile(f"Orario {inizio.strftime('%H:%M')} non più disponibile.")
+        prenotazione_id = _inserisci_prenotazione(db, barbiere_id, inizio, fine, servizio,
+                                                  cliente_nome, cliente_telefono, dati_notifica)
+
+    cache_disponibilita.invalida(barbiere_id, inizio.date())
+    return prenotazione_id
+
+
+def _in_orario(configurazione, barbiere_id, inizio: datetime, fine: datetime) -> bool:
+    """True se [inizio, fine) sta dentro una fascia di lavoro del barbiere in quel giorno."""
+    return inizio.date() == fine.date() and any(
+        apertura <= inizio.time() and fine.time() <= chiusura
+        for apertura, chiusura in configurazione.orari_del_giorno(barbiere_id, inizio.date())
+    )
+
+
+def crea_prenotazione_qualsiasi(inizio: datetime, fine: datetime, servizio: str, cliente_nome: str,
+                                cliente_telefono: str, dati_notifica: dict = None) -> tuple:
+    """
+    Modalità "barbiere indifferente": assegna lo slot al barbiere attivo MENO CARICO quel giorno (minuti già
+    prenotati, a parità l'ID più basso) tra quelli che lavorano a quell'ora e sono liberi.
+    Lettura delle prenotazioni del giorno, scelta e insert stanno nella stessa transazione immediata, quindi
+    la disponibilità del barbiere scelto è ricontrollata in modo atomico.
+    La notifica (`dati_notifica`) riporta il barbiere assegnato; il dict del chiamante non viene modificato.
+    Restituisce (ID creato, barbiere_id); SlotNonDisponibile se nessun barbiere è più libero.
+    """
+    configurazione = configurazione_corrente()
+    barbieri = [b for b in configurazione.barbieri if _in_orario(configurazione, b, inizio, fine)]
+    if not barbieri:
+        raise SlotNonDisponibile(f"Orario {inizio.strftime('%H:%M')} non più disponibile.")
+
+    with sessione(immediata=True) as db:
+        # Una query per tutti i barbieri: carico del giorno e sovrapposizioni nello stesso passaggio
+        carico = dict.fromkeys(barbieri, timedelta(0))
+        occupati = set()
+        inizio_giorno, fine_giorno = intervallo_giorni(inizio.date())
+        for barbiere_id, ora_inizio, ora_fine in query_intervalli(db, barbieri, inizio_giorno, fine_giorno):
+            carico[barbiere_id] += ora_fine - ora_inizio
+            if ora_inizio < fine and ora_fine > inizio:
+                occupati.add(barbiere_id)
+
+        liberi = [b for b in barbieri if b not in occupati]
+        if not liberi:
+            raise SlotNonDisponibile(f"Orario {inizio.strftime('%H:%M')} non più disponibile.")
+        barbiere_id = min(liberi, key=lambda b: (carico[b], b))
+
+        if dati_notifica is not None:
+            dati_notifica = {**dati_notifica, 'barbiere_id': barbiere_id, 'barbiere_nome': configurazione.barbieri[barbiere_id]}
+        prenotazione_id = _inserisci_prenotazione(db, barbiere_id, inizio, fine, servizio,
+                                                  cliente_nome, cliente_telefono, dati_notifica)
+
+    cache_disponibilita.invalida(barbiere_id, inizio.date())
+    return prenotazione_id, barbiere_id
+
+
+# --- Modifiche in blocco dall'agenda admin ---
+# L'agenda raccoglie cancellazioni e correzioni di più righe e le applica con un solo commit,
+# invece di una transazione (e un rerun) per ogni pulsante.
+
+CAMPI_MODIFICABILI = ('cliente_nome', 'cliente_telefono')
+
+
+def modifica_prenotazioni(da_eliminare=(), modifiche: dict = None) -> dict:
+    """
+    Elimina le prenotazioni `da_eliminare` e aggiorna i dati cliente di `modifiche` ({id: {campo: valore}})
+    in un'unica transazione immediata. Restituisce {'eliminate': n, 'aggiornate': n, 'non_trovate': n}:
+    conteggi delle righe davvero toccate, perché una prenotazione può sparire tra la lettura dell'agenda
+    e il salvataggio (altro admin, archiviazione, annullamento in blocco) senza far fallire le altre.
+    """
+    da_eliminare = set(da_eliminare)
+    # Raggruppati per insieme di campi: ogni gruppo è un solo UPDATE preparato in executemany
+    aggiornamenti = {}
+    for prenotazione_id, campi in (modifiche or {}).items():
+        non_ammessi = set(campi) - set(CAMPI_MODIFICABILI)
+        if non_ammessi:
+            raise ValueError(f"Campi non modificabili dall'agenda: {', '.join(sorted(non_ammessi))}")
+        # Una riga che viene eliminata non va anche aggiornata
+        if campi and prenotazione_id not in da_eliminare:
+            aggiornamenti.setdefault(tuple(sorted(campi)), []).append({'b_id': prenotazione_id, **campi})
+
+    eliminate = []
+    aggiornate = 0
+    with sessione(immediata=True) as db:
+        if da_eliminare:
+            # RETURNING: i giorni da invalidare escono dalla stessa DELETE, senza una SELECT prima
+            eliminate = db.execute(
+                delete(Prenotazione).where(Prenotazione.id.in_(da_eliminare))
+                .returning(Prenotazione.barbiere_id, Prenotazione.data_appuntamento)
+            ).all()
+        for campi, righe in aggiornamenti.items():
+            # UPDATE Core (non il bulk ORM per chiave primaria, che solleva StaleDataError se una riga
+            # non c'è più): un id mancante aggiorna zero righe e il rowcount dice quante sono andate a buon fine
+            aggiornate += db.execute(
+                update(Prenotazione.__table__).where(Prenotazione.__table__.c.id == bindparam('b_id'))
+                .values({campo: bindparam(campo) for campo in campi}),
+                righe
+            ).rowcount
+
+    # Nome e telefono non cambiano la disponibilità: si invalidano solo i giorni con righe eliminate
+    for barbiere_id, giorno in {(b, d.date()) for b, d in eliminate}:
+        cache_disponibilita.invalida(barbiere_id, giorno)
+    richieste = len(da_eliminare) + sum(len(righe) for righe in aggiornamenti.values())
+    return {'eliminate': len(eliminate), 'aggiornate': aggiornate,
+            'non_trovate': richieste - len(eliminate) - aggiornate}
+
+
+# --- Operazioni in blocco su un barbiere e un intervallo di giorni ---
+# Malattia o imprevisto: annullare, riassegnare o spostare tutte le prenotazioni di un barbiere con
+# UN solo DELETE/UPDATE ... RETURNING in una transazione immediata, invece di una sessione con
+# SELECT + DELETE per ogni prenotazione. Le righe restituite (stesse chiavi di leggi_agenda)
+# servono all'interfaccia e, con `avvisa_clienti`, diventano notifiche nella stessa transazione.
+
+_COLONNE_RESTITUITE = (
+    Prenotazione.id, Prenotazione.barbiere_id, Prenotazione.ora_inizio, Prenotazione.ora_fine,
+    Prenotazione.servizio, Prenotazione.cliente_nome, Prenotazione.cliente_telefono,
+)
+
+
+def _filtro_intervallo(barbiere_id, data_inizio: date, data_fine: date = None) -> tuple:
+    """Condizioni sargable sull'indice (barbiere_id, data_appuntamento) per i giorni indicati (inclusi)."""
+    inizio, fine = intervallo_giorni(data_inizio, data_fine)
+    return (
+        Prenotazione.barbiere_id == barbiere_id,
+        Prenotazione.data_appuntamento >= inizio,
+        Prenotazione.data_appuntamento < fine,
+    )
+
+
+def _righe_restituite(risultato) -> list:
+    righe = [
+        {
+            'id': prenotazione_id, 'barbiere_id': barbiere_id, 'start': ora_inizio, 'end': ora_fine,
+            'servizio': servizio, 'cliente_nome': cliente_nome, 'cliente_telefono': cliente_telefono,
+        }
+        for prenotazione_id, barbiere_id, ora_inizio, ora_fine, servizio, cliente_nome, cliente_telefono in risultato
+    ]
+    righe.sort(key=lambda riga: riga['start'])
+    return righe
+
+
+def _sposta_datetime(colonna, secondi: int):
+    """
+    `colonna + secondi` calcolato da SQLite, nel formato testuale con cui SQLAlchemy salva i DateTime
+    ('AAAA-MM-GG HH:MM:SS.ffffff'): i microsecondi originali vengono riattaccati, così i confronti
+    tra stringhe con le altre righe restano corretti.
+    """
+    return func.strftime('%Y-%m-%d %H:%M:%S', colonna, f'{secondi:+d} seconds', type_=String) + func.substr(colonna, 20)
+
+
+def _verifica_slot(db, configurazione, righe: list):
+    """
+    Dopo l'UPDATE, ancora dentro la transazione: ogni riga deve stare nelle fasce di lavoro del suo
+    barbiere e non sovrapporsi a nessun'altra prenotazione. Altrimenti SlotNonDisponibile (e rollback).
+    """
+    for riga in righe:
+        if not _in_orario(configurazione, riga['barbiere_id'], riga['start'], riga['end']):
+            raise SlotNonDisponibile(
+                f"{riga['start'].strftime('%d/%m/%Y %H:%M')} fuori dall'orario di "
+                f"{configurazione.nomi_barbieri.get(riga['barbiere_id'], riga['barbiere_id'])}."
+            )
+
+    # Un solo self-join per tutte le righe toccate, sull'indice (barbiere_id, data_appuntamento)
+    altra = aliased(Prenotazione)
+    conflitto = db.execute(
+        select(Prenotazione.ora_inizio).join(altra, and_(
+            altra.barbiere_id == Prenotazione.barbiere_id,
+            altra.id != Prenotazione.id,
+            altra.data_appuntamento >= func.date(Prenotazione.data_appuntamento),
+            altra.data_appuntamento < Prenotazione.ora_fine,
+            altra.ora_fine > Prenotazione.ora_inizio,
+        )).where(Prenotazione.id.in_([riga['id'] for riga in righe]))
+        .order_by(Prenotazione.ora_inizio).limit(1)
+    ).scalar()
+    if conflitto is not None:
+        raise SlotNonDisponibile(f"Orario {conflitto.strftime('%d/%m/%Y %H:%M')} già occupato.")
+
+
+def _accoda_avvisi(db, configurazione, righe: list, tipo: str):
+    """Una notifica per prenotazione toccata, nella stessa transazione dell'operazione in blocco."""
+    db.add_all([
+        nuova_notifica(riga['cliente_telefono'], {
+            'tipo': tipo,
+            'cliente_nome': riga['cliente_nome'],
+            'servizio': riga['servizio'],
+            'barbiere_nome': configurazione.nomi_barbieri.get(riga['barbiere_id'], ''),
+            'data': riga['start'].strftime("%d/%m/%Y"),
+            'ora_inizio': riga['start'].strftime("%H:%M"),
+        })
+        for riga in righe if riga['cliente_telefono']
+    ])
+
+
+def annulla_prenotazioni(barbiere_id, data_inizio: date, data_fine: date = None, avvisa_clienti: bool = False) -> list:
+    """Cancella tutte le prenotazioni del barbiere nei giorni indicati; restituisce le righe cancellate."""
+    configurazione = configurazione_corrente()
+    with sessione(immediata=True) as db:
+        righe = _righe_restituite(db.execute(
+            delete(Prenotazione).where(*_filtro_intervallo(barbiere_id, data_inizio, data_fine))
+            .returning(*_COLONNE_RESTITUITE)
+        ))
+        if avvisa_clienti:
+            _accoda_avvisi(db, configurazione, righe, "annullamento")
+
+    for giorno in {riga['start'].date() for riga in righe}:
+        cache_disponibilita.invalida(barbiere_id, giorno)
+    return righe
+
+
+def riassegna_prenotazioni(da_barbiere_id, a_barbiere_id, data_inizio: date, data_fine: date = None,
+                           avvisa_clienti: bool = False) -> list:
+    """
+    Passa tutte le prenotazioni dei giorni indicati da un barbiere all'altro, agli stessi orari.
+    Se anche una sola cade fuori dall'orario del nuovo barbiere o si sovrappone a un suo appuntamento,
+    non viene spostato nulla (SlotNonDisponibile). Restituisce le righe riassegnate.
+    """
+    if da_barbiere_id == a_barbiere_id:
+        raise ValueError("Il barbiere di destinazione deve essere diverso da quello di origine.")
+    configurazione = configurazione_corrente()
+    with sessione(immediata=True) as db:
+        righe = _righe_restituite(db.execute(
+            update(Prenotazione).where(*_filtro_intervallo(da_barbiere_id, data_inizio, data_fine))
+            .values(barbiere_id=a_barbiere_id)
+            .returning(*_COLONNE_RESTITUITE)
+        ))
+        if righe:
+            _verifica_slot(db, configurazione, righe)
+        if avvisa_clienti:
+            _accoda_avvisi(db, configurazione, righe, "modifica")
+
+    for giorno in {riga['start'].date() for riga in righe}:
+        cache_disponibilita.invalida(da_barbiere_id, giorno)
+        cache_disponibilita.invalida(a_barbiere_id, giorno)
+    return righe
+
+
+def sposta_prenotazioni(barbiere_id, data_inizio: date, data_fine: date = None, scostamento: timedelta = timedelta(0),
+                        avvisa_clienti: bool = False) -> list:
+    """
+    Sposta di `scostamento` (anche negativo) tutte le prenotazioni del barbiere nei giorni indicati.
+    Tutto o niente come riassegna_prenotazioni; restituisce le righe con i nuovi orari.
+    """
+    secondi = int(scostamento.total_seconds())
+    if not secondi:
+        return []
+    configurazione = configurazione_corrente()
+    with sessione(immediata=True) as db:
+        righe = _righe_restituite(db.execute(
+            update(Prenotazione).where(*_filtro_intervallo(barbiere_id, data_inizio, data_fine))
+            .values(
+                data_appuntamento=_sposta_datetime(Prenotazione.data_appuntamento, secondi),
+                ora_inizio=_sposta_datetime(Prenotazione.ora_inizio, secondi),
+                ora_fine=_sposta_datetime(Prenotazione.ora_fine, secondi),
+            )
+            .returning(*_COLONNE_RESTITUITE)
+        ))
+        if righe:
+            _verifica_slot(db, configurazione, righe)
+        if avvisa_clienti:
+            _accoda_avvisi(db, configurazione, righe, "modifica")
+
+    # Giorni di partenza e di arrivo
+    for riga in righe:
+        cache_disponibilita.invalida(barbiere_id, riga['start'].date())
+        cache_disponibilita.invalida(barbiere_id, (riga['start'] - scostamento).date())
+    return righe
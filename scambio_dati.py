@@ -0,0 +1,340 @@
+# File: scambio_dati.py
+
+import argparse
+import csv
+import io
+import json
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from core.db import sessione, init_db, intervallo_giorni
+from core.modelli import Prenotazione, PrenotazioneArchiviata
+from core.calendario import configurazione_corrente
+from core.cache_disponibilita import cache_disponibilita
+
+# --- Importazione ed esportazione delle prenotazioni (CSV / JSON lines) ---
+# L'import legge il file riga per riga, valida servizio, barbiere e sovrapposizioni e inserisce
+# a blocchi con un'unica insert executemany per blocco. L'export scorre il cursore e scrive
+# una riga alla volta: nessuno dei due carica l'intera tabella (o l'intero file) in memoria.
+#
+#   python scambio_dati.py importa agenda.csv [--simula]
+#   python scambio_dati.py esporta --dal 2025-01-01 --al 2025-12-31 --formato json -o stagione.jsonl
+
+CAMPI = ('barbiere_id', 'barbiere', 'inizio', 'fine', 'servizio', 'cliente_nome', 'cliente_telefono')
+FORMATI = ('csv', 'json')
+
+BLOCCO_IMPORT = 1000
+BLOCCO_EXPORT = 1000
+# Oltre questo numero gli errori vengono solo contati, non conservati
+MAX_ERRORI_RIPORTATI = 200
+
+
+class RigaNonValida(ValueError):
+    """Una riga del file di import non rispetta servizi, barbieri o orari."""
+
+
+# --- Lettura del file ---
+
+def leggi_righe(file, formato: str):
+    """
+    Genera (numero_riga, dict) dal file di testo aperto. Per il JSON accetta JSON lines (un oggetto
+    per riga, letto in streaming) oppure un array JSON, che invece viene caricato tutto.
+    """
+    if formato == 'csv':
+        # Il numero di riga conta l'intestazione, come lo vede chi apre il file in un foglio di calcolo
+        for numero, riga in enumerate(csv.DictReader(file), start=2):
+            yield numero, riga
+        return
+
+    if formato != 'json':
+        raise ValueError(f"Formato sconosciuto: {formato}")
+
+    primo = file.read(1)
+    while primo and primo.isspace():
+        primo = file.read(1)
+    if primo == "[":
+        for numero, oggetto in enumerate(json.loads(primo + file.read()), start=1):
+            yield numero, oggetto
+        return
+
+    for numero, linea in enumerate(_righe_con_primo_carattere(primo, file), start=1):
+        if linea.strip():
+            try:
+                yield numero, json.loads(linea)
+            except json.JSONDecodeError:
+                # valida_riga la scarterà: una riga rotta non deve fermare l'intero import
+                yield numero, linea
+
+
+def _righe_con_primo_carattere(primo: str, file):
+    """Rimette in testa il carattere già consumato per riconoscere il formato."""
+    prima_linea = primo + file.readline()
+    yield prima_linea
+    yield from file
+
+
+# --- Validazione ---
+
+def _barbiere_da_riga(riga: dict, barbieri: dict) -> int:
+    valore = str(riga.get('barbiere_id') or riga.get('barbiere') or "").strip()
+    if valore.isdigit() and int(valore) in barbieri:
+        return int(valore)
+    for barbiere_id, nome in barbieri.items():
+        if nome.lower() == valore.lower():
+            return barbiere_id
+    raise RigaNonValida(f"Barbiere sconosciuto: '{valore}'")
+
+
+def _data_ora(valore, campo: str) -> datetime:
+    if isinstance(valore, datetime):
+        return _ora_locale(valore)
+    testo = str(valore or "").strip()
+    for formato in (None, "%d/%m/%Y %H:%M"):
+        try:
+            return _ora_locale(datetime.fromisoformat(testo) if formato is None else datetime.strptime(testo, formato))
+        except ValueError:
+            pass
+    raise RigaNonValida(f"{campo} non valido: '{testo}' (atteso AAAA-MM-GG HH:MM o GG/MM/AAAA HH:MM)")
+
+
+def _ora_locale(valore: datetime) -> datetime:
+    """
+    Le prenotazioni sono salvate in ora locale senza fuso: un orario con offset o "Z" (accettati da
+    fromisoformat) viene convertito, altrimenti il confronto con le righe naive farebbe fallire l'import.
+    """
+    if valore.tzinfo is None:
+        return valore
+    return valore.astimezone().replace(tzinfo=None)
+
+
+def valida_riga(riga: dict, configurazione=None) -> dict:
+    """
+    Converte una riga del file nei valori di una Prenotazione, secondo la configurazione del negozio
+    (i barbieri disattivati sono ammessi: l'import serve anche a recuperare lo storico).
+    Il servizio può essere il nome ("Barba") o la forma salvata dal modulo clienti ("Barba (15 min)");
+    se manca `fine` viene calcolata dalla durata del servizio.
+    """
+    if not isinstance(riga, dict):
+        raise RigaNonValida("La riga non è un oggetto JSON valido")
+    if configurazione is None:
+        configurazione = configurazione_corrente()
+    barbiere_id = _barbiere_da_riga(riga, configurazione.nomi_barbieri)
+
+    servizio = str(riga.get('servizio') or "").strip()
+    nome_servizio = servizio.split(" (")[0]
+    if nome_servizio not in configurazione.servizi:
+        raise RigaNonValida(f"Servizio sconosciuto: '{servizio}'")
+
+    inizio = _data_ora(riga.get('inizio'), "inizio")
+    if riga.get('fine'):
+        fine = _data_ora(riga['fine'], "fine")
+    else:
+        fine = inizio + timedelta(minutes=configurazione.servizi[nome_servizio])
+    if fine <= inizio or fine.date() != inizio.date():
+        raise RigaNonValida(f"Intervallo non valido: {inizio} - {fine}")
+
+    cliente_nome = str(riga.get('cliente_nome') or "").strip()
+    cliente_telefono = str(riga.get('cliente_telefono') or "").strip()
+    if not cliente_nome or not cliente_telefono:
+        raise RigaNonValida("Nome e telefono del cliente sono obbligatori")
+
+    return {
+        'barbiere_id': barbiere_id,
+        'data_appuntamento': inizio,
+        'ora_inizio': inizio,
+        'ora_fine': fine,
+        'servizio': servizio,
+        'cliente_nome': cliente_nome,
+        'cliente_telefono': cliente_telefono,
+    }
+
+
+def _si_sovrappone(intervalli: list, inizio: datetime, fine: datetime) -> bool:
+    return any(i < fine and inizio < f for i, f in intervalli)
+
+
+# --- Importazione ---
+
+def _importa_blocco(blocco: list, rapporto: dict, simula: bool, nomi_barbieri: dict) -> set:
+    """
+    Controlla le sovrapposizioni del blocco (con il DB e tra le righe stesse) e inserisce le righe valide
+    con un'unica insert executemany, in una transazione immediata. Restituisce i (barbiere, giorno) toccati.
+    """
+    barbieri_ids = {valori['barbiere_id'] for _, valori in blocco}
+    inizio, fine = intervallo_giorni(
+        min(valori['ora_inizio'] for _, valori in blocco).date(),
+        max(valori['ora_inizio'] for _, valori in blocco).date()
+    )
+
+    # La transazione immediata tiene fermo il DB tra il controllo e l'insert (non serve se si simula)
+    with sessione(immediata=not simula) as db:
+        # Solo le colonne che servono al controllo, con una sola query per blocco
+        occupati = defaultdict(list)
+        for barbiere_id, ora_inizio, ora_fine in db.execute(
+            select(Prenotazione.barbiere_id, Prenotazione.ora_inizio, Prenotazione.ora_fine).where(
+                Prenotazione.barbiere_id.in_(barbieri_ids),
+                Prenotazione.data_appuntamento >= inizio,
+                Prenotazione.data_appuntamento < fine
+            )
+        ):
+            occupati[barbiere_id, ora_inizio.date()].append((ora_inizio, ora_fine))
+
+        da_inserire = []
+        for numero, valori in blocco:
+            chiave = (valori['barbiere_id'], valori['ora_inizio'].date())
+            if _si_sovrappone(occupati[chiave], valori['ora_inizio'], valori['ora_fine']):
+                _registra_errore(rapporto, numero, f"Si sovrappone a un'altra prenotazione di {nomi_barbieri[chiave[0]]}")
+                continue
+            occupati[chiave].append((valori['ora_inizio'], valori['ora_fine']))
+            da_inserire.append(valori)
+
+        if da_inserire and not simula:
+            db.execute(insert(Prenotazione), da_inserire)
+        rapporto['importate'] += len(da_inserire)
+
+    return {(valori['barbiere_id'], valori['ora_inizio'].date()) for valori in da_inserire}
+
+
+def _registra_errore(rapporto: dict, numero: int, messaggio: str):
+    rapporto['scartate'] += 1
+    if len(rapporto['errori']) < MAX_ERRORI_RIPORTATI:
+        rapporto['errori'].append((numero, messaggio))
+
+
+def importa_prenotazioni(file, formato: str = 'csv', simula: bool = False, dimensione_blocco: int = BLOCCO_IMPORT) -> dict:
+    """
+    Importa le prenotazioni dal file di testo aperto. Le righe non valide o sovrapposte vengono scartate
+    e riportate, le altre inserite a blocchi. Con `simula=True` valida tutto ma non scrive nulla.
+    Restituisce {'lette', 'importate', 'scartate', 'errori': [(riga, messaggio), ...]}.
+    """
+    rapporto = {'lette': 0, 'importate': 0, 'scartate': 0, 'errori': []}
+    configurazione = configurazione_corrente()
+    toccati = set()
+    blocco = []
+
+    for numero, riga in leggi_righe(file, formato):
+        rapporto['lette'] += 1
+        try:
+            blocco.append((numero, valida_riga(riga, configurazione)))
+        except RigaNonValida as e:
+            _registra_errore(rapporto, numero, str(e))
+            continue
+        if len(blocco) >= dimensione_blocco:
+            toccati |= _importa_blocco(blocco, rapporto, simula, configurazione.nomi_barbieri)
+            blocco = []
+    if blocco:
+        toccati |= _importa_blocco(blocco, rapporto, simula, configurazione.nomi_barbieri)
+
+    rapporto['errori'].sort()
+    if not simula:
+        for barbiere_id, giorno in toccati:
+            cache_disponibilita.invalida(barbiere_id, giorno)
+    return rapporto
+
+
+# --- Esportazione ---
+
+def itera_prenotazioni(data_inizio: date, data_fine: date):
+    """
+    Genera le prenotazioni dell'intervallo (inclusi) come dict, leggendo il cursore a blocchi.
+    Prima quelle in archivio (le più vecchie, vedi archivio.py), poi quelle della tabella calda.
+    """
+    inizio, fine = intervallo_giorni(data_inizio, data_fine)
+    nomi_barbieri = configurazione_corrente().nomi_barbieri
+    with sessione() as db:
+        for tabella in (PrenotazioneArchiviata, Prenotazione):
+            risultato = db.execute(
+                select(
+                    tabella.barbiere_id, tabella.ora_inizio, tabella.ora_fine,
+                    tabella.servizio, tabella.cliente_nome, tabella.cliente_telefono
+                ).where(
+                    tabella.data_appuntamento >= inizio,
+                    tabella.data_appuntamento < fine
+                ).order_by(tabella.data_appuntamento, tabella.id) # ordine dell'indice: niente sort
+                .execution_options(yield_per=BLOCCO_EXPORT)
+            )
+            for barbiere_id, ora_inizio, ora_fine, servizio, cliente_nome, cliente_telefono in risultato:
+                yield {
+                    'barbiere_id': barbiere_id,
+                    'barbiere': nomi_barbieri.get(barbiere_id, ""),
+                    'inizio': ora_inizio.isoformat(sep=" ", timespec="minutes"),
+                    'fine': ora_fine.isoformat(sep=" ", timespec="minutes"),
+                    'servizio': servizio,
+                    'cliente_nome': cliente_nome,
+                    'cliente_telefono': cliente_telefono,
+                }
+
+
+def esporta_prenotazioni(file, data_inizio: date, data_fine: date, formato: str = 'csv') -> int:
+    """Scrive nel file di testo aperto le prenotazioni dell'intervallo; restituisce quante ne ha scritte."""
+    if formato not in FORMATI:
+        raise ValueError(f"Formato sconosciuto: {formato}")
+
+    scrittore = csv.DictWriter(file, fieldnames=CAMPI) if formato == 'csv' else None
+    if scrittore:
+        scrittore.writeheader()
+
+    scritte = 0
+    for riga in itera_prenotazioni(data_inizio, data_fine):
+        if scrittore:
+            scrittore.writerow(riga)
+        else:
+            file.write(json.dumps(riga, ensure_ascii=False) + "\n")
+        scritte += 1
+    return scritte
+
+
+def esporta_in_memoria(data_inizio: date, data_fine: date, formato: str = 'csv') -> bytes:
+    """Per il pulsante di download del pannello admin, che vuole il contenuto completo."""
+    buffer = io.StringIO()
+    esporta_prenotazioni(buffer, data_inizio, data_fine, formato)
+    return buffer.getvalue().encode("utf-8")
+
+
+# --- Riga di comando ---
+
+def _formato_da_nome(percorso: str) -> str:
+    return 'csv' if percorso.lower().endswith(".csv") else 'json'
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python scambio_dati.py", description="Import/export delle prenotazioni.")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+
+    importa = comandi.add_parser("importa", help="Importa prenotazioni da CSV o JSON")
+    importa.add_argument("file")
+    importa.add_argument("--formato", choices=FORMATI, help="Default: dedotto dall'estensione")
+    importa.add_argument("--simula", action="store_true", help="Valida senza scrivere nel database")
+
+    esporta = comandi.add_parser("esporta", help="Esporta le prenotazioni di un intervallo di date")
+    esporta.add_argument("--dal", type=date.fromisoformat, required=True)
+    esporta.add_argument("--al", type=date.fromisoformat, required=True)
+    esporta.add_argument("--formato", choices=FORMATI, default='csv')
+    esporta.add_argument("-o", "--output", help="File di destinazione (default: standard output)")
+
+    args = parser.parse_args(argv)
+    init_db()
+
+    if args.comando == "importa":
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            rapporto = importa_prenotazioni(f, args.formato or _formato_da_nome(args.file), args.simula)
+        for numero, messaggio in rapporto['errori']:
+            print(f"Riga {numero}: {messaggio}", file=sys.stderr)
+        print(f"Lette {rapporto['lette']}, {'valide' if args.simula else 'importate'} {rapporto['importate']}, "
+              f"scartate {rapporto['scartate']}")
+        return 1 if rapporto['scartate'] else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            scritte = esporta_prenotazioni(f, args.dal, args.al, args.formato)
+        print(f"Esportate {scritte} prenotazioni in {args.output}")
+    else:
+        esporta_prenotazioni(sys.stdout, args.dal, args.al, args.formato)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
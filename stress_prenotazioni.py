@@ -0,0 +1,70 @@
+# File: stress_prenotazioni.py
+#
+# Stress test di concorrenza: molti thread provano a prenotare LO STESSO slot nello stesso istante.
+# Atteso: esattamente un vincitore, tutti gli altri respinti con SlotNonDisponibile,
+# nessun OperationalError ("database is locked").
+#
+# Uso: python stress_prenotazioni.py [numero_thread]
+
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from core import db as database
+from core.modelli import Prenotazione
+from core.servizio_prenotazioni import crea_prenotazione, SlotNonDisponibile
+
+
+def esegui_stress(numero_thread: int = 50) -> dict:
+    """Lancia `numero_thread` prenotazioni concorrenti sullo stesso slot di un DB temporaneo."""
+    cartella = tempfile.mkdtemp(prefix="natillo_stress_")
+    database.configura_database(f"sqlite:///{os.path.join(cartella, 'stress.db')}")
+    database.init_db()
+
+    inizio = datetime.combine(datetime.today().date() + timedelta(days=1), datetime.min.time()).replace(hour=9)
+    fine = inizio + timedelta(minutes=30)
+
+    partenza = threading.Barrier(numero_thread)
+    lock_esiti = threading.Lock()
+    esiti = {'vincitori': 0, 'respinti': 0, 'errori_lock': 0, 'altri_errori': []}
+
+    def cliente(numero):
+        partenza.wait()
+        try:
+            crea_prenotazione(1, inizio, fine, "Taglio Uomo (30 min)", f"Cliente {numero}", f"333{numero:07d}")
+            chiave = 'vincitori'
+        except SlotNonDisponibile:
+            chiave = 'respinti'
+        except OperationalError:
+            chiave = 'errori_lock'
+        except Exception as e:
+            with lock_esiti:
+                esiti['altri_errori'].append(repr(e))
+            return
+        with lock_esiti:
+            esiti[chiave] += 1
+
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(numero_thread)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with database.sessione() as db:
+        esiti['righe_nel_db'] = db.query(Prenotazione).count()
+    return esiti
+
+
+if __name__ == "__main__":
+    numero_thread = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    esiti = esegui_stress(numero_thread)
+    print(esiti)
+
+    ok = (esiti['vincitori'] == 1 and esiti['righe_nel_db'] == 1
+          and esiti['errori_lock'] == 0 and not esiti['altri_errori'])
+    print("OK: un solo vincitore, nessun errore di lock." if ok else "FALLITO")
+    sys.exit(0 if ok else 1)
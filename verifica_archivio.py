@@ -0,0 +1,82 @@
+# File: verifica_archivio.py
+#
+# Verifica dell'archiviazione ripetuta: prenotazioni archiviate, nuovi ID che SQLite riusa nella tabella
+# calda, seconda archiviazione. Con la chiave primaria dell'archivio uguale all'ID originale la seconda
+# archiviazione falliva per sempre con "UNIQUE constraint failed: prenotazioni_archivio.id".
+#
+# Sequenza: una prenotazione futura (id 1), import di una stagione vecchia (id 2-6), archiviazione,
+# nuova prenotazione vecchia (SQLite riusa l'id 2), seconda archiviazione.
+#
+# Uso: python verifica_archivio.py
+
+import io
+import os
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from core import db as database
+from core.modelli import Prenotazione, PrenotazioneArchiviata
+from core.calendario import configurazione_corrente
+from core.servizio_prenotazioni import crea_prenotazione
+from scambio_dati import importa_prenotazioni
+from archivio import archivia_prenotazioni, limite_archiviazione
+
+SERVIZIO = "Taglio Uomo (30 min)"
+
+
+def esegui_verifica() -> dict:
+    """Esegue la sequenza su un DB temporaneo e restituisce gli ID visti a ogni passo."""
+    cartella = tempfile.mkdtemp(prefix="natillo_archivio_")
+    database.configura_database(f"sqlite:///{os.path.join(cartella, 'archivio.db')}")
+    database.init_db()
+    configurazione = configurazione_corrente()
+    barbiere_id = next(iter(configurazione.barbieri))
+
+    def alle_nove(giorno: date) -> datetime:
+        return datetime.combine(giorno, time(9))
+
+    esiti = {}
+    futuro = configurazione.primo_giorno_aperto(date.today() + timedelta(days=7), barbiere_id)
+    esiti['prima_prenotazione'] = crea_prenotazione(barbiere_id, alle_nove(futuro), alle_nove(futuro) + timedelta(minutes=30),
+                                                    SERVIZIO, "Futuro", "3330000001")
+
+    # Stagione vecchia: cinque giorni di lavoro consecutivi, ben oltre la soglia di archiviazione
+    giorni, giorno = [], date.today() - timedelta(days=400)
+    while len(giorni) < 6:
+        giorno = configurazione.primo_giorno_aperto(giorno, barbiere_id)
+        giorni.append(giorno)
+        giorno += timedelta(days=1)
+    righe = ["barbiere_id,inizio,servizio,cliente_nome,cliente_telefono"] + [
+        f"{barbiere_id},{alle_nove(g):%Y-%m-%d %H:%M},{SERVIZIO},Stagione {i},333000010{i}" for i, g in enumerate(giorni[:5])
+    ]
+    esiti['import'] = importa_prenotazioni(io.StringIO("\n".join(righe) + "\n"), 'csv')['importate']
+
+    limite = limite_archiviazione()
+    esiti['prima_archiviazione'] = archivia_prenotazioni(limite)
+
+    # L'id più alto rimasto è 1: SQLite riassegna il 2, già presente in archivio come ID originale
+    esiti['id_riusato'] = crea_prenotazione(barbiere_id, alle_nove(giorni[5]), alle_nove(giorni[5]) + timedelta(minutes=30),
+                                            SERVIZIO, "Di nuovo", "3330000002")
+    esiti['seconda_archiviazione'] = archivia_prenotazioni(limite)
+
+    with database.sessione() as db:
+        esiti['id_originali_in_archivio'] = db.execute(
+            select(PrenotazioneArchiviata.id_originale).order_by(PrenotazioneArchiviata.id)
+        ).scalars().all()
+        esiti['righe_calde'] = db.execute(select(Prenotazione.id)).scalars().all()
+    return esiti
+
+
+if __name__ == "__main__":
+    esiti = esegui_verifica()
+    print(esiti)
+
+    ok = (esiti['prima_archiviazione'] == 5 and esiti['seconda_archiviazione'] == 1
+          and esiti['id_riusato'] in esiti['id_originali_in_archivio'][:5]
+          and sorted(esiti['id_originali_in_archivio']) == sorted([2, 3, 4, 5, 6, esiti['id_riusato']])
+          and esiti['righe_calde'] == [esiti['prima_prenotazione']])
+    print("OK: archiviazione ripetuta con ID riusati." if ok else "FALLITO")
+    sys.exit(0 if ok else 1)
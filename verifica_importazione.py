@@ -0,0 +1,67 @@
+# File: verifica_importazione.py
+#
+# Verifica dell'import con orari che indicano il fuso: fromisoformat accetta "+01:00" e "Z" e restituiva
+# datetime con fuso, che confrontati con le righe senza fuso interrompevano l'intero import con
+# "TypeError: can't compare offset-naive and offset-aware datetimes".
+# Atteso: gli orari con fuso convertiti in ora locale e importati insieme agli altri, solo la riga rotta
+# riportata come errore.
+#
+# Uso: python verifica_importazione.py
+
+import io
+import os
+import sys
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from core import db as database
+from core.modelli import Prenotazione
+from core.calendario import configurazione_corrente
+from scambio_dati import importa_prenotazioni
+
+SERVIZIO = "Taglio Uomo (30 min)"
+
+
+def esegui_verifica() -> dict:
+    """Importa un CSV con orari con e senza fuso in un DB temporaneo e restituisce rapporto e righe salvate."""
+    cartella = tempfile.mkdtemp(prefix="natillo_import_")
+    database.configura_database(f"sqlite:///{os.path.join(cartella, 'import.db')}")
+    database.init_db()
+    configurazione = configurazione_corrente()
+    barbiere_id = next(iter(configurazione.barbieri))
+    giorno = configurazione.primo_giorno_aperto(date.today() + timedelta(days=7), barbiere_id)
+
+    righe = [
+        "barbiere_id,inizio,servizio,cliente_nome,cliente_telefono",
+        f"{barbiere_id},{giorno}T10:00:00+01:00,{SERVIZIO},Con offset,3330000001",
+        f"{barbiere_id},{giorno}T12:00Z,{SERVIZIO},In UTC,3330000002",
+        f"{barbiere_id},{giorno} 16:00,{SERVIZIO},Senza fuso,3330000003",
+        f"{barbiere_id},non-una-data,{SERVIZIO},Rotta,3330000004",
+    ]
+    esiti = {'rapporto': importa_prenotazioni(io.StringIO("\n".join(righe) + "\n"), 'csv')}
+
+    def locale(testo: str) -> datetime:
+        return datetime.fromisoformat(testo).astimezone().replace(tzinfo=None)
+
+    esiti['attesi'] = {
+        'Con offset': locale(f"{giorno}T10:00:00+01:00"),
+        'In UTC': locale(f"{giorno}T12:00+00:00"),
+        'Senza fuso': datetime.combine(giorno, time(16)),
+    }
+    with database.sessione() as db:
+        esiti['salvate'] = dict(db.execute(select(Prenotazione.cliente_nome, Prenotazione.ora_inizio)).all())
+    return esiti
+
+
+if __name__ == "__main__":
+    esiti = esegui_verifica()
+    print(esiti)
+
+    rapporto = esiti['rapporto']
+    ok = (rapporto['importate'] == 3 and rapporto['scartate'] == 1 and rapporto['errori'][0][0] == 5
+          and esiti['salvate'] == esiti['attesi']
+          and all(inizio.tzinfo is None for inizio in esiti['salvate'].values()))
+    print("OK: orari con fuso convertiti in ora locale, import completato." if ok else "FALLITO")
+    sys.exit(0 if ok else 1)
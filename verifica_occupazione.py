@@ -0,0 +1,151 @@
+# File: verifica_occupazione.py
+#
+# Verifica di equivalenza dei motori di disponibilità: su giorni generati a caso (orari, cadenze, durate e
+# prenotazioni allineati e non ai quanti da 5 minuti, prenotazioni a durata nulla, sovrapposte, contigue o a
+# cavallo della mezzanotte) orari_liberi_bitmap, orari_liberi_modello e disponibilita.orari_liberi devono dare
+# esattamente gli stessi orari del ciclo slot-per-prenotazione originale di get_orari_disponibili.
+# Una durata nulla o negativa deve essere respinta da tutti i motori con ValueError.
+#
+# Uso: python verifica_occupazione.py [numero_giorni] [seme]
+
+import random
+import sys
+from datetime import date, datetime, time, timedelta
+
+from core.disponibilita import orari_liberi
+from core.occupazione import ModelloSlot, maschera_occupata, orari_liberi_bitmap, orari_liberi_modello
+
+
+def orari_liberi_originale(data_selezionata: date, durata_servizio_min: int, prenotazioni_esistenti: list,
+                           orari_apertura, cadenza) -> list:
+    """Il ciclo originale di get_orari_disponibili: ogni slot confrontato con ogni prenotazione."""
+    disponibilita = []
+    durata_servizio = timedelta(minutes=durata_servizio_min)
+
+    for start_time, end_time in orari_apertura:
+        current_time = datetime.combine(data_selezionata, start_time)
+        end_boundary = datetime.combine(data_selezionata, end_time)
+
+        while current_time < end_boundary:
+            fine_prenotazione = current_time + durata_servizio
+            if fine_prenotazione > end_boundary:
+                current_time += cadenza
+                continue
+
+            slot_libero = True
+            for p in prenotazioni_esistenti:
+                if current_time < p['end'] and fine_prenotazione > p['start']:
+                    slot_libero = False
+                    break
+
+            if slot_libero:
+                disponibilita.append(current_time)
+            current_time += cadenza
+
+    return disponibilita
+
+
+def _minuto(caso: random.Random, allineato: bool) -> int:
+    return caso.randrange(0, 60, 5) if allineato else caso.randrange(60)
+
+
+def _giorno_casuale(caso: random.Random) -> tuple:
+    """(giorno, orari_apertura, cadenza, durata_min, prenotazioni come dict start/end)."""
+    giorno = date(2026, 1, 5) + timedelta(days=caso.randrange(365))
+    allineato = caso.random() < 0.7
+
+    # Fasce disgiunte e crescenti (come nella configurazione), a volte non allineate ai quanti
+    orari_apertura, ora = [], caso.randrange(6, 10)
+    for _ in range(caso.randint(1, 3)):
+        inizio = time(ora, _minuto(caso, allineato))
+        ora = min(ora + caso.randint(1, 5), 23)
+        fine = time(ora, _minuto(caso, allineato))
+        if fine > inizio:
+            orari_apertura.append((inizio, fine))
+        ora = min(ora + 1, 23)
+
+    cadenza = timedelta(minutes=caso.choice([5, 10, 15, 20, 30, 45] if allineato else [5, 7, 15, 30]))
+    durata_min = caso.randrange(5, 125, 5) if allineato or caso.random() < 0.5 else caso.randint(1, 120)
+
+    mezzanotte = datetime.combine(giorno, time.min)
+    prenotazioni = []
+    for _ in range(caso.randint(0, 10)):
+        # Da poco prima della mezzanotte precedente a poco dopo quella successiva
+        inizio = mezzanotte + timedelta(minutes=caso.randrange(-120, 1440 + 60, 5 if allineato else 1))
+        durata = caso.choice([0, 5, 15, 30, 45, 60, 90] if allineato else [0, 1, 13, 30, 47])
+        if caso.random() < 0.05:
+            inizio += timedelta(seconds=30)
+        prenotazioni.append({'start': inizio, 'end': inizio + timedelta(minutes=durata)})
+
+    # Prenotazioni contigue: un caso limite per la fusione degli intervalli nello sweep
+    if prenotazioni and caso.random() < 0.3:
+        ultima = prenotazioni[-1]['end']
+        prenotazioni.append({'start': ultima, 'end': ultima + timedelta(minutes=caso.choice([5, 10, 30]))})
+
+    return giorno, orari_apertura, cadenza, durata_min, prenotazioni
+
+
+def _motori(giorno, orari_apertura, cadenza, durata_min, prenotazioni) -> dict:
+    """Orari liberi calcolati da ogni motore, con le prenotazioni come coppie (inizio, fine)."""
+    coppie = [(p['start'], p['end']) for p in prenotazioni]
+    modello = ModelloSlot(orari_apertura, cadenza, durata_min)
+    return {
+        'sweep': orari_liberi(giorno, durata_min, coppie, orari_apertura, cadenza),
+        'bitmap': orari_liberi_bitmap(giorno, durata_min, coppie, orari_apertura, cadenza),
+        'modello': orari_liberi_modello(giorno, modello, coppie),
+        # Come in itera_orari_liberi: bitmap del giorno già costruita (None se non allineata)
+        'modello_occupata': orari_liberi_modello(giorno, modello, coppie, maschera_occupata(giorno, coppie)),
+    }
+
+
+def _durate_non_positive_respinte() -> bool:
+    """Durata nulla o negativa: ogni motore deve sollevare ValueError invece di restituire orari."""
+    giorno = date(2026, 1, 5)
+    fasce, cadenza = [(time(9), time(12))], timedelta(minutes=30)
+    chiamate = [
+        lambda d: orari_liberi(giorno, d, [], fasce, cadenza),
+        lambda d: orari_liberi_bitmap(giorno, d, [], fasce, cadenza),
+        lambda d: ModelloSlot(fasce, cadenza, d),
+    ]
+    for durata_min in (0, -5):
+        for chiamata in chiamate:
+            try:
+                chiamata(durata_min)
+            except ValueError:
+                continue
+            return False
+    return True
+
+
+def esegui_verifica(numero_giorni: int = 20000, seme: int = 0) -> dict:
+    """Confronta i motori con il ciclo originale su `numero_giorni` giorni casuali (riproducibili dal seme)."""
+    caso = random.Random(seme)
+    esiti = {'giorni': 0, 'slot_liberi': 0, 'su_bitmap': 0, 'differenze': []}
+
+    for _ in range(numero_giorni):
+        giorno, orari_apertura, cadenza, durata_min, prenotazioni = _giorno_casuale(caso)
+        atteso = orari_liberi_originale(giorno, durata_min, prenotazioni, orari_apertura, cadenza)
+        esiti['giorni'] += 1
+        esiti['slot_liberi'] += len(atteso)
+        if ModelloSlot(orari_apertura, cadenza, durata_min).fasce is not None:
+            esiti['su_bitmap'] += 1
+
+        for motore, orari in _motori(giorno, orari_apertura, cadenza, durata_min, prenotazioni).items():
+            if orari != atteso and len(esiti['differenze']) < 10:
+                esiti['differenze'].append((motore, giorno, orari_apertura, cadenza, durata_min, prenotazioni))
+
+    esiti['durate_non_positive_respinte'] = _durate_non_positive_respinte()
+    return esiti
+
+
+if __name__ == "__main__":
+    numero_giorni = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seme = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    esiti = esegui_verifica(numero_giorni, seme)
+    for differenza in esiti['differenze']:
+        print("DIFFERENZA:", differenza)
+    print({chiave: valore for chiave, valore in esiti.items() if chiave != 'differenze'})
+
+    ok = not esiti['differenze'] and esiti['durate_non_positive_respinte']
+    print("OK: tutti i motori coincidono con il ciclo originale." if ok else "FALLITO")
+    sys.exit(0 if ok else 1)